@@ -0,0 +1,225 @@
+"""Structured JSON access log with a batching background writer.
+
+``AccessLog.record`` only puts the record dict on a bounded in-memory
+queue. A writer thread serializes records and writes them in batches, so
+a slow disk or a blocked stdout pipe never holds up a request. When the
+queue is full, records are dropped and counted instead.
+
+The destination is ``stdout`` or a file path. Files are rotated at
+``max_bytes``, keeping ``backups`` old files. Every gunicorn worker
+appends to the same file, so rotation happens under a file lock, and a
+worker whose file was rotated by another one reopens it before its next
+batch.
+
+Per-endpoint sampling keeps high-volume routes such as health checks and
+media from flooding the log. Error responses (status >= 400) are always
+logged. Each record carries the ``sample_rate`` it was kept at, so counts
+can be scaled back up.
+"""
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows; rotation is then only safe with one worker
+    fcntl = None
+
+
+def parse_sampling(spec):
+    """Return ``{endpoint: rate}`` for ``endpoint=rate,...``."""
+    rates = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            endpoint, rate = entry.split('=')
+            rates[endpoint.strip()] = float(rate)
+        except ValueError:
+            raise ValueError(f'Invalid access log sampling rule: {entry!r}') from None
+    return rates
+
+
+class _FileDestination:
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+
+    def write(self, data):
+        self._reopen_if_rotated()
+        self.file.write(data)
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _reopen_if_rotated(self):
+        if self.file is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self.file.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            self.file.close()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have rotated while we waited for the lock
+            try:
+                if os.stat(self.path).st_size < self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f'{self.path}.{i}'):
+                    os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+            if self.backups > 0:
+                os.replace(self.path, f'{self.path}.1')
+            else:
+                os.remove(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _StreamDestination:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class AccessLog:
+    def __init__(self, destination='stdout', sampling=None, max_bytes=50 * 1024 * 1024, backups=5,
+                 batch_size=256, flush_interval=0.5, max_queue=10000):
+        self.destination = destination
+        self.sampling = sampling or {}
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+
+    def sample_rate(self, endpoint):
+        return self.sampling.get(endpoint, 1.0)
+
+    def keep(self, endpoint, status):
+        """Whether to log this request; decided before building the record."""
+        rate = self.sample_rate(endpoint)
+        if status >= 400 or rate >= 1.0 or random.random() < rate:
+            return True
+        with self.lock:
+            self.sampled_out += 1
+        return False
+
+    def record(self, entry):
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _ensure_writer(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.max_queue)
+            self.thread = threading.Thread(target=self._run, args=(self.queue,), name='access-log', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _open(self):
+        if self.destination == 'stdout':
+            return _StreamDestination(sys.stdout)
+        if self.destination == 'stderr':
+            return _StreamDestination(sys.stderr)
+        return _FileDestination(self.destination, self.max_bytes, self.backups)
+
+    def _run(self, records):
+        destination = self._open()
+        while True:
+            entry = records.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = records.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._write(destination, batch)
+            if stop:
+                break
+        destination.close()
+
+    def _write(self, destination, batch):
+        data = ''.join(json.dumps(entry, separators=(',', ':'), default=str) + '\n' for entry in batch)
+        try:
+            destination.write(data)
+        except (OSError, ValueError) as e:
+            # Logging must never take the worker down
+            print(f'Access log write failed: {e}', file=sys.stderr)
+            with self.lock:
+                self.dropped += len(batch)
+            return
+        with self.lock:
+            self.written += len(batch)
+            self.batches += 1
+
+    def close(self, timeout=5.0):
+        """Write out queued records and stop the writer."""
+        if self.pid != os.getpid():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.pid = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'destination': self.destination,
+                'written': self.written,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'sampled_out': self.sampled_out,
+                'queued': self.queue.qsize() if self.queue is not None and self.pid == os.getpid() else 0,
+                'sampling': self.sampling,
+            }
@@ -0,0 +1,121 @@
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-accesslog-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'accesslog.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['ACCESS_LOG'] = os.path.join(workdir, 'logs', 'access.log')
+os.environ['ACCESS_LOG_SAMPLING'] = 'health=0,get_music_beats=0'
+
+from access_log import AccessLog  # type: ignore
+
+
+class StalledLog(AccessLog):
+    # A destination that takes a second per batch, like a blocked pipe
+    def _open(self):
+        class Stalled:
+            def write(self, data):
+                time.sleep(1)
+
+            def close(self):
+                pass
+        return Stalled()
+
+
+def write_records(path, worker):
+    log = AccessLog(path, max_bytes=64 * 1024, backups=100, batch_size=50)
+    for i in range(3000):
+        log.record({'worker': worker, 'i': i, 'path': '/api/videos'})
+    log.close(timeout=30)
+
+
+def read_records(path):
+    records = []
+    for name in glob.glob(path + '*'):
+        if name.endswith('.lock'):
+            continue
+        with open(name) as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+if __name__ == '__main__':
+    print("=== ACCESS LOG TEST ===")
+
+    from app import create_app  # type: ignore
+
+    app = create_app()
+    app.extensions['init_database']()
+    client = app.test_client()
+    access_log = app.extensions['access_log']
+
+    response = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'})
+    headers = {'x-access-token': response.json['token']}
+    client.get('/api/videos', headers=headers)
+    for _ in range(20):
+        client.get('/api/health')
+    client.get('/api/music/999/beats', headers=headers)
+    access_log.close()
+    records = read_records(os.environ['ACCESS_LOG'])
+
+    # Test 1: Record fields
+    print("\n1. Testing the access records...")
+    listing = [r for r in records if r['route'] == '/api/videos']
+    fields = {'ts', 'method', 'path', 'route', 'status', 'bytes', 'user_id', 'ip', 'db_statements', 'db_ms',
+              'duration_ms', 'sample_rate'}
+    if listing and fields <= set(listing[0]) and listing[0]['user_id'] == 1 and listing[0]['db_statements'] >= 1:
+        print(f"   ✅ {json.dumps(listing[0])}")
+    else:
+        print(f"   ❌ Records: {records}")
+
+    # Test 2: Sampling
+    print("\n2. Testing sampling...")
+    health = [r for r in records if r['route'] == '/api/health']
+    beats = [r for r in records if r['route'] == '/api/music/<int:music_id>/beats']
+    if not health and len(beats) == 1 and beats[0]['status'] == 404:
+        print("   ✅ Health checks sampled out, the 404 kept despite a 0 rate")
+    else:
+        print(f"   ❌ {len(health)} health records, beats: {beats}")
+
+    # Test 3: A stalled destination never blocks the caller
+    print("\n3. Testing a stalled destination...")
+    stalled = StalledLog('stalled', max_queue=1000)
+    started = time.perf_counter()
+    for i in range(20000):
+        stalled.record({'i': i})
+    elapsed = time.perf_counter() - started
+    if elapsed < 1 and stalled.stats()['dropped'] > 0:
+        print(f"   ✅ 20000 records queued in {elapsed * 1000:.0f}ms, {stalled.stats()['dropped']} dropped")
+    else:
+        print(f"   ❌ {elapsed:.2f}s, {stalled.stats()['dropped']} dropped")
+
+    # Test 4: Rotation shared by several workers
+    print("\n4. Testing rotation across 4 workers...")
+    path = os.path.join(workdir, 'shared', 'access.log')
+    processes = [multiprocessing.Process(target=write_records, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    try:
+        written = read_records(path)
+        files = len(glob.glob(path + '*')) - 1
+        complete = len({(r['worker'], r['i']) for r in written}) == 12000 == len(written)
+    except ValueError:
+        complete, files = False, 0
+    if complete and files > 1:
+        print(f"   ✅ 12000 records intact across {files} files")
+    else:
+        print(f"   ❌ Records incomplete or corrupted ({files} files)")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    print("\n=== TEST COMPLETED ===")
@@ -1,41 +1,218 @@
 import os
+import atexit
 import jwt
 import datetime
 import base64
+import hmac
+import time
+import click
+from concurrent.futures import ProcessPoolExecutor
 from functools import wraps
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, has_request_context, redirect, g
+from media_signing import MediaSigner, InvalidMediaSignature
+from media_cache import MediaCache
+from memory import GROUPINGS as MEMORY_GROUPINGS, MemoryTracer, TracingError
+from metrics import RequestMetrics
+from profiling import MODES as PROFILE_MODES, ProfileSpool, RequestProfile
+from query_stats import DEFAULT_QUERY_BUDGETS, QueryStats, parse_budgets, request_totals
+from catalog_cache import BodyTemplate, CatalogCache, catalog_row, catalog_statement, parse_page, sign_catalog_rows
+from access_log import AccessLog, parse_sampling
+from compression import compress, is_compressible, negotiate
+import idempotency
+from idempotency import IdempotencyStore
+from rate_limit import DEFAULT_RATE_LIMITS, ConcurrencyGate, RateLimiter, client_address, parse_rules
+from serialization import encode as encode_payload, encode_value, negotiate as negotiate_format
+from storage import create_storage
+from database import (
+    ReadYourWrites, RoutingSession, configure_sqlite_engine, create_replica_engines, engine_options,
+    is_sqlite, normalize_database_url, sqlite_settings_from_env
+)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
 def create_app():
-    app = Flask(__name__)
+    # Instance folder for SQLite files, locks and per-host caches (default: api/instance)
+    instance_path = os.environ.get('INSTANCE_PATH')
+    app = Flask(__name__, instance_path=os.path.abspath(instance_path) if instance_path else None)
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
     
-    # Database configuration - handle Render environment properly
-    database_url = os.environ.get('DATABASE_PATH')
-    if not database_url:
-        # Default to SQLite for local development
-        database_url = 'sqlite:///echoplay_api.db'
-    
-    # Ensure the database URL is properly formatted
-    if database_url.startswith('sqlite:///') and ':' not in database_url[10:]:
-        # Handle relative path for SQLite
-        database_url = 'sqlite:///echoplay_api.db'
+    # Database configuration - SQLite by default, PostgreSQL (including
+    # postgres:// URLs from Render/Heroku) when DATABASE_PATH points at one
+    database_url = normalize_database_url(os.environ.get('DATABASE_PATH'))
     
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url, os.environ)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
-    # Configure upload folder
-    UPLOAD_FOLDER = 'uploads'
-    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    # Optional read replicas for read-only endpoints (comma separated URLs)
+    app.config['DATABASE_REPLICA_URLS'] = os.environ.get('DATABASE_REPLICA_URLS', '')
+    app.config['DATABASE_READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('DATABASE_READ_YOUR_WRITES_SECONDS', 5))
+    
+    # Configure media storage. Files are always addressed as /uploads/<name>;
+    # STORAGE_BACKEND picks where the bytes live ('local' or 's3')
+    UPLOAD_URL_PREFIX = '/uploads'
+    # An empty value (UPLOAD_FOLDER= in a .env) counts as unset; it would
+    # otherwise make the working directory, source and .env included, the media root
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER') or os.path.join(app.root_path, 'uploads')
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+    app.config['S3_SERVE_MODE'] = os.environ.get('S3_SERVE_MODE', 'redirect')
+    if app.config['STORAGE_BACKEND'] == 's3':
+        app.config['STORAGE_SETTINGS'] = {
+            'backend': 's3',
+            'bucket': os.environ.get('S3_BUCKET'),
+            'prefix': os.environ.get('S3_PREFIX', ''),
+            'endpoint_url': os.environ.get('S3_ENDPOINT_URL'),
+            'region': os.environ.get('S3_REGION'),
+            'access_key_id': os.environ.get('S3_ACCESS_KEY_ID'),
+            'secret_access_key': os.environ.get('S3_SECRET_ACCESS_KEY'),
+            'multipart_threshold': int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)),
+            'multipart_chunksize': int(os.environ.get('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)),
+            'max_concurrency': int(os.environ.get('S3_MAX_CONCURRENCY', 8)),
+            'presign_ttl': int(os.environ.get('S3_PRESIGN_TTL', 300))
+        }
+    else:
+        app.config['STORAGE_SETTINGS'] = {'backend': 'local', 'root': app.config['UPLOAD_FOLDER']}
+    storage = create_storage(app.config['STORAGE_SETTINGS'])
+    app.extensions['storage'] = storage
+    
+    # In-memory cache for small uploaded files (set MEDIA_CACHE_MAX_BYTES=0 to disable)
+    app.config['MEDIA_CACHE_MAX_BYTES'] = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    app.config['MEDIA_CACHE_MAX_FILE_SIZE'] = int(os.environ.get('MEDIA_CACHE_MAX_FILE_SIZE', 256 * 1024))
+    app.config['MEDIA_CACHE_REVALIDATE_SECONDS'] = float(os.environ.get('MEDIA_CACHE_REVALIDATE_SECONDS', 2.0))
+    media_cache = None
+    if app.config['MEDIA_CACHE_MAX_BYTES'] > 0 and storage.is_local:
+        media_cache = MediaCache(
+            max_bytes=app.config['MEDIA_CACHE_MAX_BYTES'],
+            max_file_size=app.config['MEDIA_CACHE_MAX_FILE_SIZE'],
+            revalidate_seconds=app.config['MEDIA_CACHE_REVALIDATE_SECONDS']
+        )
+    app.extensions['media_cache'] = media_cache
+    
+    # Per-worker snapshots of the video/music listings (CATALOG_CACHE_TTL=0 disables)
+    app.config['CATALOG_CACHE_TTL'] = float(os.environ.get('CATALOG_CACHE_TTL', 300))
+    # Memory for encoded catalog bodies per worker, shared by all users
+    app.config['CATALOG_BODY_CACHE_BYTES'] = int(os.environ.get('CATALOG_BODY_CACHE_BYTES', 32 * 1024 * 1024))
+    # Longest a request waits for another one rebuilding the same listing
+    app.config['CATALOG_SINGLEFLIGHT_TIMEOUT'] = float(os.environ.get('CATALOG_SINGLEFLIGHT_TIMEOUT', 10))
+    catalog_cache = None
+    if app.config['CATALOG_CACHE_TTL'] > 0:
+        catalog_cache = CatalogCache(os.path.join(app.instance_path, 'catalog.version'),
+                                     ttl=app.config['CATALOG_CACHE_TTL'],
+                                     max_body_bytes=app.config['CATALOG_BODY_CACHE_BYTES'],
+                                     spool_dir=os.path.join(app.instance_path, 'catalog-spool'),
+                                     flight_timeout=app.config['CATALOG_SINGLEFLIGHT_TIMEOUT'])
+    app.extensions['catalog_cache'] = catalog_cache
+    
+    # gzip/brotli for JSON responses of at least COMPRESSION_MIN_SIZE bytes
+    app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    
+    # Signed media URLs: catalog responses hand out /media/<token>/... URLs;
+    # when MEDIA_REQUIRE_SIGNED_URLS is set, plain /uploads/... is refused
+    app.config['MEDIA_SIGNING_KEYS'] = os.environ.get('MEDIA_SIGNING_KEYS', '')
+    app.config['MEDIA_URL_TTL'] = int(os.environ.get('MEDIA_URL_TTL', 3600))
+    app.config['MEDIA_REQUIRE_SIGNED_URLS'] = os.environ.get('MEDIA_REQUIRE_SIGNED_URLS', 'false').lower() == 'true'
+    media_signer = MediaSigner.from_config(
+        app.config['MEDIA_SIGNING_KEYS'], app.config['SECRET_KEY'], ttl=app.config['MEDIA_URL_TTL']
+    )
+    app.extensions['media_signer'] = media_signer
+    
+    # Structured JSON access log written in batches by a background thread:
+    # 'stdout', 'stderr', a file path (rotated at ACCESS_LOG_MAX_BYTES) or
+    # 'off'; gunicorn.conf.py defaults it to stdout. ACCESS_LOG_SAMPLING keeps
+    # a fraction of successful requests to busy endpoints
+    app.config['ACCESS_LOG'] = os.environ.get('ACCESS_LOG') or 'off'
+    app.config['ACCESS_LOG_SAMPLING'] = os.environ.get('ACCESS_LOG_SAMPLING', 'health=0.01,uploaded_file=0.1')
+    app.config['ACCESS_LOG_MAX_BYTES'] = int(os.environ.get('ACCESS_LOG_MAX_BYTES', 50 * 1024 * 1024))
+    app.config['ACCESS_LOG_BACKUPS'] = int(os.environ.get('ACCESS_LOG_BACKUPS', 5))
+    access_log = None
+    if app.config['ACCESS_LOG'] != 'off':
+        access_log = AccessLog(app.config['ACCESS_LOG'], parse_sampling(app.config['ACCESS_LOG_SAMPLING']),
+                               max_bytes=app.config['ACCESS_LOG_MAX_BYTES'], backups=app.config['ACCESS_LOG_BACKUPS'])
+        atexit.register(access_log.close)
+    app.extensions['access_log'] = access_log
+    
+    # Prometheus request metrics at /metrics, merged across gunicorn workers
+    # through PROMETHEUS_MULTIPROC_DIR (see metrics.py)
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token for scrapers; admins can also read /metrics with their JWT
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+    request_metrics = RequestMetrics() if app.config['METRICS_ENABLED'] else None
+    app.extensions['metrics'] = request_metrics
+    
+    # Admins can profile a single request by sending X-Profile: sample or
+    # X-Profile: cprofile; captures are kept in instance/profiles
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', 'true').lower() == 'true'
+    app.config['PROFILE_SAMPLE_INTERVAL_MS'] = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1))
+    app.config['PROFILE_MAX_CAPTURES'] = int(os.environ.get('PROFILE_MAX_CAPTURES', 50))
+    # An empty value counts as unset rather than spooling into the working directory
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+    profile_spool = ProfileSpool(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_CAPTURES'])
+    
+    # tracemalloc snapshots through /api/admin/memory, and peak allocation of
+    # a MEMORY_SAMPLE_RATE fraction of requests per route (0 disables)
+    app.config['MEMORY_SAMPLE_RATE'] = float(os.environ.get('MEMORY_SAMPLE_RATE', 0))
+    memory_tracer = MemoryTracer(sample_rate=app.config['MEMORY_SAMPLE_RATE'])
+    app.extensions['memory_tracer'] = memory_tracer
+    
+    # Per-request SQL statement counts and time: a Server-Timing header in
+    # debug mode (or with SQL_SERVER_TIMING), a log of statements slower than
+    # SLOW_QUERY_MS with their query plan (0 disables), and per-endpoint
+    # statement budgets that fail the request under QUERY_BUDGET_STRICT
+    app.config['SQL_SERVER_TIMING'] = os.environ.get('SQL_SERVER_TIMING', 'false').lower() == 'true'
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+    # An empty value keeps the defaults; budgets are only dropped with QUERY_BUDGETS=off
+    app.config['QUERY_BUDGETS'] = os.environ.get('QUERY_BUDGETS') or DEFAULT_QUERY_BUDGETS
+    app.config['QUERY_BUDGET_STRICT'] = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+    query_stats = QueryStats(app.logger, slow_ms=app.config['SLOW_QUERY_MS'],
+                             budgets=parse_budgets(app.config['QUERY_BUDGETS']))
+    app.extensions['query_stats'] = query_stats
+    
+    # Token-bucket limits per route and client, shared by all workers through
+    # instance/ratelimit.db (rule syntax in rate_limit.py)
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['RATE_LIMITS'] = os.environ.get('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+    app.config['RATE_LIMIT_STORE'] = os.environ.get('RATE_LIMIT_STORE', os.path.join(app.instance_path, 'ratelimit.db'))
+    # Number of our own proxies appending to X-Forwarded-For (1 on Render)
+    app.config['TRUSTED_PROXY_COUNT'] = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+    rate_limiter = None
+    if app.config['RATE_LIMIT_ENABLED']:
+        rate_limiter = RateLimiter(app.config['RATE_LIMIT_STORE'], parse_rules(app.config['RATE_LIMITS']))
+    app.extensions['rate_limiter'] = rate_limiter
+    
+    # API requests handled at once across all workers; beyond that new ones
+    # get a 503 instead of queuing (0 disables). gunicorn.conf.py sets it to
+    # workers × threads; 64 is for servers that do not
+    app.config['MAX_CONCURRENT_REQUESTS'] = int(os.environ.get('MAX_CONCURRENT_REQUESTS') or 64)
+    concurrency_gate = None
+    if app.config['MAX_CONCURRENT_REQUESTS'] > 0:
+        concurrency_gate = ConcurrencyGate(os.path.join(app.instance_path, 'concurrency.lock'),
+                                           app.config['MAX_CONCURRENT_REQUESTS'])
+    app.extensions['concurrency_gate'] = concurrency_gate
+    
+    # Responses to POSTs with an Idempotency-Key header are kept for
+    # IDEMPOTENCY_TTL seconds in instance/idempotency.db and replayed to
+    # retries; a claim left by a crashed worker lapses after
+    # IDEMPOTENCY_LOCK_SECONDS
+    app.config['IDEMPOTENCY_ENABLED'] = os.environ.get('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+    app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+    app.config['IDEMPOTENCY_LOCK_SECONDS'] = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+    app.config['IDEMPOTENCY_STORE'] = os.environ.get('IDEMPOTENCY_STORE', os.path.join(app.instance_path, 'idempotency.db'))
+    idempotency_store = None
+    if app.config['IDEMPOTENCY_ENABLED']:
+        idempotency_store = IdempotencyStore(app.config['IDEMPOTENCY_STORE'], ttl=app.config['IDEMPOTENCY_TTL'],
+                                             lock_seconds=app.config['IDEMPOTENCY_LOCK_SECONDS'])
+    app.extensions['idempotency_store'] = idempotency_store
     
-    # Create upload folder if it doesn't exist
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    # Optional ffmpeg probing/HLS packaging of uploaded videos
+    app.config['VIDEO_PROCESSING_ENABLED'] = os.environ.get('VIDEO_PROCESSING_ENABLED', 'false').lower() == 'true'
+    app.config['VIDEO_PROCESSING_WORKERS'] = int(os.environ.get('VIDEO_PROCESSING_WORKERS', 1))
+    app.config['VIDEO_PROCESSING_MAX_PENDING'] = int(os.environ.get('VIDEO_PROCESSING_MAX_PENDING', 8))
     
     # Allowed file extensions
     ALLOWED_EXTENSIONS = {
@@ -56,10 +233,22 @@ def create_app():
         return extension in ALLOWED_EXTENSIONS
     
     # Initialize CORS with environment variable or default
-    CORS(app, origins=os.environ.get("CORS_ORIGINS", "*").split(","))
+    CORS(app, origins=os.environ.get("CORS_ORIGINS", "*").split(","), expose_headers=['X-Next-After', idempotency.REPLAYED_HEADER, ReadYourWrites.HEADER])
     
     # Initialize database
-    db = SQLAlchemy(app)
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    app.extensions['db_replicas'] = create_replica_engines(app.config['DATABASE_REPLICA_URLS'], os.environ,
+                                                           app.instance_path)
+    read_your_writes = ReadYourWrites(app.config['DATABASE_READ_YOUR_WRITES_SECONDS'])
+    
+    # Apply the WAL/pragma profile before the first connection is opened
+    if is_sqlite(database_url):
+        with app.app_context():
+            configure_sqlite_engine(db.engine, sqlite_settings_from_env(os.environ))
+    with app.app_context():
+        query_stats.install(db.engine)
+    for engine in app.extensions['db_replicas']:
+        query_stats.install(engine)
     
     # Models
     class User(db.Model):
@@ -85,7 +274,7 @@ def create_app():
                 'id': self.id,
                 'email': self.email,
                 'name': self.name,
-                'profile_image': self.profile_image,
+                'profile_image': sign_media_url(self.profile_image, self.id),
                 'created_at': self.created_at.isoformat(),
                 'is_admin': self.is_admin
             }
@@ -99,6 +288,16 @@ def create_app():
         thumbnail = db.Column(db.String(500), nullable=True)
         uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
         created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+        # Media probe and HLS packaging results (see video_processing.py)
+        duration = db.Column(db.Float, nullable=True)
+        width = db.Column(db.Integer, nullable=True)
+        height = db.Column(db.Integer, nullable=True)
+        hls_url = db.Column(db.String(500), nullable=True)
+        processing_status = db.Column(db.String(20), nullable=True)
+        processing_progress = db.Column(db.Integer, nullable=True)
+        processing_error = db.Column(db.Text, nullable=True)
+        # Last status or progress change; stale in-progress rows are re-queued
+        processing_updated_at = db.Column(db.DateTime, nullable=True)
 
     class Music(db.Model):
         __tablename__ = 'music'
@@ -108,24 +307,254 @@ def create_app():
         url = db.Column(db.String(500), nullable=False)
         uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
         created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+        # Audio analysis results (filled in by `flask analyze-music`)
+        bpm = db.Column(db.Float, nullable=True)
+        beat_grid = db.Column(db.Text, nullable=True)
+        analyzed_at = db.Column(db.DateTime, nullable=True)
 
-    # Initialize database
-    with app.app_context():
-        db.create_all()
-        
-        # Create default admin user if not exists
-        admin_user = User.query.filter_by(email='admin@gmail.com').first()
-        if not admin_user:
-            admin_user = User()
-            admin_user.email = 'admin@gmail.com'
-            admin_user.name = 'Admin User'
-            admin_user.is_admin = True
-            admin_user.set_password('Luc14c4$tr0')
-            db.session.add(admin_user)
+    # Catalog snapshots
+    @event.listens_for(db.session, 'after_flush')
+    def track_catalog_changes(session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Video, Music)):
+                session.info['catalog_changed'] = True
+                break
+
+    @event.listens_for(db.session, 'after_commit')
+    def publish_catalog_changes(session):
+        if session.info.pop('catalog_changed', False) and catalog_cache is not None:
+            catalog_cache.bump()
+
+    @event.listens_for(db.session, 'after_rollback')
+    def discard_catalog_changes(session):
+        session.info.pop('catalog_changed', None)
+
+    def load_catalog_rows(name):
+        # One joined query instead of a lazy uploader load per row
+        return [catalog_row(row) for row in db.session.execute(catalog_statement(db.metadata, name))]
+
+    def get_catalog_rows(name):
+        # Requests routed to a lagging replica bypass the snapshot, which is
+        # invalidated by writes to the primary
+        on_replica = app.extensions['db_replicas'] and g.get('db_read_only') and not g.get('db_use_primary')
+        if catalog_cache is None or on_replica:
+            return load_catalog_rows(name)
+        return catalog_cache.get(name, lambda: load_catalog_rows(name))
+
+    def warm_state():
+        # Build read-only state once in the gunicorn master (preload_app) so
+        # forked workers share it copy-on-write instead of each rebuilding it
+        if catalog_cache is not None:
+            with app.app_context():
+                for name in ('videos', 'music'):
+                    catalog_cache.get(name, lambda: load_catalog_rows(name))
+        dispose_engines()
+
+    def dispose_engines(close=True):
+        # Connections must never be shared across a fork; close=False lets a
+        # child drop the pool it inherited without closing the parent's sockets
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=close)
+        for engine in app.extensions['db_replicas']:
+            engine.dispose(close=close)
+
+    def api_response(payload, status=200):
+        # JSON unless the client asks for MessagePack (see serialization.py)
+        mimetype, columnar = negotiate_format(request)
+        response = app.response_class(encode_payload(payload, mimetype, columnar, app.json),
+                                      status=status, mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
+
+    def catalog_body(name, rows, user_id, host, mimetype, columnar, accept_encodings, cached=True):
+        """Encoded listing for one user: ``(data, Content-Encoding or None)``.
+
+        Runs without a request context, so the ASGI listing can call it in
+        a thread. ``cached=False`` is for rows that are not the snapshot.
+        """
+        def sign(url, directory):
+            return media_signer.sign_url(url, user_id, directory=directory, host=host)
+
+        def encode(payload):
+            return encode_payload(payload, mimetype, columnar, app.json)
+
+        def encoding_for(size):
+            if app.config['COMPRESSION_ENABLED'] and size >= app.config['COMPRESSION_MIN_SIZE']:
+                return negotiate(accept_encodings)
+            return None
+
+        template = None
+        if catalog_cache is not None and cached:
+            # The rows encoded once per format, with gaps for the signed URLs
+            template = catalog_cache.body(
+                name, rows, (mimetype, columnar),
+                lambda: BodyTemplate.build(name, rows, encode,
+                                           lambda value: encode_value(value, mimetype, app.json)))
+        if template is None:
+            data = encode(sign_catalog_rows(name, rows, sign))
+            encoding = encoding_for(len(data))
+            return (compress(data, encoding) if encoding else data), encoding
+
+        # A user's signed URLs only change when the expiry bucket rolls
+        # over, so their listing is reused until then, in the one encoding
+        # they asked for
+        encoding = encoding_for(len(template))
+
+        def render():
+            data = template.render(sign)
+            return compress(data, encoding) if encoding else data
+
+        variant = (user_id, host, media_signer.expiry(), mimetype, columnar, encoding)
+        return catalog_cache.body(name, rows, variant, render), encoding
+
+    def catalog_response(name, user_id, page=None):
+        if page is not None:
+            # Keyset pages are cheap at any depth and are not cached
+            rows = [catalog_row(row) for row in db.session.execute(catalog_statement(db.metadata, name, page))]
+        else:
+            rows = get_catalog_rows(name)
+        mimetype, columnar = negotiate_format(request)
+        data, encoding = catalog_body(name, rows, user_id, request.host, mimetype, columnar,
+                                      request.accept_encodings, cached=page is None)
+        response = app.response_class(data, mimetype=mimetype)
+        response.vary.add('Accept')
+        if app.config['COMPRESSION_ENABLED']:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if page is not None and len(rows) == page[1]:
+            response.headers['X-Next-After'] = str(rows[-1]['id'])
+        return response
+
+    app.extensions['warm_state'] = warm_state
+    app.extensions['catalog_body'] = catalog_body
+    app.extensions['dispose_engines'] = dispose_engines
+
+    def sign_media_url(url, user_id, directory=False):
+        host = request.host if has_request_context() else None
+        return media_signer.sign_url(url, user_id, directory=directory, host=host)
+
+    def save_upload(filename, data, content_type=None):
+        # Every write to storage goes through here so cached copies are dropped
+        storage.save(filename, data, content_type=content_type)
+        if media_cache is not None:
+            filepath = storage.path(filename)
+            if filepath:
+                media_cache.invalidate(filepath)
+        return f"{UPLOAD_URL_PREFIX}/{filename}"
+
+    def resolve_upload_name(url):
+        # Map a media URL pointing at our /uploads route to its storage name
+        if not url or f"{UPLOAD_URL_PREFIX}/" not in url:
+            return None
+        filename = url.split(f"{UPLOAD_URL_PREFIX}/", 1)[1].split('?', 1)[0]
+        if not storage.exists(filename):
+            return None
+        return filename
+
+    # Video processing
+    def update_video_processing(video_id, **fields):
+        # Called from processing threads, which have no app context
+        fields['processing_updated_at'] = datetime.datetime.utcnow()
+        with app.app_context():
+            Video.query.filter_by(id=video_id).update(fields)
+            db.session.commit()
+        # Bulk updates bypass the session's change tracking; progress ticks
+        # are not part of the listing
+        if catalog_cache is not None and set(fields) - {'processing_progress'}:
+            catalog_cache.bump()
+
+    def get_video_processor(workers=None):
+        from video_processing import VideoProcessor
+
+        if workers is not None:
+            return VideoProcessor(update_video_processing, storage, workers=workers, max_pending=workers)
+        
+        # The shared processor is created on first use so importing the app
+        # never starts threads
+        if 'video_processor' not in app.extensions:
+            app.extensions['video_processor'] = VideoProcessor(
+                update_video_processing,
+                storage,
+                workers=app.config['VIDEO_PROCESSING_WORKERS'],
+                max_pending=app.config['VIDEO_PROCESSING_MAX_PENDING']
+            )
+        return app.extensions['video_processor']
+
+    def queue_video_processing(video, processor=None, block=False):
+        source_name = resolve_upload_name(video.url)
+        if not source_name:
+            video.processing_status = 'skipped'
             db.session.commit()
-            print("Admin user created successfully!")
+            return False
+        
+        output_prefix = f"hls/{video.id}"
+        output_url = f"{UPLOAD_URL_PREFIX}/{output_prefix}/master.m3u8"
+        video.processing_status = 'pending'
+        video.processing_progress = 0
+        video.processing_updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+        processor = processor or get_video_processor()
+        return processor.submit(video.id, source_name, output_prefix, output_url, block=block)
+
+    # Database initialization. Nothing here runs while the app is built, so
+    # importing the app or booting a worker does no database I/O; run
+    # `flask init-db` once per deployment (or set INIT_DB_ON_START=true).
+    def init_database():
+        with app.app_context():
+            db.create_all()
+            
+            # Create default admin user if not exists
+            admin_user = User.query.filter_by(email='admin@gmail.com').first()
+            if not admin_user:
+                admin_user = User()
+                admin_user.email = 'admin@gmail.com'
+                admin_user.name = 'Admin User'
+                admin_user.is_admin = True
+                admin_user.set_password('Luc14c4$tr0')
+                db.session.add(admin_user)
+                db.session.commit()
+                print("Admin user created successfully!")
+
+    def init_database_once():
+        # Serialize concurrent starters (e.g. several workers) on a lock file
+        # so only one creates the schema and the admin user at a time
+        os.makedirs(app.instance_path, exist_ok=True)
+        with open(os.path.join(app.instance_path, 'init-db.lock'), 'w') as lock_file:
+            try:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except ImportError:
+                # No fcntl on Windows; development there runs a single process
+                pass
+            init_database()
+
+    app.extensions['init_database'] = init_database_once
+    if os.environ.get('INIT_DB_ON_START', 'false').lower() == 'true':
+        init_database_once()
 
     # Decorators
+    def read_only(f):
+        # Lets RoutingSession serve this view from a replica, unless the
+        # caller wrote recently and must read their own writes
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if app.extensions['db_replicas']:
+                g.db_read_only = True
+                user_id = None
+                try:
+                    token = request.headers.get('x-access-token')
+                    if token:
+                        user_id = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256']).get('user_id')
+                except jwt.InvalidTokenError:
+                    pass
+                g.db_use_primary = read_your_writes.is_sticky(user_id, request.headers, request.cookies)
+            return f(*args, **kwargs)
+        
+        return decorated
+
     def token_required(f):
         @wraps(f)
         def decorated(*args, **kwargs):
@@ -141,6 +570,7 @@ def create_app():
                 current_user = User.query.filter_by(id=data['user_id']).first()
                 if not current_user:
                     return jsonify({'message': 'Token is invalid!'}), 401
+                g.current_user_id = current_user.id
             except jwt.ExpiredSignatureError:
                 return jsonify({'message': 'Token has expired!'}), 401
             except jwt.InvalidTokenError:
@@ -152,32 +582,292 @@ def create_app():
         
         return decorated
 
+    def check_admin():
+        # (admin user, None) for a valid admin token, else (None, error response)
+        token = None
+        if 'x-access-token' in request.headers:
+            token = request.headers['x-access-token']
+        
+        if not token:
+            return None, (jsonify({'message': 'Token is missing!'}), 401)
+        
+        try:
+            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            current_user = User.query.filter_by(id=data['user_id']).first()
+            if not current_user or not current_user.is_admin:
+                return None, (jsonify({'message': 'Admin access required!'}), 403)
+            g.current_user_id = current_user.id
+        except jwt.ExpiredSignatureError:
+            return None, (jsonify({'message': 'Token has expired!'}), 401)
+        except jwt.InvalidTokenError:
+            return None, (jsonify({'message': 'Token is invalid!'}), 401)
+        except Exception:
+            return None, (jsonify({'message': 'Token is invalid!'}), 401)
+        
+        return current_user, None
+
     def admin_required(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = None
-            if 'x-access-token' in request.headers:
-                token = request.headers['x-access-token']
+            current_user, error = check_admin()
+            if error:
+                return error
+            return f(current_user, *args, **kwargs)
+        
+        return decorated
+
+    def issue_token(user_id):
+        return jwt.encode({
+            'user_id': user_id,
+            'exp': datetime.datetime.utcnow() + datetime.timedelta(days=30)
+        }, app.config['SECRET_KEY'], algorithm='HS256')
+
+    def idempotent(f=None, reissue_token=False):
+        # Replays the stored response to a retry with the same Idempotency-Key.
+        # Goes below the auth decorators so rejected requests are not stored.
+        # With reissue_token the JWT in a JSON response ({'token', 'user'}) is
+        # left out of the store, and a replay gets a new one for that user.
+        if f is None:
+            return lambda f: idempotent(f, reissue_token=reissue_token)
+
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get(idempotency.HEADER)
+            if idempotency_store is None or key is None:
+                return f(*args, **kwargs)
+            if not idempotency.valid_key(key):
+                return jsonify({'message': f'{idempotency.HEADER} must be 1 to {idempotency.MAX_KEY_LENGTH} '
+                                           'printable characters'}), 400
             
-            if not token:
-                return jsonify({'message': 'Token is missing!'}), 401
+            scope = f'{request_identity() or "anonymous"}:{request.endpoint}'
+            fingerprint = idempotency.digest(request.method, request.path, request.get_data())
+            outcome, detail = idempotency_store.begin(scope, key, fingerprint)
+            if outcome == idempotency.REPLAY:
+                status, mimetype, headers, body = detail
+                if reissue_token and status < 300 and mimetype == 'application/json':
+                    payload = app.json.loads(body)
+                    payload['token'] = issue_token(payload['user']['id'])
+                    body = app.json.response(payload).get_data()
+                response = app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+                response.headers[idempotency.REPLAYED_HEADER] = 'true'
+                # The write happened; the client should read it from the
+                # primary as it would after the original response
+                if status < 300:
+                    g.db_wrote = True
+                return response
+            if outcome == idempotency.IN_FLIGHT:
+                return (jsonify({'message': 'A request with this Idempotency-Key is still in progress'}), 409,
+                        {'Retry-After': str(detail)})
+            if outcome == idempotency.MISMATCH:
+                return jsonify({'message': 'This Idempotency-Key was already used for a different request'}), 422
+            if outcome == idempotency.UNAVAILABLE:
+                return f(*args, **kwargs)
             
             try:
-                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-                current_user = User.query.filter_by(id=data['user_id']).first()
-                if not current_user or not current_user.is_admin:
-                    return jsonify({'message': 'Admin access required!'}), 403
-            except jwt.ExpiredSignatureError:
-                return jsonify({'message': 'Token has expired!'}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'message': 'Token is invalid!'}), 401
-            except Exception:
-                return jsonify({'message': 'Token is invalid!'}), 401
-            
-            return f(current_user, *args, **kwargs)
+                response = app.make_response(f(*args, **kwargs))
+            except BaseException:
+                idempotency_store.release(scope, key)
+                raise
+            # Server errors are not replayed: the retry gets another chance
+            if response.status_code >= 500:
+                idempotency_store.release(scope, key)
+            else:
+                body = response.get_data()
+                if reissue_token and response.status_code < 300 and response.is_json:
+                    payload = response.get_json()
+                    payload.pop('token', None)
+                    body = app.json.response(payload).get_data()
+                idempotency_store.finish(scope, key, response.status_code, response.mimetype,
+                                         list(response.headers.items()), body)
+            return response
         
         return decorated
 
+    # Registered first so request timings cover the other hooks, including
+    # requests they reject
+    @app.before_request
+    def mark_request_start():
+        g.request_started = time.perf_counter()
+
+    if access_log is not None:
+        # Runs after every other after_request hook, so it logs the final status
+        @app.after_request
+        def write_access_log(response):
+            if not access_log.keep(request.endpoint, response.status_code):
+                return response
+            
+            statements, seconds = request_totals()
+            access_log.record({
+                'ts': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+                'method': request.method,
+                'path': request.path,
+                'route': request.url_rule.rule if request.url_rule is not None else None,
+                'status': response.status_code,
+                'bytes': response.content_length,
+                'user_id': g.get('current_user_id'),
+                'ip': client_address(request, app.config['TRUSTED_PROXY_COUNT']),
+                'db_statements': statements,
+                'db_ms': round(seconds * 1000, 2),
+                'duration_ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 2),
+                'sample_rate': access_log.sample_rate(request.endpoint),
+            })
+            return response
+
+    if request_metrics is not None:
+        @app.before_request
+        def start_request_metrics():
+            g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_metrics.started(request.method, g.metrics_route)
+
+        @app.after_request
+        def record_request_metrics(response):
+            if 'metrics_route' in g:
+                request_metrics.finished(request.method, g.metrics_route, response.status_code,
+                                         time.perf_counter() - g.request_started)
+            return response
+
+        @app.teardown_request
+        def end_request_metrics(error=None):
+            route = g.pop('metrics_route', None)
+            if route is not None:
+                request_metrics.ended(request.method, route)
+
+    if app.config['PROFILING_ENABLED']:
+        # Profiles are started by start_profile, registered after admit_request
+        @app.after_request
+        def save_profile(response):
+            profile = g.pop('profile', None)
+            if profile is None:
+                return response
+            
+            profile.stop()
+            response.headers['X-Profile-Id'] = profile_spool.save(profile, {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'user_id': g.get('current_user_id'),
+            })
+            return response
+
+        @app.teardown_request
+        def stop_profile(error=None):
+            # The response failed before save_profile ran
+            profile = g.pop('profile', None)
+            if profile is not None:
+                profile.stop()
+
+    if app.config['MEMORY_SAMPLE_RATE'] > 0:
+        @app.before_request
+        def start_memory_sample():
+            g.memory_sampled = memory_tracer.sample_begin()
+
+        @app.teardown_request
+        def end_memory_sample(error=None):
+            if g.pop('memory_sampled', False):
+                route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                peak = memory_tracer.sample_end(route)
+                if peak is not None and request_metrics is not None:
+                    request_metrics.allocated(request.method, route, peak)
+
+    @app.after_request
+    def report_query_stats(response):
+        statements, seconds = request_totals()
+        if app.debug or app.config['SQL_SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'db;dur={seconds * 1000:.2f};desc="{statements} queries"')
+        
+        budget = query_stats.over_budget(request.endpoint, statements)
+        if budget is not None:
+            message = f'{request.endpoint} ran {statements} SQL statements (budget {budget})'
+            app.logger.warning('Query budget exceeded: %s', message)
+            if app.config['QUERY_BUDGET_STRICT']:
+                return app.make_response((jsonify({'message': f'Query budget exceeded: {message}'}), 500))
+        return response
+
+    def request_identity():
+        # The authenticated user, or the account an anonymous request names
+        token = request.headers.get('x-access-token')
+        if token:
+            try:
+                return 'user:%s' % jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])['user_id']
+            except (jwt.InvalidTokenError, KeyError):
+                pass
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('email'), str):
+            return 'email:' + data['email'].strip().lower()
+        return None
+
+    @app.before_request
+    def admit_request():
+        # Media streams are long-lived and cheap per byte; they are not gated
+        if request.method == 'OPTIONS' or request.path.startswith((f"{UPLOAD_URL_PREFIX}/", '/media/')):
+            return None
+        
+        if concurrency_gate is not None:
+            slot = concurrency_gate.acquire()
+            if slot is None:
+                return jsonify({'message': 'Server is busy, please retry shortly'}), 503, {'Retry-After': '1'}
+            g.concurrency_slot = slot
+        
+        if rate_limiter is not None:
+            scopes = rate_limiter.scopes(request.endpoint)
+            clients = {
+                'ip': client_address(request, app.config['TRUSTED_PROXY_COUNT']) if 'ip' in scopes else None,
+                'identity': request_identity() if 'identity' in scopes else None,
+            }
+            retry_after = rate_limiter.hit(request.endpoint, clients)
+            if retry_after:
+                return jsonify({'message': 'Too many requests, please slow down'}), 429, {'Retry-After': str(retry_after)}
+        return None
+
+    if concurrency_gate is not None:
+        @app.teardown_request
+        def release_request(error=None):
+            slot = g.pop('concurrency_slot', None)
+            if slot is not None:
+                concurrency_gate.release(slot)
+
+    if app.config['PROFILING_ENABLED']:
+        # After admission, so the admin lookup runs only for requests the
+        # rate limiter and concurrency gate let through
+        @app.before_request
+        def start_profile():
+            mode = request.headers.get('X-Profile')
+            if mode is None:
+                return None
+            if mode not in PROFILE_MODES:
+                return jsonify({'message': f"X-Profile must be one of: {', '.join(PROFILE_MODES)}"}), 400
+            
+            current_user, error = check_admin()
+            if error:
+                return error
+            g.profile = RequestProfile(mode, app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000)
+            g.profile.start()
+            return None
+
+    if app.extensions['db_replicas']:
+        @app.after_request
+        def remember_writer(response):
+            # Start the read-your-writes window after a successful write
+            if g.get('db_wrote') and response.status_code < 400:
+                read_your_writes.mark(g.get('current_user_id'), response)
+            return response
+
+    @app.after_request
+    def compress_response(response):
+        # Media is served as stored (and mostly already compressed)
+        if not app.config['COMPRESSION_ENABLED'] or request.path.startswith((f"{UPLOAD_URL_PREFIX}/", '/media/')):
+            return response
+        if not is_compressible(response, app.config['COMPRESSION_MIN_SIZE']):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding:
+            response.set_data(compress(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
     # Routes
     @app.route('/')
     def index():
@@ -200,19 +890,15 @@ def create_app():
         user = User.query.filter_by(email=data['email']).first()
         
         if user and user.check_password(data['password']):
-            token = jwt.encode({
-                'user_id': user.id,
-                'exp': datetime.datetime.utcnow() + datetime.timedelta(days=30)
-            }, app.config['SECRET_KEY'], algorithm='HS256')
-            
             return jsonify({
-                'token': token,
+                'token': issue_token(user.id),
                 'user': user.to_dict()
             }), 200
         else:
             return jsonify({'message': 'Invalid credentials'}), 401
 
     @app.route('/api/register', methods=['POST'])
+    @idempotent(reissue_token=True)
     def register():
         data = request.get_json()
         
@@ -232,21 +918,18 @@ def create_app():
         
         db.session.add(user)
         db.session.commit()
-        
-        token = jwt.encode({
-            'user_id': user.id,
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(days=30)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        g.current_user_id = user.id
         
         return jsonify({
-            'token': token,
+            'token': issue_token(user.id),
             'user': user.to_dict()
         }), 201
 
     @app.route('/api/user/profile', methods=['GET'])
+    @read_only
     @token_required
     def get_profile(current_user):
-        return jsonify(current_user.to_dict()), 200
+        return api_response(current_user.to_dict())
 
     @app.route('/api/user/profile', methods=['PUT'])
     @token_required
@@ -265,7 +948,7 @@ def create_app():
         
         db.session.commit()
         
-        return jsonify(current_user.to_dict()), 200
+        return api_response(current_user.to_dict())
 
     @app.route('/api/user/profile-image', methods=['POST'])
     @token_required
@@ -290,14 +973,9 @@ def create_app():
                     
                     # Generate filename
                     filename = f"profile_{current_user.id}.jpg"
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    
-                    # Save file
-                    with open(filepath, 'wb') as f:
-                        f.write(image_binary)
                     
-                    # Update user profile image
-                    current_user.profile_image = f"/{UPLOAD_FOLDER}/{filename}"
+                    # Save file and update user profile image
+                    current_user.profile_image = save_upload(filename, image_binary, 'image/jpeg')
                     db.session.commit()
                     
                     return jsonify({
@@ -322,11 +1000,9 @@ def create_app():
                     file_extension = file.filename.rsplit('.', 1)[1].lower()
                 
                 filename = secure_filename(f"profile_{current_user.id}.{file_extension}")
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
                 
-                # Update user profile image
-                current_user.profile_image = f"/{UPLOAD_FOLDER}/{filename}"
+                # Save file and update user profile image
+                current_user.profile_image = save_upload(filename, file.stream, file.mimetype)
                 db.session.commit()
                 
                 return jsonify({
@@ -340,6 +1016,7 @@ def create_app():
 
     @app.route('/api/music', methods=['POST'])
     @admin_required
+    @idempotent
     def add_music(current_user):
         try:
             data = request.get_json()
@@ -371,6 +1048,7 @@ def create_app():
 
     @app.route('/api/videos', methods=['POST'])
     @admin_required
+    @idempotent
     def add_video(current_user):
         try:
             data = request.get_json()
@@ -388,6 +1066,13 @@ def create_app():
             db.session.add(video)
             db.session.commit()
             
+            if app.config['VIDEO_PROCESSING_ENABLED']:
+                from video_processing import ffmpeg_available
+
+                if ffmpeg_available():
+                    # Left 'pending' for `flask process-videos` if the pool is full
+                    queue_video_processing(video)
+            
             return jsonify({
                 'message': 'Video added successfully',
                 'video': {
@@ -396,54 +1081,82 @@ def create_app():
                     'description': video.description,
                     'url': video.url,
                     'thumbnail': video.thumbnail,
-                    'created_at': video.created_at.isoformat()
+                    'created_at': video.created_at.isoformat(),
+                    'processing_status': video.processing_status
                 }
             }), 201
         except Exception as e:
             return jsonify({'message': f'Error adding video: {str(e)}'}), 500
 
     @app.route('/api/videos', methods=['GET'])
+    @read_only
     @token_required
     def get_videos(current_user):
         try:
-            videos = Video.query.all()
-            video_list = []
-            
-            for video in videos:
-                video_list.append({
-                    'id': video.id,
-                    'title': video.title,
-                    'description': video.description,
-                    'url': video.url,
-                    'thumbnail': video.thumbnail,
-                    'uploaded_by': video.user.email if video.user else 'Unknown',
-                    'created_at': video.created_at.isoformat()
-                })
-            
-            return jsonify(video_list), 200
+            page = parse_page(request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        try:
+            return catalog_response('videos', current_user.id, page), 200
         except Exception as e:
             return jsonify({'message': f'Error retrieving videos: {str(e)}'}), 500
 
+    @app.route('/api/videos/<int:video_id>/processing', methods=['GET'])
+    @token_required
+    def get_video_processing(current_user, video_id):
+        video = Video.query.get(video_id)
+        if not video:
+            return jsonify({'message': 'Video not found'}), 404
+        
+        return api_response({
+            'id': video.id,
+            'status': video.processing_status,
+            'progress': video.processing_progress,
+            'error': video.processing_error,
+            'duration': video.duration,
+            'width': video.width,
+            'height': video.height,
+            'hls_url': sign_media_url(video.hls_url, current_user.id, directory=True)
+        })
+
     @app.route('/api/music', methods=['GET'])
+    @read_only
     @token_required
     def get_music(current_user):
         try:
-            musics = Music.query.all()
-            music_list = []
+            page = parse_page(request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        try:
+            return catalog_response('music', current_user.id, page), 200
+        except Exception as e:
+            return jsonify({'message': f'Error retrieving music: {str(e)}'}), 500
+
+    @app.route('/api/music/<int:music_id>/beats', methods=['GET'])
+    @read_only
+    @token_required
+    def get_music_beats(current_user, music_id):
+        from audio_analysis import decode_beats
+
+        try:
+            music = Music.query.get(music_id)
+            if not music:
+                return jsonify({'message': 'Music not found'}), 404
             
-            for music in musics:
-                music_list.append({
-                    'id': music.id,
-                    'title': music.title,
-                    'artist': music.artist,
-                    'url': music.url,
-                    'uploaded_by': music.user.email if music.user else 'Unknown',
-                    'created_at': music.created_at.isoformat()
-                })
+            if music.analyzed_at is None:
+                return jsonify({'message': 'Music has not been analyzed yet'}), 404
             
-            return jsonify(music_list), 200
+            return api_response({
+                'id': music.id,
+                'bpm': music.bpm,
+                'beats': decode_beats(music.beat_grid),
+                'beat_grid': music.beat_grid,
+                'analyzed_at': music.analyzed_at.isoformat()
+            })
         except Exception as e:
-            return jsonify({'message': f'Error retrieving music: {str(e)}'}), 500
+            return jsonify({'message': f'Error retrieving beats: {str(e)}'}), 500
 
     @app.route('/api/music/<int:music_id>', methods=['DELETE'])
     @admin_required
@@ -478,9 +1191,360 @@ def create_app():
             return jsonify({'message': f'Error deleting video: {str(e)}'}), 500
 
     # Serve uploaded files
+    def check_media_access(token, filename, access_token):
+        # Returns (message, status) when the request must be refused. Signature
+        # checks are CPU only so range requests never hit the DB
+        if token is not None:
+            try:
+                user_id = media_signer.verify(token, filename)
+            except InvalidMediaSignature as e:
+                return str(e), 403
+            
+            # A client that also sends its JWT must be the user the URL was issued to
+            if access_token:
+                try:
+                    data = jwt.decode(access_token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                except jwt.InvalidTokenError:
+                    return 'Token is invalid!', 401
+                if str(data.get('user_id')) != user_id:
+                    return 'Media URL was issued to another user', 403
+        elif app.config['MEDIA_REQUIRE_SIGNED_URLS']:
+            return 'Signed media URL required', 403
+        return None
+
+    app.extensions['check_media_access'] = check_media_access
+
     @app.route('/uploads/<path:filename>')
-    def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    @app.route('/media/<token>/<path:filename>')
+    def uploaded_file(filename, token=None):
+        error = check_media_access(token, filename, request.headers.get('x-access-token'))
+        if error:
+            return jsonify({'message': error[0]}), error[1]
+        
+        if not storage.is_local:
+            return serve_remote_upload(filename)
+        
+        if media_cache is not None:
+            filepath = storage.path(filename)
+            entry = media_cache.get(filepath) if filepath else None
+            if entry is not None:
+                response = app.response_class(entry.data, mimetype=entry.mimetype)
+                response.last_modified = entry.last_modified
+                response.cache_control.no_cache = True
+                response.set_etag(entry.etag)
+                # Handles If-None-Match/If-Modified-Since (304) and Range (206)
+                return response.make_conditional(request, accept_ranges=True, complete_length=len(entry.data))
+        
+        return send_from_directory(storage.root, filename)
+
+    def serve_remote_upload(filename):
+        from botocore.exceptions import ClientError
+
+        # Redirect to a short-lived presigned URL so the bytes never pass
+        # through a worker. Playlists are proxied: their relative entries
+        # must resolve against our signed /media URL, not the bucket's.
+        if app.config['S3_SERVE_MODE'] == 'redirect' and not filename.endswith('.m3u8'):
+            return redirect(storage.presigned_url(filename), 302)
+        
+        try:
+            obj = storage.read_range(filename, request.headers.get('Range'))
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('404', 'NoSuchKey', 'NotFound'):
+                return jsonify({'message': 'File not found'}), 404
+            if code == 'InvalidRange':
+                return jsonify({'message': 'Requested range not satisfiable'}), 416
+            raise
+        
+        body = obj['Body']
+        response = app.response_class(
+            body.iter_chunks(64 * 1024),
+            status=206 if obj.get('ContentRange') else 200,
+            mimetype=obj.get('ContentType') or 'application/octet-stream',
+            direct_passthrough=True
+        )
+        response.call_on_close(body.close)
+        response.content_length = obj['ContentLength']
+        response.accept_ranges = 'bytes'
+        if obj.get('ContentRange'):
+            response.headers['Content-Range'] = obj['ContentRange']
+        if obj.get('ETag'):
+            response.headers['ETag'] = obj['ETag']
+        if obj.get('LastModified'):
+            response.last_modified = obj['LastModified']
+        return response
+
+    @app.route('/api/admin/media-cache', methods=['GET'])
+    @admin_required
+    def get_media_cache_stats(current_user):
+        if media_cache is None:
+            return jsonify({'enabled': False}), 200
+        
+        stats = media_cache.stats()
+        stats['enabled'] = True
+        return jsonify(stats), 200
+
+    @app.route('/api/admin/catalog-cache', methods=['GET'])
+    @admin_required
+    def get_catalog_cache_stats(current_user):
+        if catalog_cache is None:
+            return jsonify({'enabled': False}), 200
+        
+        stats = catalog_cache.stats()
+        stats['enabled'] = True
+        return jsonify(stats), 200
+
+    def render_metrics(current_user=None):
+        data, content_type = request_metrics.render()
+        return app.response_class(data, content_type=content_type)
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        if request_metrics is None:
+            return jsonify({'message': 'Metrics are disabled'}), 404
+        
+        token = app.config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return render_metrics()
+        return admin_required(render_metrics)()
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    @admin_required
+    def list_profiles(current_user):
+        return jsonify(profile_spool.list()), 200
+
+    @app.route('/api/admin/profiles/<capture_id>/<fmt>', methods=['GET'])
+    @admin_required
+    def download_profile(current_user, capture_id, fmt):
+        name = profile_spool.file_name(capture_id, fmt)
+        if name is None:
+            return jsonify({'message': 'Profile not found'}), 404
+        return send_from_directory(profile_spool.directory, name, as_attachment=True)
+
+    def memory_query_args():
+        group = request.args.get('group', 'lineno')
+        if group not in MEMORY_GROUPINGS:
+            group = 'lineno'
+        return request.args.get('limit', 20, type=int), group
+
+    @app.route('/api/admin/memory', methods=['GET'])
+    @admin_required
+    def get_memory_stats(current_user):
+        return jsonify(memory_tracer.stats()), 200
+
+    @app.route('/api/admin/memory/tracemalloc', methods=['POST'])
+    @admin_required
+    def control_tracemalloc(current_user):
+        data = request.get_json(silent=True) or {}
+        if data.get('action') == 'start':
+            memory_tracer.start(max(1, int(data.get('frames', 10))))
+        elif data.get('action') == 'stop':
+            memory_tracer.stop()
+        else:
+            return jsonify({'message': "action must be 'start' or 'stop'"}), 400
+        return jsonify(memory_tracer.stats()), 200
+
+    @app.route('/api/admin/memory/snapshots', methods=['POST'])
+    @admin_required
+    def take_memory_snapshot(current_user):
+        limit, group = memory_query_args()
+        try:
+            snapshot = memory_tracer.snapshot(limit, group)
+        except TracingError as e:
+            return jsonify({'message': str(e)}), 409
+        snapshot['pid'] = os.getpid()
+        return jsonify(snapshot), 201
+
+    @app.route('/api/admin/memory/snapshots/<int:first_id>/diff/<int:second_id>', methods=['GET'])
+    @admin_required
+    def diff_memory_snapshots(current_user, first_id, second_id):
+        limit, group = memory_query_args()
+        try:
+            sites = memory_tracer.diff(first_id, second_id, limit, group)
+        except TracingError as e:
+            return jsonify({'message': str(e)}), 404
+        return jsonify({'pid': os.getpid(), 'from': first_id, 'to': second_id, 'sites': sites}), 200
+
+    @app.route('/api/admin/access-log', methods=['GET'])
+    @admin_required
+    def get_access_log_stats(current_user):
+        if access_log is None:
+            return jsonify({'enabled': False}), 200
+        
+        stats = access_log.stats()
+        stats['enabled'] = True
+        return jsonify(stats), 200
+
+    @app.route('/api/admin/slow-queries', methods=['GET'])
+    @admin_required
+    def get_slow_queries(current_user):
+        return jsonify(query_stats.stats()), 200
+
+    @app.route('/api/admin/rate-limits', methods=['GET'])
+    @admin_required
+    def get_rate_limit_stats(current_user):
+        return jsonify({
+            'rate_limiter': rate_limiter.stats() if rate_limiter is not None else {'enabled': False},
+            'concurrency_gate': concurrency_gate.stats() if concurrency_gate is not None else {'enabled': False},
+        }), 200
+
+    @app.route('/api/admin/idempotency', methods=['GET'])
+    @admin_required
+    def get_idempotency_stats(current_user):
+        return jsonify(idempotency_store.stats() if idempotency_store is not None else {'enabled': False}), 200
+
+    # CLI commands
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the database tables and the default admin user."""
+        init_database_once()
+        print("✅ Database initialized")
+
+    @app.cli.command('seed-synthetic')
+    @click.option('--users', default=0, show_default=True, help='Users to add')
+    @click.option('--videos', default=0, show_default=True, help='Videos to add')
+    @click.option('--music', default=0, show_default=True, help='Tracks to add')
+    @click.option('--seed', default=1, show_default=True, help='Same seed and counts give the same rows')
+    @click.option('--creators', default=1000, show_default=True, help='Users the videos and tracks are spread over')
+    @click.option('--media-files', default=0, show_default=True,
+                  help='Sparse files for the first N new videos and tracks')
+    @click.option('--batch-size', default=20000, show_default=True, help='Rows per INSERT batch')
+    def seed_synthetic(users, videos, music, seed, creators, media_files, batch_size):
+        """Bulk-insert deterministic synthetic users, videos and music."""
+        from itertools import islice
+
+        from synthetic import (PASSWORD, SyntheticData, bulk_insert, create_sparse_files, media_files as sparse_media,
+                               next_id, uploader_ids)
+
+        init_database_once()
+        if media_files and not storage.is_local:
+            print("❌ --media-files needs local storage")
+            return
+
+        data = SyntheticData(seed)
+        tables = db.metadata.tables
+        started = time.perf_counter()
+        with db.engine.connect() as conn:
+            first_user = next_id(conn, tables['user'])
+        if users:
+            count = bulk_insert(db.engine, tables['user'],
+                                data.users(first_user, users, generate_password_hash(PASSWORD)), batch_size)
+            print(f"  {count} users ({time.perf_counter() - started:.1f}s), password '{PASSWORD}'")
+
+        with db.engine.connect() as conn:
+            uploaders = uploader_ids(conn, tables['user'], creators)
+        for name, count, table, generate in (('videos', videos, tables['video'], data.videos),
+                                             ('music', music, tables['music'], data.music)):
+            if not count:
+                continue
+            with db.engine.connect() as conn:
+                first = next_id(conn, table)
+            inserted = bulk_insert(db.engine, table, generate(first, count, uploaders), batch_size)
+            files = 0
+            if media_files:
+                # The generator is deterministic, so the first rows can simply be generated again
+                rows = islice(generate(first, count, uploaders), media_files)
+                files = create_sparse_files(storage.root, sparse_media(rows, name))
+            print(f"  {inserted} {name} ({time.perf_counter() - started:.1f}s), {files} sparse files")
+
+        # Core inserts bypass the session hook that invalidates the listings
+        if catalog_cache is not None:
+            catalog_cache.bump()
+        elapsed = time.perf_counter() - started
+        total = users + videos + music
+        print(f"✅ Seeded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+
+    @app.cli.command('analyze-music')
+    @click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Analyzer processes')
+    @click.option('--force', is_flag=True, help='Re-analyze tracks that already have a beat grid')
+    @click.option('--batch-size', default=50, show_default=True, help='Rows committed per batch')
+    def analyze_music(workers, force, batch_size):
+        """Backfill BPM and beat grids for uploaded music."""
+        from audio_analysis import analyze_job
+
+        query = Music.query
+        if not force:
+            query = query.filter(Music.analyzed_at.is_(None))
+
+        jobs = []
+        skipped = 0
+        for music in query.all():
+            filename = resolve_upload_name(music.url)
+            if filename:
+                jobs.append((music.id, filename, app.config['STORAGE_SETTINGS']))
+            else:
+                skipped += 1
+
+        print(f"Analyzing {len(jobs)} tracks with {workers} workers ({skipped} without an uploaded file)")
+        if not jobs:
+            return
+
+        started = time.perf_counter()
+        done = failed = 0
+        audio_seconds = 0.0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for music_id, result, error in executor.map(analyze_job, jobs, chunksize=1):
+                if error:
+                    failed += 1
+                    print(f"  ❌ music {music_id}: {error}")
+                    continue
+                
+                music = db.session.get(Music, music_id)
+                music.bpm = result['bpm']
+                music.beat_grid = result['beat_grid']
+                music.analyzed_at = datetime.datetime.utcnow()
+                done += 1
+                audio_seconds += result['duration']
+
+                if done % batch_size == 0:
+                    db.session.commit()
+                    elapsed = time.perf_counter() - started
+                    print(f"  {done}/{len(jobs)} tracks, {done / elapsed:.1f} tracks/s, "
+                          f"{audio_seconds / elapsed:.0f}x realtime")
+
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+        print(f"✅ Analyzed {done} tracks ({failed} failed) in {elapsed:.1f}s: "
+              f"{done / elapsed:.1f} tracks/s, {audio_seconds / elapsed:.0f}x realtime")
+
+    @app.cli.command('process-videos')
+    @click.option('--workers', default=1, show_default=True, help='Concurrent ffmpeg processes')
+    @click.option('--force', is_flag=True, help='Re-process videos that are already packaged')
+    @click.option('--stale-minutes', default=60, show_default=True,
+                  help='Re-queue videos left probing or packaging this long by a stopped worker')
+    def process_videos(workers, force, stale_minutes):
+        """Probe and HLS-package uploaded videos."""
+        from video_processing import ffmpeg_available
+
+        if not ffmpeg_available():
+            print("❌ ffmpeg and ffprobe must be installed and on the PATH")
+            return
+
+        query = Video.query
+        if not force:
+            # Progress is written every 5%, so a live job never looks stale
+            stale_before = datetime.datetime.utcnow() - datetime.timedelta(minutes=stale_minutes)
+            in_progress = db.and_(Video.processing_status.in_(['probing', 'packaging']),
+                                  db.or_(Video.processing_updated_at.is_(None),
+                                         Video.processing_updated_at < stale_before))
+            query = query.filter(db.or_(Video.processing_status.is_(None),
+                                        Video.processing_status.in_(['pending', 'failed']),
+                                        in_progress))
+        videos = query.all()
+
+        print(f"Processing {len(videos)} videos with {workers} workers")
+        started = time.perf_counter()
+        processor = get_video_processor(workers)
+        queued = sum(1 for video in videos if queue_video_processing(video, processor, block=True))
+        processor.shutdown(wait=True)
+        db.session.commit()
+
+        db.session.expire_all()
+        ready = Video.query.filter(Video.id.in_([v.id for v in videos]),
+                                   Video.processing_status == 'ready').count()
+        elapsed = time.perf_counter() - started
+        print(f"✅ {ready}/{queued} videos packaged in {elapsed:.1f}s "
+              f"({len(videos) - queued} without an uploaded file)")
 
     return app
 
@@ -488,5 +1552,6 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
+    app.extensions['init_database']()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,397 @@
+"""ASGI entry point for the EchoPlay API.
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT --workers 4
+
+Under gunicorn's sync workers a slow client pins a whole worker: an upload
+trickling in over a mobile connection, or a long video download, blocks
+every other request that worker could serve. Here the I/O-bound paths run
+on the event loop instead:
+
+- uploaded media (``/uploads/...`` and signed ``/media/...``) is streamed
+  from local storage in chunks, so a slow download costs a coroutine
+  rather than a worker or a thread
+- request bodies, including uploads, are received asynchronously before
+  the Flask view runs, so threads are only used once a body is complete;
+  bodies over ``ASGI_MAX_BODY_BYTES`` are refused with a 413
+- the video and music listings are read with an async database driver
+  (aiosqlite, or psycopg's async mode for PostgreSQL)
+
+Every other route runs the Flask app in a thread pool. The native routes
+still run inside a Flask request context, so ``before_request`` and
+``after_request`` hooks (CORS, read-your-writes cookies, ...) apply to
+them exactly as they do to WSGI requests. Those hooks, building rows,
+signing and encoding run in the thread pool too: only awaiting I/O
+happens on the loop.
+"""
+import asyncio
+import contextvars
+import mimetypes
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+import jwt
+from flask import g
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException, NotFound
+
+from app import app as flask_app
+from catalog_cache import catalog_row, catalog_statement, parse_page
+from database import create_async_engine_for
+from media_cache import file_etag
+from serialization import negotiate as negotiate_format
+
+CHUNK_SIZE = 256 * 1024
+
+
+def catalog_rows(result_rows):
+    return [catalog_row(row) for row in result_rows]
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope."""
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class EchoPlayASGI:
+    def __init__(self, app):
+        self.app = app
+        self.storage = app.extensions['storage']
+        self.media_cache = app.extensions['media_cache']
+        self.catalog_cache = app.extensions['catalog_cache']
+        self.catalog_body = app.extensions['catalog_body']
+        self.check_media_access = app.extensions['check_media_access']
+        self.metadata = app.extensions['sqlalchemy'].metadata
+        self.spool_size = int(os.environ.get('ASGI_UPLOAD_SPOOL_BYTES', 1024 * 1024))
+        self.max_body_size = int(os.environ.get('ASGI_MAX_BODY_BYTES', 512 * 1024 * 1024))
+        self.executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_THREADS', 8)),
+                                           thread_name_prefix='wsgi')
+        self.engine = None
+        # Listing loads in progress, shared by concurrent misses in this worker
+        self.pending = {}
+        self.flight_timeout = app.config['CATALOG_SINGLEFLIGHT_TIMEOUT']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        method = scope['method']
+        if method in ('GET', 'HEAD') and self.storage.is_local:
+            if path.startswith('/uploads/'):
+                return await self.native(scope, receive, send, self.serve_media,
+                                         path[len('/uploads/'):], None)
+            if path.startswith('/media/') and path.count('/') >= 3:
+                token, filename = path[len('/media/'):].split('/', 1)
+                return await self.native(scope, receive, send, self.serve_media, filename, token)
+        if method == 'GET' and path in ('/api/videos', '/api/music') and self.engine is not None:
+            return await self.native(scope, receive, send, self.serve_catalog, path.rsplit('/', 1)[1])
+        return await self.call_wsgi(scope, receive, send)
+
+    # Lifespan
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def startup(self):
+        # With read replicas the listings stay on the WSGI path, where
+        # RoutingSession picks the replica and read-your-writes applies
+        if self.app.extensions['db_replicas']:
+            return
+        if os.environ.get('ASGI_ASYNC_DB', 'true').lower() != 'true':
+            return
+        with self.app.app_context():
+            url = self.app.extensions['sqlalchemy'].engine.url
+        self.engine = create_async_engine_for(url, self.app.config['SQLALCHEMY_ENGINE_OPTIONS'], os.environ)
+        self.app.extensions['query_stats'].install(self.engine.sync_engine)
+
+    async def run(self, func, *args):
+        # In a copy of the current context, so Flask's request context (a
+        # context variable) is visible to ``func`` in the thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+
+    # WSGI bridge
+    async def call_wsgi(self, scope, receive, send):
+        # Receive the whole body before taking a thread, so a slow upload
+        # only costs a coroutine (and a spool file) while it trickles in
+        body = SpooledTemporaryFile(max_size=self.spool_size)
+        try:
+            declared = dict(scope.get('headers', [])).get(b'content-length', b'')
+            if declared.isdigit() and int(declared) > self.max_body_size:
+                return await self.send_too_large(send)
+            size = 0
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > self.max_body_size:
+                    return await self.send_too_large(send)
+                body.write(chunk)
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = build_environ(scope, body)
+
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started['status'] = int(status.split(' ', 1)[0])
+                started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                      for name, value in headers]
+
+            def begin():
+                iterable = self.app(environ, start_response)
+                iterator = iter(iterable)
+                return iterable, iterator, next(iterator, None)
+
+            iterable, iterator, chunk = await self.run(begin)
+            try:
+                await send({'type': 'http.response.start', 'status': started['status'],
+                            'headers': started['headers']})
+                # Pull each chunk in a thread but send it on the loop, so a
+                # slow reader never holds a thread between chunks
+                while chunk is not None:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = await self.run(next, iterator, None)
+                await send({'type': 'http.response.body'})
+            finally:
+                if hasattr(iterable, 'close'):
+                    await self.run(iterable.close)
+        finally:
+            body.close()
+
+    async def send_too_large(self, send):
+        body = self.app.json.dumps({'message': 'Request body too large'}).encode()
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # Native routes
+    async def native(self, scope, receive, send, handler, *args):
+        environ = build_environ(scope, None)
+        stream = None
+        with self.app.request_context(environ) as ctx:
+            # The hooks may wait on SQLite or the concurrency gate
+            try:
+                response = await self.run(self.app.preprocess_request)
+                if response is None:
+                    response, stream = await handler(ctx.request, *args)
+                else:
+                    response = self.app.make_response(response)
+                response = await self.run(self.app.process_response, response)
+            except HTTPException as e:
+                response = await self.run(self.app.process_response, e.get_response(environ))
+                stream = None
+            except Exception as e:
+                response = self.app.make_response(await self.run(self.app.handle_exception, e))
+                stream = None
+
+        # The WSGI views of the response drop the body and entity headers
+        # where HTTP requires it (HEAD, 304); the server adds its own Date
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.get_wsgi_headers(environ).items() if name.lower() != 'date']
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        if stream is not None and scope['method'] != 'HEAD' and response.status_code in (200, 206):
+            await stream(receive, send)
+        else:
+            await send({'type': 'http.response.body', 'body': b''.join(response.get_app_iter(environ))})
+
+    def json_response(self, payload, status=200):
+        response = self.app.json.response(payload)
+        response.status_code = status
+        return response, None
+
+    async def serve_media(self, request, filename, token):
+        error = self.check_media_access(token, filename, request.headers.get('x-access-token'))
+        if error:
+            return self.json_response({'message': error[0]}, error[1])
+
+        filepath = self.storage.path(filename)
+        if not filepath:
+            raise NotFound()
+
+        if self.media_cache is not None:
+            entry = await self.run(self.media_cache.get, filepath)
+            if entry is not None:
+                response = self.app.response_class(entry.data, mimetype=entry.mimetype)
+                response.last_modified = entry.last_modified
+                response.cache_control.no_cache = True
+                response.set_etag(entry.etag)
+                return response.make_conditional(request, accept_ranges=True,
+                                                 complete_length=len(entry.data)), None
+
+        try:
+            stat = await self.run(os.stat, filepath)
+        except OSError:
+            raise NotFound()
+        if not os.path.isfile(filepath):
+            raise NotFound()
+
+        # Same headers and conditional/range handling as send_from_directory
+        response = self.app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.content_length = stat.st_size
+        response.last_modified = stat.st_mtime
+        response.cache_control.no_cache = True
+        response.set_etag(file_etag(filepath, stat))
+        response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+
+        if response.status_code == 206:
+            start, end = response.content_range.start, response.content_range.stop
+        else:
+            start, end = 0, stat.st_size
+
+        async def stream(receive, send):
+            disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+            f = await self.run(open, filepath, 'rb')
+            try:
+                await self.run(f.seek, start)
+                remaining = end - start
+                while remaining > 0 and not disconnected.done():
+                    chunk = await self.run(f.read, min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+                if remaining > 0 and not disconnected.done():
+                    # File shrank while streaming; end the response
+                    await send({'type': 'http.response.body'})
+            finally:
+                disconnected.cancel()
+                await self.run(f.close)
+
+        return response, stream
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def load_catalog(self, conn, name, version):
+        key = (name, version)
+        pending = self.pending.get(key)
+        if pending is not None:
+            try:
+                rows = await asyncio.wait_for(asyncio.shield(pending), self.flight_timeout)
+                if rows is not None:
+                    return rows
+            except asyncio.TimeoutError:
+                pass
+            # The leading request failed or is too slow; load independently
+            return await self.run(catalog_rows, (await conn.execute(catalog_statement(self.metadata, name))).all())
+
+        pending = self.pending[key] = asyncio.get_running_loop().create_future()
+        rows = None
+        try:
+            result_rows = (await conn.execute(catalog_statement(self.metadata, name))).all()
+            rows = await self.run(catalog_rows, result_rows)
+            return rows
+        finally:
+            del self.pending[key]
+            pending.set_result(rows)
+
+    async def serve_catalog(self, request, name):
+        token = request.headers.get('x-access-token')
+        if not token:
+            return self.json_response({'message': 'Token is missing!'}, 401)
+        try:
+            data = jwt.decode(token, self.app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return self.json_response({'message': 'Token has expired!'}, 401)
+        except jwt.InvalidTokenError:
+            return self.json_response({'message': 'Token is invalid!'}, 401)
+
+        try:
+            page = parse_page(request.args)
+        except ValueError as e:
+            return self.json_response({'message': str(e)}, 400)
+
+        users = self.metadata.tables['user']
+        try:
+            async with self.engine.connect() as conn:
+                user_id = (await conn.execute(select(users.c.id).where(users.c.id == data.get('user_id')))).scalar()
+                if user_id is None:
+                    return self.json_response({'message': 'Token is invalid!'}, 401)
+                g.current_user_id = user_id
+
+                version, rows = (None, None)
+                if page is not None:
+                    result_rows = (await conn.execute(catalog_statement(self.metadata, name, page))).all()
+                    rows = await self.run(catalog_rows, result_rows)
+                elif self.catalog_cache is not None:
+                    version, rows = self.catalog_cache.lookup(name)
+                if rows is None:
+                    rows = await self.load_catalog(conn, name, version)
+                    if self.catalog_cache is not None:
+                        self.catalog_cache.store(name, version, rows)
+        except Exception as e:
+            return self.json_response({'message': f'Error retrieving {name}: {str(e)}'}, 500)
+
+        # The same cached, compressed body as the WSGI view
+        mimetype, columnar = negotiate_format(request)
+        data, encoding = await self.run(self.catalog_body, name, rows, user_id, request.host, mimetype, columnar,
+                                        request.accept_encodings, page is None)
+        response = self.app.response_class(data, mimetype=mimetype)
+        response.vary.add('Accept')
+        if self.app.config['COMPRESSION_ENABLED']:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if page is not None and len(rows) == page[1]:
+            response.headers['X-Next-After'] = str(rows[-1]['id'])
+        return response, None
+
+
+application = EchoPlayASGI(flask_app)
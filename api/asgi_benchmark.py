@@ -0,0 +1,221 @@
+"""Slow-client capacity: gunicorn sync workers vs the ASGI entry point.
+
+Starts the API twice against the same temporary database and uploads
+folder: under gunicorn with sync workers (the previous Procfile setup) and
+under uvicorn with asgi.py, each with the same number of worker processes.
+For each server it opens a number of deliberately slow clients, then
+measures how fast requests from a normal client are served meanwhile.
+
+- downloads: clients fetch a large video and read it at a trickle
+- uploads: clients send a profile image body a few bytes at a time
+
+    python asgi_benchmark.py --workers 2 --slow-clients 8
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+
+
+def wait_for_server(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def login(port):
+    conn = http.client.HTTPConnection(HOST, port, timeout=10)
+    conn.request('POST', '/api/login', json.dumps({'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}),
+                 {'Content-Type': 'application/json'})
+    return json.loads(conn.getresponse().read())['token']
+
+
+def slow_download(port, stop, started):
+    sock = socket.socket()
+    # A tiny receive window makes the server wait on us, like a phone on a
+    # weak connection
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    try:
+        sock.connect((HOST, port))
+        sock.sendall(f"GET /uploads/benchmark_video.mp4 HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+        sock.settimeout(0.5)
+        first = True
+        while not stop.is_set():
+            try:
+                data = sock.recv(1024)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            if first:
+                started.append(time.time())
+                first = False
+            time.sleep(0.05)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def slow_upload(port, token, stop, started):
+    boundary = 'echoplaybenchmark'
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="slow.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    payload = head + b'x' * 64 * 1024 + tail
+    sock = socket.socket()
+    try:
+        sock.connect((HOST, port))
+        sock.sendall((f"POST /api/user/profile-image HTTP/1.1\r\nHost: {HOST}\r\nx-access-token: {token}\r\n"
+                      f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
+                      f"Content-Length: {len(payload)}\r\n\r\n").encode())
+        started.append(time.time())
+        for offset in range(0, len(payload), 256):
+            if stop.is_set():
+                break
+            sock.sendall(payload[offset:offset + 256])
+            time.sleep(0.05)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def probe(port, count, timeout):
+    latencies = []
+    failures = 0
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=timeout)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+            conn.close()
+        except OSError:
+            failures += 1
+    return latencies, failures
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(port, scenario, slow_clients, probes, timeout):
+    stop = threading.Event()
+    started = []
+    token = login(port) if scenario == 'uploads' else None
+    threads = []
+    for _ in range(slow_clients):
+        if scenario == 'downloads':
+            thread = threading.Thread(target=slow_download, args=(port, stop, started))
+        else:
+            thread = threading.Thread(target=slow_upload, args=(port, token, stop, started))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    time.sleep(1.0)
+
+    latencies, failures = probe(port, probes, timeout)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    return {
+        'slow_clients_started': len(started),
+        'probe_ok': len(latencies),
+        'probe_failed': failures,
+        'probe_p50_ms': percentile(latencies, 0.5) * 1000,
+        'probe_p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def start_server(kind, port, workers, env):
+    if kind == 'gunicorn-sync':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+        env = dict(env, GUNICORN_BIND=f'{HOST}:{port}', GUNICORN_WORKERS=str(workers),
+                   GUNICORN_WORKER_CLASS='sync', GUNICORN_TIMEOUT='120')
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', HOST, '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning']
+    return subprocess.Popen(command, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+    parser.add_argument('--slow-clients', type=int, default=8)
+    parser.add_argument('--probes', type=int, default=20, help='Normal requests measured per scenario')
+    parser.add_argument('--timeout', type=float, default=2.0, help='Seconds before a normal request counts as failed')
+    parser.add_argument('--video-mb', type=int, default=64)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='echoplay-asgi-bench-')
+    uploads = os.path.join(workdir, 'uploads')
+    os.makedirs(uploads)
+    with open(os.path.join(uploads, 'benchmark_video.mp4'), 'wb') as f:
+        f.write(os.urandom(1024 * 1024) * args.video_mb)
+    # Measure the servers themselves, without limits or load shedding
+    env = dict(os.environ, DATABASE_PATH='sqlite:///' + os.path.join(workdir, 'bench.db'), UPLOAD_FOLDER=uploads,
+               RATE_LIMIT_ENABLED='false', MAX_CONCURRENT_REQUESTS='0')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=API_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+    print("=== SLOW CLIENT BENCHMARK ===")
+    print(f"{args.workers} workers per server, {args.slow_clients} slow clients, "
+          f"{args.probes} probes with a {args.timeout:.0f}s timeout\n")
+    print(f"{'server':<14} {'scenario':<10} {'slow started':>12} {'probes ok':>10} {'failed':>7} "
+          f"{'p50':>9} {'p99':>9}")
+
+    results = {}
+    try:
+        for index, kind in enumerate(('gunicorn-sync', 'uvicorn-asgi')):
+            port = 5600 + index
+            server = start_server(kind, port, args.workers, env)
+            try:
+                if not wait_for_server(port, server):
+                    print(f"❌ {kind} did not start")
+                    continue
+                for scenario in ('downloads', 'uploads'):
+                    r = run_scenario(port, scenario, args.slow_clients, args.probes, args.timeout)
+                    results[f'{kind}/{scenario}'] = r
+                    print(f"{kind:<14} {scenario:<10} {r['slow_clients_started']:>12} {r['probe_ok']:>10} "
+                          f"{r['probe_failed']:>7} {r['probe_p50_ms']:>7.1f}ms {r['probe_p99_ms']:>7.1f}ms")
+                    time.sleep(1.0)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import sys
+import tempfile
+import wave
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from audio_analysis import (SAMPLE_RATE, AudioDecodeError, analyze_file, decode_beats,  # type: ignore
+                            decode_pcm)
+
+
+def click_track(path, bpm, seconds=30, rate=44100, width=2, channels=2):
+    """Short decaying noise bursts on every beat, written as PCM WAV."""
+    rng = np.random.default_rng(1)
+    samples = np.zeros(int(seconds * rate), dtype=np.float64)
+    click = rng.uniform(-1, 1, int(0.02 * rate)) * np.exp(-np.linspace(0, 8, int(0.02 * rate)))
+    beats = np.arange(0.25, seconds - 0.1, 60.0 / bpm)
+    for beat in beats:
+        start = int(beat * rate)
+        samples[start:start + len(click)] += 0.8 * click
+    scale = 2 ** (8 * width - 1) - 1
+    ints = np.rint(np.repeat(samples[:, None], channels, axis=1) * scale).astype('<i4')
+    if width == 2:
+        raw = ints.astype('<i2').tobytes()
+    else:
+        # Little-endian 24-bit: the low three bytes of each int32
+        raw = ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(raw)
+    return beats
+
+
+print("=== AUDIO ANALYSIS TEST ===")
+workdir = tempfile.mkdtemp(prefix='echoplay-audio-')
+
+# Test 1: Tempo of click tracks
+print("\n1. Testing tempo on synthetic click tracks...")
+tempos = {}
+for bpm in (90, 120, 150):
+    path = os.path.join(workdir, f'click_{bpm}.wav')
+    click_track(path, bpm)
+    tempos[bpm] = analyze_file(path)['bpm']
+if all(tempos[bpm] and abs(tempos[bpm] - bpm) / bpm < 0.02 for bpm in tempos):
+    print(f"   ✅ Estimated {tempos}")
+else:
+    print(f"   ❌ Estimated {tempos}")
+
+# Test 2: Beat positions
+print("\n2. Testing beat positions...")
+path = os.path.join(workdir, 'beats.wav')
+expected = click_track(path, 120)
+result = analyze_file(path)
+beats = np.array(decode_beats(result['beat_grid']))
+# Distance from each true click to the nearest detected beat
+errors = np.abs(beats[None, :] - expected[:, None]).min(axis=1)
+if (abs(result['beat_count'] - len(expected)) <= 2 and np.median(errors) < 0.05
+        and abs(result['duration'] - 30) < 0.01):
+    print(f"   ✅ {result['beat_count']} beats for {len(expected)} clicks, median error "
+          f"{np.median(errors) * 1000:.0f} ms")
+else:
+    print(f"   ❌ {result['beat_count']} beats for {len(expected)} clicks, median error {np.median(errors):.3f}s")
+
+# Test 3: The beat grid round-trips at millisecond precision
+print("\n3. Testing beat grid encoding...")
+if np.allclose(beats, np.round(beats, 3)) and len(beats) == result['beat_count']:
+    print(f"   ✅ {len(result['beat_grid'])} characters for {len(beats)} beats")
+else:
+    print("   ❌ Beat grid did not round-trip")
+
+# Test 4: 24-bit WAV is handed to ffmpeg instead of failing
+print("\n4. Testing 24-bit WAV decoding...")
+path = os.path.join(workdir, 'click_24bit.wav')
+click_track(path, 120, seconds=5, width=3)
+try:
+    samples = decode_pcm(path)
+    outcome = f"decoded {len(samples) / SAMPLE_RATE:.1f}s with ffmpeg"
+    passed = abs(len(samples) / SAMPLE_RATE - 5) < 0.05
+except AudioDecodeError as e:
+    outcome = str(e)
+    # Without ffmpeg the only acceptable failure is the missing decoder
+    passed = shutil.which('ffmpeg') is None and 'ffmpeg is required' in outcome
+if passed:
+    print(f"   ✅ Fell through to ffmpeg: {outcome}")
+else:
+    print(f"   ❌ {outcome}")
+
+# Test 5: Analysis at the file's own rate keeps tempo and beat positions
+print("\n5. Testing analysis at 44.1 kHz...")
+path = os.path.join(workdir, 'click_44k.wav')
+expected = click_track(path, 120)
+result = analyze_file(path, sample_rate=44100)
+beats = np.array(decode_beats(result['beat_grid']))
+errors = np.abs(beats[None, :] - expected[:, None]).min(axis=1)
+if (result['bpm'] and abs(result['bpm'] - 120) / 120 < 0.02 and np.median(errors) < 0.05
+        and abs(result['duration'] - 30) < 0.01):
+    print(f"   ✅ {result['bpm']} BPM, median beat error {np.median(errors) * 1000:.0f} ms")
+else:
+    print(f"   ❌ {result}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,115 @@
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+
+import msgpack
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-catalogbody-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'catalogbody.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['IDEMPOTENCY_STORE'] = os.path.join(workdir, 'idempotency.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from app import create_app  # type: ignore
+from catalog_cache import sign_catalog_rows  # type: ignore
+from serialization import MSGPACK_MIMETYPE, encode  # type: ignore
+
+print("=== CATALOG BODY TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+cache = app.extensions['catalog_cache']
+signer = app.extensions['media_signer']
+client = app.test_client()
+admin = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json
+user = client.post('/api/register', json={'email': 'body@example.com', 'password': 'body-password'}).json
+for i in range(40):
+    client.post('/api/videos', json={'title': f'Video {i}', 'url': f'/uploads/video_{i}.mp4',
+                                     'thumbnail': f'/uploads/thumb_{i}.jpg' if i % 2 else None},
+                headers={'x-access-token': admin['token']})
+# Text shaped like a template mark
+lookalike = '\x00' + '0' * 16 + '000000000\x00'
+client.post('/api/videos', json={'title': lookalike, 'url': 'https://cdn.example.com/v.mp4'},
+            headers={'x-access-token': admin['token']})
+
+
+def direct(name, user_id, mimetype, columnar):
+    rows = cache.entries[name].rows
+    signed = sign_catalog_rows(name, rows, lambda url, directory: signer.sign_url(
+        url, user_id, directory=directory, host='localhost'))
+    with app.app_context():
+        return encode(signed, mimetype, columnar, app.json)
+
+
+def fetch(token, accept=None, layout='', encoding='identity'):
+    headers = {'x-access-token': token, 'Accept-Encoding': encoding}
+    if accept:
+        headers['Accept'] = accept
+    response = client.get('/api/videos' + layout, headers=headers)
+    data = response.data
+    if response.headers.get('Content-Encoding') == 'gzip':
+        data = gzip.decompress(data)
+    return response, data
+
+
+# Test 1: Templated bodies match signing and encoding every row
+print("\n1. Testing template output...")
+mismatches = []
+for token, user_id in ((admin['token'], str(admin['user']['id'])), (user['token'], str(user['user']['id']))):
+    for accept, layout in ((None, ''), (MSGPACK_MIMETYPE, ''), (None, '?layout=columnar'),
+                           (MSGPACK_MIMETYPE, '?layout=columnar')):
+        response, data = fetch(token, accept, layout)
+        mimetype = accept or 'application/json'
+        if response.status_code != 200 or data != direct('videos', user_id, mimetype, bool(layout)):
+            mismatches.append((user_id, mimetype, layout, response.status_code))
+titles = [row['title'] for row in msgpack.unpackb(fetch(admin['token'], MSGPACK_MIMETYPE)[1])]
+if not mismatches and lookalike in titles:
+    print(f"   ✅ JSON, MessagePack and columnar bodies byte-identical for 2 users ({len(titles)} rows)")
+else:
+    print(f"   ❌ {mismatches}")
+
+# Test 2: Repeat requests reuse the body, compressed in the negotiated encoding
+print("\n2. Testing reuse and compression...")
+before = cache.stats()
+first, plain = fetch(admin['token'], encoding='gzip')
+again, _ = fetch(admin['token'], encoding='gzip')
+after = cache.stats()
+if (first.headers.get('Content-Encoding') == 'gzip' and first.data == again.data
+        and plain == direct('videos', str(admin['user']['id']), 'application/json', False)
+        and after['body_hits'] == before['body_hits'] + 3 and 'Accept-Encoding' in first.headers['Vary']):
+    print(f"   ✅ gzip body of {len(first.data)} bytes for {len(plain)}, served again from the cache")
+else:
+    print(f"   ❌ {first.headers.get('Content-Encoding')} {before} -> {after}")
+
+# Test 3: The body cache stays under its byte budget
+print("\n3. Testing the byte budget...")
+cache.max_body_bytes = 3 * len(plain)
+tokens = [client.post('/api/register', json={'email': f'budget{i}@example.com', 'password': 'budget-password'}
+                      ).json['token'] for i in range(6)]
+for token in tokens:
+    fetch(token)
+stats = cache.stats()
+if stats['body_bytes'] <= cache.max_body_bytes and 0 < stats['bodies'] <= 3:
+    print(f"   ✅ {stats['bodies']} bodies, {stats['body_bytes']} of {stats['max_body_bytes']} bytes")
+else:
+    print(f"   ❌ {stats}")
+
+# Test 4: A catalog change drops every body
+print("\n4. Testing invalidation...")
+client.post('/api/videos', json={'title': 'New', 'url': '/uploads/new.mp4'},
+            headers={'x-access-token': admin['token']})
+emptied = cache.stats()['body_bytes'] == 0
+response, data = fetch(admin['token'])
+if emptied and b'new.mp4' in data and data == direct('videos', str(admin['user']['id']), 'application/json', False):
+    print(f"   ✅ Bodies dropped on change; the next listing has {len(response.json)} rows")
+else:
+    print(f"   ❌ Emptied {emptied}, {cache.stats()}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,341 @@
+"""In-process snapshots of the video and music catalogs.
+
+``get_videos`` and ``get_music`` return every row to every client, and the
+rows only change when an admin adds or deletes media (or a background job
+updates it). Each worker keeps the serialized rows of the last listing and
+reuses them until the catalog version changes.
+
+The version is a small file in the instance folder that is atomically
+replaced after every committed catalog change, so all workers on the host
+see the change on their next request at the cost of one ``stat``. Entries
+also expire after ``ttl`` seconds, which bounds staleness when several
+hosts share a database.
+
+Misses are coalesced (see singleflight.py): one request per worker
+rebuilds a listing while concurrent ones wait for it, and workers share a
+freshly built listing through a spool file instead of each querying it.
+
+Encoded response bodies derived from the rows are kept with ``body``
+while the rows are current, in one LRU capped at ``max_body_bytes`` for
+the whole cache. Media URLs are signed per user, so the rows are encoded
+once per format into a ``BodyTemplate`` with gaps where the URLs go;
+a user's body only costs signing the URLs and joining the pieces.
+
+When gunicorn preloads the app, the master builds the snapshots once
+(``warm``) and forked workers share them copy-on-write.
+
+The listing queries and row formats live here too, so the WSGI routes and
+the async ones in asgi.py return identical rows. A listing requested with
+``?limit=`` (and ``after=``, the last id of the previous page) is a keyset
+page read straight from the database; pages are not cached.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import msgpack
+from sqlalchemy import select
+
+from singleflight import SingleFlight
+
+# Listing name -> (table, columns returned as-is)
+CATALOG_COLUMNS = {
+    'videos': ('video', ('id', 'title', 'description', 'url', 'thumbnail', 'created_at', 'duration',
+                         'width', 'height', 'hls_url', 'processing_status')),
+    'music': ('music', ('id', 'title', 'artist', 'url', 'created_at', 'bpm')),
+}
+
+# Fields holding /uploads URLs that are signed per user, and whether the
+# grant covers the whole directory (HLS playlists reference sibling files)
+SIGNED_FIELDS = {
+    'videos': (('url', False), ('thumbnail', False), ('hls_url', True)),
+    'music': (('url', False),),
+}
+
+
+# Largest page of a paginated listing
+MAX_PAGE_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+
+
+def parse_page(args):
+    """``(after, limit)`` from the query string, or None for the full listing."""
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        after = int(args.get('after', 0))
+    except ValueError:
+        raise ValueError('limit and after must be integers') from None
+    if not 1 <= limit <= MAX_PAGE_SIZE or after < 0:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE} and after must not be negative')
+    return after, limit
+
+
+def catalog_statement(metadata, name, page=None):
+    """SELECT for a listing, joined with the uploader's email in one query."""
+    table_name, columns = CATALOG_COLUMNS[name]
+    table = metadata.tables[table_name]
+    users = metadata.tables['user']
+    statement = select(*[table.c[column] for column in columns], users.c.email) \
+        .select_from(table.outerjoin(users, table.c.uploaded_by == users.c.id)) \
+        .order_by(table.c.id)
+    if page is not None:
+        # Keyset pagination: an index seek past the previous page's last id
+        after, limit = page
+        statement = statement.where(table.c.id > after).limit(limit)
+    return statement
+
+
+def catalog_row(row):
+    data = dict(row._mapping)
+    data['uploaded_by'] = data.pop('email') or 'Unknown'
+    data['created_at'] = data['created_at'].isoformat()
+    return data
+
+
+def sign_catalog_rows(name, rows, sign):
+    """Copy cached rows with their media URLs signed by ``sign(url, directory)``."""
+    fields = SIGNED_FIELDS[name]
+    signed = []
+    for row in rows:
+        row = dict(row)
+        for field, directory in fields:
+            row[field] = sign(row[field], directory)
+        signed.append(row)
+    return signed
+
+
+class BodyTemplate:
+    """An encoded listing with a gap in place of every media URL.
+
+    ``encode`` serializes a whole payload and ``encode_value`` a single
+    value exactly as it appears inside it (see serialization.py). Each URL
+    is encoded as a fixed-width mark holding its index and a random nonce,
+    so stored text cannot pass for one; ``build`` still returns None if
+    the marks are not found exactly once each, and the rows are then
+    encoded directly.
+    """
+    __slots__ = ('chunks', 'urls', 'encode_value', 'size')
+
+    def __init__(self, chunks, urls, encode_value):
+        self.chunks = chunks
+        self.urls = urls
+        self.encode_value = encode_value
+        self.size = sum(len(chunk) for chunk in chunks)
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def build(cls, name, rows, encode, encode_value):
+        fields = SIGNED_FIELDS[name]
+        mark = '\x00' + secrets.token_hex(8) + '%09d\x00'
+        urls = []
+        marked = []
+        for row in rows:
+            row = dict(row)
+            for field, directory in fields:
+                if isinstance(row[field], str) and row[field]:
+                    urls.append((row[field], directory))
+                    row[field] = mark % (len(urls) - 1)
+            marked.append(row)
+        body = encode(marked)
+
+        sample = encode_value(mark % 0)
+        digits = sample.rindex(b'0' * 9)
+        pattern = re.compile(re.escape(sample[:digits]) + rb'(\d{9})' + re.escape(sample[digits + 9:]))
+        parts = pattern.split(body)
+        order = [int(number) for number in parts[1::2]]
+        # Columnar payloads may reorder the fields, but every mark must
+        # appear exactly once
+        if sorted(order) != list(range(len(urls))):
+            return None
+        return cls(parts[0::2], [urls[number] for number in order], encode_value)
+
+    def render(self, sign):
+        """The body with each URL replaced by ``sign(url, directory)``."""
+        encode_value = self.encode_value
+        parts = [self.chunks[0]]
+        for (url, directory), chunk in zip(self.urls, self.chunks[1:]):
+            parts.append(encode_value(sign(url, directory)))
+            parts.append(chunk)
+        return b''.join(parts)
+
+
+class CatalogEntry:
+    __slots__ = ('version', 'built_at', 'rows', 'hits', 'serial')
+
+    def __init__(self, version, rows, serial):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.rows = rows
+        self.hits = 0
+        # Distinguishes the bodies of this entry from those of a previous
+        # entry for the same key
+        self.serial = serial
+
+
+class CatalogCache:
+    def __init__(self, version_path, ttl=300, max_body_bytes=32 * 1024 * 1024, spool_dir=None,
+                 flight_timeout=10.0):
+        self.version_path = version_path
+        self.ttl = ttl
+        self.max_body_bytes = max_body_bytes
+        self.spool_dir = spool_dir
+        self.flight = SingleFlight(lock_dir=spool_dir, timeout=flight_timeout)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.body_hits = 0
+        self.body_misses = 0
+        # (key, entry serial, variant) -> body or BodyTemplate, oldest first
+        self.bodies = OrderedDict()
+        self.body_bytes = 0
+        self.serials = 0
+
+    def version(self):
+        try:
+            stat = os.stat(self.version_path)
+        except FileNotFoundError:
+            return None
+        # os.replace gives every bump a new inode, so (inode, mtime) changes
+        # even when two bumps land within the filesystem's mtime resolution
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def bump(self):
+        """Mark the catalog as changed for every worker on this host."""
+        directory = os.path.dirname(self.version_path)
+        os.makedirs(directory, exist_ok=True)
+        temp_path = '%s.%s.tmp' % (self.version_path, uuid.uuid4().hex)
+        with open(temp_path, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temp_path, self.version_path)
+        with self.lock:
+            self.entries.clear()
+            self.bodies.clear()
+            self.body_bytes = 0
+
+    def lookup(self, key):
+        """Return ``(version, rows)``; rows is None on a miss.
+
+        Pass the version to ``store`` once the rows are built, so a change
+        committed meanwhile is not hidden behind the new entry.
+        """
+        version = self.version()
+        entry = self.entries.get(key)
+        if entry is not None and entry.version == version \
+                and time.monotonic() - entry.built_at < self.ttl:
+            entry.hits += 1
+            self.hits += 1
+            return version, entry.rows
+
+        self.misses += 1
+        return version, None
+
+    def store(self, key, version, rows):
+        with self.lock:
+            self.serials += 1
+            self.entries[key] = CatalogEntry(version, rows, self.serials)
+            # Bodies of the replaced entry are never served again
+            for body_key in [body_key for body_key in self.bodies if body_key[0] == key]:
+                self.body_bytes -= len(self.bodies.pop(body_key))
+
+    def get(self, key, build):
+        """Return the cached rows for ``key``, calling ``build()`` on a miss."""
+        version, rows = self.lookup(key)
+        if rows is None:
+            rows = self.flight.do(
+                (key, version), build, lock_name='catalog-' + key,
+                load_shared=lambda: self.load_spool(key, version),
+                store_shared=lambda built: self.save_spool(key, version, built)
+            )
+            self.store(key, version, rows)
+        return rows
+
+    def _spool_path(self, key, version):
+        tag = 'none' if version is None else '%d-%d' % version
+        return os.path.join(self.spool_dir, '%s-%s.msgpack' % (key, tag))
+
+    def load_spool(self, key, version):
+        path = self._spool_path(key, version)
+        try:
+            # Only share results of the current stampede; an older spool of
+            # the same version would defeat the TTL
+            if time.time() - os.stat(path).st_mtime > self.flight.timeout:
+                return None
+            with open(path, 'rb') as f:
+                return msgpack.unpackb(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def save_spool(self, key, version, rows):
+        path = self._spool_path(key, version)
+        temp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(temp_path, 'wb') as f:
+            f.write(msgpack.packb(rows, use_bin_type=True))
+        os.replace(temp_path, path)
+        # Spools of older versions are never read again
+        for name in os.listdir(self.spool_dir):
+            other = os.path.join(self.spool_dir, name)
+            if name.startswith(key + '-') and name.endswith('.msgpack') and other != path:
+                try:
+                    os.remove(other)
+                except OSError:
+                    pass
+
+    def body(self, key, rows, variant, build):
+        """Return the encoded body ``variant`` of ``rows``, calling ``build()`` on a miss.
+
+        Bodies are only kept while ``rows`` are the current rows of ``key``.
+        All bodies together take at most ``max_body_bytes`` (by ``len``;
+        least recently used first out), and one larger than that is not
+        kept at all. A ``build()`` returning None is not kept either.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.rows is not rows:
+            return build()
+
+        body_key = (key, entry.serial, variant)
+        with self.lock:
+            data = self.bodies.get(body_key)
+            if data is not None:
+                self.bodies.move_to_end(body_key)
+                self.body_hits += 1
+                return data
+            self.body_misses += 1
+
+        data = build()
+        if data is None or len(data) > self.max_body_bytes:
+            return data
+        with self.lock:
+            # A concurrent miss may have stored it already, or the entry
+            # may have been replaced meanwhile
+            if body_key in self.bodies or self.entries.get(key) is not entry:
+                return data
+            self.bodies[body_key] = data
+            self.body_bytes += len(data)
+            while self.body_bytes > self.max_body_bytes:
+                self.body_bytes -= len(self.bodies.popitem(last=False)[1])
+        return data
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'body_hits': self.body_hits,
+            'body_misses': self.body_misses,
+            'bodies': len(self.bodies),
+            'body_bytes': self.body_bytes,
+            'max_body_bytes': self.max_body_bytes,
+            'ttl': self.ttl,
+            'singleflight': self.flight.stats(),
+            'entries': {key: {'rows': len(entry.rows), 'hits': entry.hits,
+                              'age': round(time.monotonic() - entry.built_at, 1)}
+                        for key, entry in list(self.entries.items())},
+        }
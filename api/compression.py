@@ -0,0 +1,54 @@
+"""Content-Encoding negotiation for API responses.
+
+Catalog listings are large, repetitive JSON (the same uploader emails and
+URL prefixes on every row) and compress by an order of magnitude. gzip is
+always available; brotli is offered when the ``brotli`` package from
+requirements.txt is installed.
+
+Responses are compressed at a fast level. Even cached catalog bodies are
+per user and short-lived, so a higher level would cost more CPU on every
+miss than it saves in bytes.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/msgpack', 'text/plain', 'text/html'}
+
+LEVELS = {
+    'br': 4,
+    'gzip': 6,
+}
+
+
+def available_encodings():
+    # Preference order when the client accepts several with the same q
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate(accept_encodings):
+    """Pick an encoding from a werkzeug Accept-Encoding header, or None."""
+    return accept_encodings.best_match(available_encodings())
+
+
+def compress(data, encoding):
+    level = LEVELS[encoding]
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def is_compressible(response, min_size):
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.content_length is not None and response.content_length >= min_size
@@ -0,0 +1,346 @@
+"""Database URL handling and engine profiles.
+
+``DATABASE_PATH`` may be a SQLite URL (local development, single-node
+deployments) or a PostgreSQL URL, including the ``postgres://`` form that
+hosting providers hand out. PostgreSQL engines get a tuned connection pool
+and a server-side per-statement timeout.
+
+SQLite is used in production with several gunicorn workers sharing one
+file. With the default rollback journal a writer blocks every reader and
+concurrent writers fail immediately with "database is locked". The SQLite
+profile applied on every new connection switches to WAL (readers never
+block on the writer), relaxes fsyncs to the WAL-safe ``synchronous=NORMAL``,
+enlarges the page cache and memory map, and waits on locks instead of
+failing. Write transactions start with BEGIN IMMEDIATE, so the write lock
+is taken before anything is read. A BEGIN or COMMIT that still hits a lock
+after the busy timeout is retried with jittered backoff before the error
+reaches the request; on the async engine the backoff yields to the event
+loop. A lock error later in a transaction is raised at once: its snapshot
+may be stale, and no amount of waiting fixes that.
+
+Read-heavy endpoints can be served from one or more replicas
+(``DATABASE_REPLICA_URLS``) through ``RoutingSession``; writes and a
+user's reads shortly after their own writes stay on the primary.
+Relative SQLite replica paths resolve against the instance folder, like
+the primary's.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only
+
+SQLITE_DEFAULTS = {
+    'busy_timeout_ms': 5000,
+    'cache_size_kb': 64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'write_retries': 3,
+    'retry_backoff': 0.05,
+}
+
+
+DEFAULT_DATABASE_URL = 'sqlite:///echoplay_api.db'
+
+POSTGRES_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'statement_timeout_ms': 15000,
+    'connect_timeout': 10,
+}
+
+
+def normalize_database_url(url):
+    """Return a SQLAlchemy URL for ``DATABASE_PATH``.
+
+    - empty: the default SQLite file (created in the Flask instance folder)
+    - ``postgres://`` / ``postgresql://``: PostgreSQL through psycopg 3
+    - anything else is passed through unchanged, so relative
+      (``sqlite:///name.db``) and absolute (``sqlite:////srv/name.db``)
+      SQLite paths both work
+    """
+    url = (url or '').strip()
+    if not url:
+        return DEFAULT_DATABASE_URL
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('postgresql://'):
+        url = 'postgresql+psycopg://' + url[len('postgresql://'):]
+    return url
+
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def is_postgres(url):
+    return url.startswith('postgresql')
+
+
+def postgres_settings_from_env(environ):
+    return {
+        'pool_size': int(environ.get('DB_POOL_SIZE', POSTGRES_DEFAULTS['pool_size'])),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', POSTGRES_DEFAULTS['max_overflow'])),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', POSTGRES_DEFAULTS['pool_timeout'])),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', POSTGRES_DEFAULTS['pool_recycle'])),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'statement_timeout_ms': int(environ.get('DB_STATEMENT_TIMEOUT_MS', POSTGRES_DEFAULTS['statement_timeout_ms'])),
+        'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', POSTGRES_DEFAULTS['connect_timeout'])),
+    }
+
+
+def engine_options(url, environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``url``."""
+    if not is_postgres(url):
+        return {}
+
+    settings = postgres_settings_from_env(environ)
+    options = '-c statement_timeout=%d' % settings['statement_timeout_ms']
+    return {
+        'pool_size': settings['pool_size'],
+        'max_overflow': settings['max_overflow'],
+        'pool_timeout': settings['pool_timeout'],
+        # Recycle before typical proxy/load balancer idle timeouts
+        'pool_recycle': settings['pool_recycle'],
+        # Detect connections dropped by a database restart or failover
+        'pool_pre_ping': settings['pool_pre_ping'],
+        'connect_args': {
+            'connect_timeout': settings['connect_timeout'],
+            'options': options,
+            'application_name': environ.get('DB_APPLICATION_NAME', 'echoplay-api'),
+        },
+    }
+
+
+def sqlite_settings_from_env(environ):
+    return {
+        'busy_timeout_ms': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', SQLITE_DEFAULTS['busy_timeout_ms'])),
+        'cache_size_kb': int(environ.get('SQLITE_CACHE_SIZE_KB', SQLITE_DEFAULTS['cache_size_kb'])),
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', SQLITE_DEFAULTS['mmap_size'])),
+        'write_retries': int(environ.get('SQLITE_WRITE_RETRIES', SQLITE_DEFAULTS['write_retries'])),
+        'retry_backoff': float(environ.get('SQLITE_RETRY_BACKOFF', SQLITE_DEFAULTS['retry_backoff'])),
+    }
+
+
+def sqlite_pragmas(settings):
+    return [
+        # WAL: readers and the single writer no longer block each other
+        'PRAGMA journal_mode=WAL',
+        # Durable across application crashes; only an OS crash can lose the
+        # last transactions, never corrupt the database
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA busy_timeout=%d' % settings['busy_timeout_ms'],
+        # Negative cache_size is in KiB rather than pages
+        'PRAGMA cache_size=-%d' % settings['cache_size_kb'],
+        'PRAGMA mmap_size=%d' % settings['mmap_size'],
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def _is_locked(error):
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def _in_transaction(dbapi_connection):
+    # SQLAlchemy's aiosqlite adapter keeps the aiosqlite connection in _connection
+    connection = getattr(dbapi_connection, '_connection', dbapi_connection)
+    return connection.in_transaction
+
+
+def _sleep_in_event_loop(seconds):
+    # aiosqlite statements run in SQLAlchemy's greenlet on the event loop;
+    # time.sleep there would stall every other request
+    await_only(asyncio.sleep(seconds))
+
+
+def configure_sqlite_engine(engine, settings=None, sleep=time.sleep):
+    """Apply the SQLite production profile to ``engine``.
+
+    ``sleep`` waits between retries; the async engine passes one that
+    yields to the event loop.
+    """
+    settings = dict(SQLITE_DEFAULTS, **(settings or {}))
+    pragmas = sqlite_pragmas(settings)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+        # The driver opens a transaction before the first write; make it
+        # take the write lock right there instead of upgrading a read
+        # snapshot later, which fails for good if another writer committed
+        dbapi_connection.isolation_level = 'IMMEDIATE'
+
+    def run_with_retry(execute, dbapi_connection=None):
+        # Only a statement whose BEGIN IMMEDIATE was refused (the connection
+        # is still outside a transaction) or a COMMIT can be repeated once
+        # the lock holder has had time to commit
+        for attempt in range(settings['write_retries'] + 1):
+            try:
+                execute()
+                return True
+            except sqlite3.OperationalError as e:
+                if (not _is_locked(e) or attempt == settings['write_retries']
+                        or (dbapi_connection is not None and _in_transaction(dbapi_connection))):
+                    raise
+                delay = settings['retry_backoff'] * (2 ** attempt)
+                sleep(delay + random.uniform(0, delay))
+
+    @event.listens_for(engine, 'do_execute')
+    def execute_with_retry(cursor, statement, parameters, context):
+        return run_with_retry(lambda: cursor.execute(statement, parameters),
+                              context.root_connection.connection.dbapi_connection)
+
+    @event.listens_for(engine, 'do_execute_no_params')
+    def execute_no_params_with_retry(cursor, statement, context):
+        return run_with_retry(lambda: cursor.execute(statement),
+                              context.root_connection.connection.dbapi_connection)
+
+    @event.listens_for(engine, 'do_executemany')
+    def executemany_with_retry(cursor, statement, parameters, context):
+        return run_with_retry(lambda: cursor.executemany(statement, parameters),
+                              context.root_connection.connection.dbapi_connection)
+
+    # There is no event around COMMIT, so wrap this engine's dialect. A
+    # COMMIT refused with "database is locked" leaves the transaction open,
+    # so it can be repeated
+    do_commit = engine.dialect.do_commit
+    engine.dialect.do_commit = lambda dbapi_connection: run_with_retry(lambda: do_commit(dbapi_connection))
+
+    return engine
+
+
+class RoutingSession(Session):
+    """Session that sends read-only requests to a replica engine.
+
+    A request is routed to a replica when its view is marked with
+    ``read_only`` (which sets ``g.db_read_only``) and the user has not
+    written within the read-your-writes window (``g.db_use_primary``).
+    Flushes always go to the primary. Replica engines live in
+    ``app.extensions['db_replicas']``.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_read_only') \
+                and not g.get('db_use_primary'):
+            replicas = current_app.extensions.get('db_replicas')
+            if replicas:
+                # Keep one replica per request so reads see a single snapshot
+                if 'db_replica' not in g:
+                    g.db_replica = random.choice(replicas)
+                return g.db_replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReadYourWrites:
+    """Remember users who just wrote so their next reads use the primary.
+
+    Kept per worker, and handed to the client so a follow-up request
+    landing on another worker or node is routed the same way: as an
+    ``X-Primary-Until`` response header that the mobile client sends back
+    on its next requests, and as a short-lived cookie for browsers. Client
+    values more than one window ahead are ignored.
+    """
+
+    COOKIE = 'echoplay_primary_until'
+    HEADER = 'X-Primary-Until'
+
+    def __init__(self, window_seconds):
+        self.window = window_seconds
+        self.until = {}
+        self.lock = threading.Lock()
+
+    def mark(self, user_id, response=None):
+        if not self.window:
+            return
+        expires = time.time() + self.window
+        with self.lock:
+            if len(self.until) > 10000:
+                now = time.time()
+                self.until = {k: v for k, v in self.until.items() if v > now}
+            if user_id is not None:
+                self.until[user_id] = expires
+        if response is not None:
+            response.headers[self.HEADER] = str(int(expires))
+            response.set_cookie(self.COOKIE, str(int(expires)), max_age=int(self.window) + 1,
+                                httponly=True, samesite='Lax')
+
+    def is_sticky(self, user_id, headers, cookies):
+        now = time.time()
+        if user_id is not None and self.until.get(user_id, 0) > now:
+            return True
+        for value in (headers.get(self.HEADER), cookies.get(self.COOKIE)):
+            try:
+                if value and now < float(value) <= now + self.window + 1:
+                    return True
+            except ValueError:
+                pass
+        return False
+
+
+def resolve_sqlite_url(url, instance_path):
+    """Make a relative SQLite path absolute under ``instance_path``.
+
+    Matches how Flask-SQLAlchemy resolves the primary's ``DATABASE_PATH``,
+    so ``sqlite:///replica.db`` sits next to the primary file instead of in
+    the process's working directory.
+    """
+    if not is_sqlite(url):
+        return url
+    parsed = make_url(url)
+    database = parsed.database
+    if not database or database == ':memory:' or database.startswith('file:') or os.path.isabs(database):
+        return url
+    os.makedirs(instance_path, exist_ok=True)
+    return parsed.set(database=os.path.join(instance_path, database)).render_as_string(hide_password=False)
+
+
+def create_replica_engines(urls, environ, instance_path):
+    engines = []
+    for url in (urls or '').split(','):
+        url = normalize_database_url(url) if url.strip() else None
+        if not url:
+            continue
+        url = resolve_sqlite_url(url, instance_path)
+        engine = create_engine(url, **engine_options(url, environ))
+        if is_sqlite(url):
+            configure_sqlite_engine(engine, sqlite_settings_from_env(environ))
+        engines.append(engine)
+    return engines
+
+
+def create_async_engine_for(url, options, environ):
+    """Async engine on the same database as the sync engine URL ``url``.
+
+    SQLite goes through aiosqlite and keeps the production profile;
+    PostgreSQL URLs already name psycopg, which has an async mode.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    sqlite = url.get_backend_name() == 'sqlite'
+    if sqlite:
+        url = url.set(drivername='sqlite+aiosqlite')
+    engine = create_async_engine(url, **options)
+    if sqlite:
+        configure_sqlite_engine(engine.sync_engine, sqlite_settings_from_env(environ), sleep=_sleep_in_event_loop)
+    return engine
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(session, flush_context):
+    if has_app_context():
+        g.db_wrote = True
@@ -0,0 +1,369 @@
+"""Throughput and latency of the API endpoints, measured in process.
+
+Builds the app with ``create_app`` against a temporary SQLite database and
+drives it through the Flask test client, so the numbers cover routing,
+hooks, the ORM, serialization and SQLite, but no sockets or server. The
+catalog is seeded with synthetic.py's bulk inserts and grown through each size in
+``--rows``; cases that depend on the catalog size run again at every size.
+
+Every case runs in ``--rounds`` rounds, interleaved with the other cases
+so a burst of background load does not land on one case only. A round
+runs for ``--seconds`` or ``--requests`` requests, whichever ends first
+(at least ``--min-requests``). Each case reports requests per second,
+the median of its per-round medians and the pooled percentiles. Write
+cases remove the rows they created before the next case, so every case
+sees the catalog at its nominal size. Everything the app writes,
+instance folder included, goes to a temporary directory.
+
+``--json`` writes the results. ``--baseline`` compares the run against
+such a file and exits non-zero when a case's median latency regressed by
+more than ``--max-regression`` percent and every round of this run was
+slower than every round of the baseline, i.e. the change is larger than
+the noise between rounds. Cases with fewer than ``--min-samples``
+requests on either side are reported but not judged.
+
+    python endpoint_benchmark.py --rows 1000 100000 1000000 --json bench.json
+    python endpoint_benchmark.py --rows 1000 100000 --baseline bench.json
+    python endpoint_benchmark.py --cases login videos_cold --rows 1000
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(API_DIR)
+
+from sqlalchemy import func, select
+
+from synthetic import SyntheticData, bulk_insert, next_id
+
+ADMIN = {'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}
+SEED_CHUNK = 20000
+IMAGE = os.urandom(256 * 1024)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=API_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    def __init__(self, app):
+        self.app = app
+        self.db = app.extensions['sqlalchemy']
+        self.client = app.test_client()
+        with app.app_context():
+            self.tables = {name: self.db.metadata.tables[name] for name in ('video', 'music')}
+        response = self.client.post('/api/login', json=ADMIN)
+        self.admin_id = response.json['user']['id']
+        self.data = SyntheticData(seed=1)
+        self.headers = {'x-access-token': response.json['token']}
+
+    def count(self, table):
+        with self.app.app_context():
+            with self.db.engine.connect() as conn:
+                return conn.execute(select(func.count()).select_from(self.tables[table])).scalar()
+
+    def max_id(self, table):
+        with self.app.app_context():
+            with self.db.engine.connect() as conn:
+                return next_id(conn, self.tables[table]) - 1
+
+    def insert(self, table, count):
+        """Bulk insert ``count`` synthetic rows and return their ids."""
+        with self.app.app_context():
+            with self.db.engine.connect() as conn:
+                start = next_id(conn, self.tables[table])
+            generate = self.data.videos if table == 'video' else self.data.music
+            bulk_insert(self.db.engine, self.tables[table], generate(start, count, [self.admin_id]), SEED_CHUNK)
+        self.changed()
+        return list(range(start, start + count))
+
+    def delete_above(self, table, last_id):
+        with self.app.app_context():
+            with self.db.engine.begin() as conn:
+                conn.execute(self.tables[table].delete().where(self.tables[table].c.id > last_id))
+        self.changed()
+
+    def changed(self):
+        # Core statements bypass the session hook that invalidates the listings
+        cache = self.app.extensions['catalog_cache']
+        if cache is not None:
+            cache.bump()
+
+    def grow(self, rows):
+        for table in self.tables:
+            missing = rows - self.count(table)
+            if missing > 0:
+                self.insert(table, missing)
+
+
+# Cases: name -> (depends on catalog size, table written to, expected
+# status, setup). setup(bench, requests) returns a function that sends
+# request i.
+def case_health(bench, requests):
+    return lambda i: bench.client.get('/api/health')
+
+
+def case_login(bench, requests):
+    return lambda i: bench.client.post('/api/login', json=ADMIN)
+
+
+def case_login_invalid(bench, requests):
+    return lambda i: bench.client.post('/api/login', json={'email': ADMIN['email'], 'password': 'wrong'})
+
+
+def case_profile(bench, requests):
+    return lambda i: bench.client.get('/api/user/profile', headers=bench.headers)
+
+
+def catalog_case(path, cold):
+    def setup(bench, requests):
+        headers = dict(bench.headers, **{'Accept-Encoding': 'gzip'})
+
+        def send(i):
+            if cold:
+                bench.changed()
+            return bench.client.get(path, headers=headers)
+        if not cold:
+            # Build and cache the listing outside the measurement
+            send(-1)
+        return send
+    return setup
+
+
+def case_add_video(bench, requests):
+    return lambda i: bench.client.post('/api/videos', headers=bench.headers, json={
+        'title': f'Added video {i}', 'description': 'Benchmark upload', 'url': f'/uploads/added_{i}.mp4'
+    })
+
+
+def case_add_music(bench, requests):
+    return lambda i: bench.client.post('/api/music', headers=bench.headers, json={
+        'title': f'Added track {i}', 'artist': 'Benchmark', 'url': f'/uploads/added_{i}.mp3'
+    })
+
+
+def case_profile_image(bench, requests):
+    return lambda i: bench.client.post('/api/user/profile-image', headers=bench.headers,
+                                       data={'file': (io.BytesIO(IMAGE), 'avatar.jpg', 'image/jpeg')})
+
+
+def delete_case(table, path):
+    def setup(bench, requests):
+        # Rows of their own, so the catalog is not drained
+        ids = bench.insert(table, requests)
+        return lambda i: bench.client.delete(f'{path}/{ids[i]}', headers=bench.headers)
+    return setup
+
+
+CASES = {
+    'health': (False, None, 200, case_health),
+    'login': (False, None, 200, case_login),
+    'login_invalid': (False, None, 401, case_login_invalid),
+    'profile': (False, None, 200, case_profile),
+    'videos_cold': (True, None, 200, catalog_case('/api/videos', cold=True)),
+    'videos_warm': (True, None, 200, catalog_case('/api/videos', cold=False)),
+    'music_cold': (True, None, 200, catalog_case('/api/music', cold=True)),
+    'music_warm': (True, None, 200, catalog_case('/api/music', cold=False)),
+    'add_video': (True, 'video', 201, case_add_video),
+    'add_music': (True, 'music', 201, case_add_music),
+    'profile_image': (False, None, 200, case_profile_image),
+    'delete_video': (True, 'video', 200, delete_case('video', '/api/videos')),
+    'delete_music': (True, 'music', 200, delete_case('music', '/api/music')),
+}
+
+
+def run_case(bench, name, args):
+    """One round of a case: ``(latencies, errors, elapsed)``."""
+    _, table, expected, setup = CASES[name]
+    last_id = bench.max_id(table) if table else None
+    send = setup(bench, args.requests)
+    # Leave the garbage of the previous case out of this one
+    gc.collect()
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    while len(latencies) < args.requests and (len(latencies) < args.min_requests
+                                              or time.perf_counter() - started < args.seconds):
+        request_started = time.perf_counter()
+        response = send(len(latencies))
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code != expected:
+            errors += 1
+        response.close()
+    elapsed = time.perf_counter() - started
+
+    if table:
+        bench.delete_above(table, last_id)
+    return latencies, errors, elapsed
+
+
+def summarize(name, rows, rounds):
+    latencies = [latency for round_latencies, _, _ in rounds for latency in round_latencies]
+    round_p50s = [percentile(round_latencies, 0.5) * 1000 for round_latencies, _, _ in rounds]
+    return {
+        'case': name,
+        'rows': rows,
+        'rounds': len(rounds),
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors, _ in rounds),
+        'rps': len(latencies) / sum(elapsed for _, _, elapsed in rounds),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': statistics.median(round_p50s),
+        'round_p50_ms': round_p50s,
+        # Relative range of the round medians: how noisy this case is
+        'spread_pct': (max(round_p50s) - min(round_p50s)) / statistics.median(round_p50s) * 100,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def compare(results, baseline, max_regression, min_samples):
+    """Print the change against a baseline run; return the regressed cases."""
+    previous = {(r['case'], r['rows']): r for r in baseline['results']}
+    regressed = []
+    print(f"\n{'case':<15} {'rows':>8} {'p50 before':>11} {'p50 now':>10} {'change':>8} {'spread':>7} "
+          f"{'rps change':>11}")
+    for result in results:
+        before = previous.get((result['case'], result['rows']))
+        if before is None:
+            continue
+        change = (result['p50_ms'] / before['p50_ms'] - 1) * 100
+        rps_change = (result['rps'] / before['rps'] - 1) * 100
+        # Files written before rounds existed have a single median
+        before_rounds = before.get('round_p50_ms') or [before['p50_ms']]
+        spread = max(result['spread_pct'], before.get('spread_pct', 0))
+        if min(result['requests'], before['requests']) < min_samples:
+            mark = '·  too few samples'
+        elif change > max_regression and min(result['round_p50_ms']) > max(before_rounds):
+            mark = '❌'
+            regressed.append(result)
+        elif change > max_regression:
+            mark = '✅ within noise'
+        else:
+            mark = '✅'
+        print(f"{result['case']:<15} {result['rows'] or '-':>8} {before['p50_ms']:>9.2f}ms {result['p50_ms']:>8.2f}ms "
+              f"{change:>+7.1f}% {spread:>6.0f}% {rps_change:>+10.1f}% {mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Catalog sizes (videos and music each)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per case, interleaved with the other cases')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time budget per case and round')
+    parser.add_argument('--requests', type=int, default=500, help='Most requests per case and round')
+    parser.add_argument('--min-requests', type=int, default=5, help='Fewest requests per case and round')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare with')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Percent slower median latency that fails the comparison')
+    parser.add_argument('--min-samples', type=int, default=15,
+                        help='Fewest requests per case, in this run and the baseline, to judge a change')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix='echoplay-bench-')
+    os.environ.update({
+        'DATABASE_PATH': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'INSTANCE_PATH': os.path.join(workdir, 'instance'),
+        'RATE_LIMIT_STORE': os.path.join(workdir, 'ratelimit.db'),
+        'IDEMPOTENCY_STORE': os.path.join(workdir, 'idempotency.db'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'RATE_LIMIT_ENABLED': 'false',
+        'MAX_CONCURRENT_REQUESTS': '0',
+        'ACCESS_LOG': 'off',
+        'MEMORY_SAMPLE_RATE': '0',
+        'VIDEO_PROCESSING_ENABLED': 'false',
+    })
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    os.environ.pop('DATABASE_REPLICA_URLS', None)
+
+    from app import create_app
+
+    print("=== ENDPOINT BENCHMARK ===")
+    results = []
+    try:
+        app = create_app()
+        app.extensions['init_database']()
+        bench = Bench(app)
+        for index, rows in enumerate(sorted(args.rows)):
+            started = time.perf_counter()
+            bench.grow(rows)
+            print(f"\n{rows} videos and tracks (seeded in {time.perf_counter() - started:.1f}s)")
+            print(f"{'case':<15} {'requests':>8} {'req/s':>9} {'p50':>10} {'spread':>7} {'p90':>10} {'p99':>10} "
+                  f"{'errors':>7}")
+            names = [name for name in args.cases if CASES[name][0] or index == 0]
+            rounds = {name: [] for name in names}
+            for _ in range(args.rounds):
+                for name in names:
+                    rounds[name].append(run_case(bench, name, args))
+            for name in names:
+                result = summarize(name, rows if CASES[name][0] else None, rounds[name])
+                results.append(result)
+                print(f"{name:<15} {result['requests']:>8} {result['rps']:>9.1f} {result['p50_ms']:>8.2f}ms "
+                      f"{result['spread_pct']:>6.0f}% {result['p90_ms']:>8.2f}ms {result['p99_ms']:>8.2f}ms "
+                      f"{result['errors']:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = any(r['errors'] for r in results)
+    if failed:
+        print("\n❌ Some requests returned an unexpected status")
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'settings': {'rounds': args.rounds, 'seconds': args.seconds, 'requests': args.requests,
+                     'min_requests': args.min_requests},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        print(f"\nCompared with {args.baseline} ({baseline.get('revision') or 'unknown revision'})")
+        regressed = compare(results, baseline, args.max_regression, args.min_samples)
+        if regressed:
+            print(f"\n❌ {len(regressed)} case(s) more than {args.max_regression:.0f}% slower, beyond the noise "
+                  "between rounds")
+            failed = True
+        else:
+            print(f"\n✅ No case more than {args.max_regression:.0f}% slower")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
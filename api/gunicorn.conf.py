@@ -0,0 +1,143 @@
+"""gunicorn settings for the EchoPlay API.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden from the environment (see .env.example).
+With ``GUNICORN_PRELOAD=true`` (the default) the master imports the app,
+builds the read-only warm state (catalog snapshots, media signing keys)
+and freezes it out of the garbage collector before forking, so workers
+start instantly and share those pages copy-on-write. Database pools are
+reset in every child, since connections must never cross a fork.
+
+The default worker count is derived from the CPUs this process may use
+(affinity and cgroup quota, not the host's core count) and capped at
+``MAX_DEFAULT_WORKERS``: every worker holds its own catalog and body
+caches, so more workers cost memory on small instances. ``WEB_CONCURRENCY``
+(set by Render and Heroku) or ``GUNICORN_WORKERS`` override it. Unless
+``MAX_CONCURRENT_REQUESTS`` is set, the load-shedding limit defaults to
+workers × threads.
+
+Request metrics from all workers are merged through the files in
+``PROMETHEUS_MULTIPROC_DIR`` (default: instance/prometheus), which is
+emptied when the server starts.
+"""
+import gc
+import math
+import os
+import sys
+
+MAX_DEFAULT_WORKERS = 4
+# Threads per gthread worker beyond the ones the concurrency gate admits
+SHEDDING_THREADS = 2
+
+
+def read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use: affinity, then any cgroup CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # No affinity API on macOS
+        cpus = os.cpu_count() or 1
+    # cgroup v2 ("<quota> <period>" or "max <period>"), else cgroup v1
+    limit = read_first_line('/sys/fs/cgroup/cpu.max')
+    if limit:
+        quota, _, period = limit.partition(' ')
+    else:
+        quota = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    try:
+        if quota and quota != 'max' and int(quota) > 0:
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass
+    return cpus
+
+
+cpu_count = available_cpus()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '5000'))
+
+# 'gthread' overlaps requests that wait on the database or storage;
+# 'sync' is one request per process
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY')
+              or min(cpu_count * 2 + 1 if worker_class == 'sync' else cpu_count + 1, MAX_DEFAULT_WORKERS))
+threads = int(os.environ.get('GUNICORN_THREADS') or (4 if worker_class == 'gthread' else 1))
+
+# The concurrency gate (MAX_CONCURRENT_REQUESTS in app.py) admits as many
+# requests as the workers have threads. Each gthread worker gets spare
+# threads on top, so while every slot is taken further requests are
+# answered with a 503 right away instead of queuing behind busy threads
+if not os.environ.get('MAX_CONCURRENT_REQUESTS'):
+    os.environ['MAX_CONCURRENT_REQUESTS'] = str(workers * threads)
+if worker_class == 'gthread' and os.environ['MAX_CONCURRENT_REQUESTS'] != '0':
+    threads += SHEDDING_THREADS
+
+# Recycle workers periodically to bound slow memory growth; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# The app writes structured JSON access records (see access_log.py);
+# gunicorn's own access log stays off unless GUNICORN_ACCESSLOG is set
+if not os.environ.get('ACCESS_LOG'):
+    os.environ['ACCESS_LOG'] = 'stdout'
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+
+# Must be in the environment before the app imports prometheus_client
+# (an empty value from a .env counts as unset)
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'instance', 'prometheus')
+
+
+def loaded_app():
+    # The app module is only in the master when preload_app is on
+    module = sys.modules.get('app')
+    return getattr(module, 'app', None)
+
+
+def on_starting(server):
+    from metrics import reset_multiprocess_dir
+    reset_multiprocess_dir(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def when_ready(server):
+    app = loaded_app()
+    if app is None:
+        return
+    try:
+        app.extensions['warm_state']()
+        server.log.info('Warm state built in the master')
+    except Exception as e:
+        # e.g. `flask init-db` has not run yet; workers build it lazily
+        server.log.warning('Could not build warm state: %s', e)
+    # Keep the warm objects out of GC passes in the workers: collecting
+    # them would touch their pages and undo the copy-on-write sharing
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    app = loaded_app()
+    if app is not None:
+        app.extensions['dispose_engines'](close=False)
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
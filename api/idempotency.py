@@ -0,0 +1,227 @@
+"""Idempotency keys for POST endpoints.
+
+A client that may retry a request (the mobile app on a flaky network)
+sends an ``Idempotency-Key`` header with a value unique to the operation,
+such as a UUID. The first request with a key runs the handler and its
+response is stored; a retry with the same key gets the stored response
+back without running the handler again, so a retried upload or
+registration neither creates a second row nor hashes the password twice.
+
+Keys are scoped to the caller (the signed-in user, or the email of an
+anonymous registration) and the endpoint. Each entry also holds a digest
+of the request, so reusing a key for a different request is refused
+instead of replaying an unrelated response.
+
+``IdempotencyStore`` keeps entries in a small SQLite database in the
+instance folder, shared by all workers on the host, in one table of
+16-byte digests, zlib-compressed response bodies and the headers the
+handler set. Credentials are not stored: ``Set-Cookie`` is dropped, and
+the app leaves tokens out of the bodies it passes in (see ``idempotent``
+in app.py). Claiming a key and
+finding a stored response is one short write transaction. An entry is
+claimed (in flight) while its handler runs: a concurrent retry gets a
+conflict instead of running the handler a second time. A claim left by a
+crashed worker lapses after ``lock_seconds``. Responses are kept for
+``ttl`` seconds. Server errors are not stored, so the client can retry
+them.
+
+Like the rate limiter, the store fails open: if it is unavailable,
+requests run without idempotency.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Set again on every response, or carrying credentials
+UNSTORED_HEADERS = {'content-type', 'content-length', 'set-cookie'}
+
+# Outcomes of IdempotencyStore.begin
+NEW = 'new'
+REPLAY = 'replay'
+IN_FLIGHT = 'in_flight'
+MISMATCH = 'mismatch'
+UNAVAILABLE = 'unavailable'
+
+
+def digest(*parts):
+    """16-byte digest of ``parts`` (str or bytes)."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        part = part.encode() if isinstance(part, str) else part
+        h.update(len(part).to_bytes(8, 'big'))
+        h.update(part)
+    return h.digest()
+
+
+def valid_key(key):
+    return 0 < len(key) <= MAX_KEY_LENGTH and key.isprintable()
+
+
+def stored_headers(headers):
+    """The ``(name, value)`` pairs of ``headers`` worth replaying."""
+    return [(name, value) for name, value in headers if name.lower() not in UNSTORED_HEADERS]
+
+
+class IdempotencyStore:
+    def __init__(self, path, ttl=86400, lock_seconds=60):
+        self.path = path
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counts = {NEW: 0, REPLAY: 0, IN_FLIGHT: 0, MISMATCH: 0}
+        self.stored = 0
+        self.released = 0
+        self.errors = 0
+        self.begins_since_purge = 0
+
+    def begin(self, scope, key, fingerprint):
+        """Claim ``key`` for a request, or find what an earlier one left.
+
+        Returns ``(outcome, detail)``:
+
+        - ``NEW``: the key is claimed; run the handler, then call
+          ``finish`` or ``release``
+        - ``REPLAY``: ``detail`` is the stored ``(status, mimetype, headers, body)``
+        - ``IN_FLIGHT``: another request holds the key; ``detail`` is the
+          seconds until its claim lapses
+        - ``MISMATCH``: the key was used for a different request
+        - ``UNAVAILABLE``: the store failed; run the handler without it
+        """
+        try:
+            outcome, detail = self._claim(digest(scope, key), fingerprint, time.time())
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+            return UNAVAILABLE, None
+
+        with self.lock:
+            self.counts[outcome] += 1
+            self.begins_since_purge += 1
+            purge = self.begins_since_purge >= 1000
+            if purge:
+                self.begins_since_purge = 0
+        if purge:
+            self.purge()
+        return outcome, detail
+
+    def _claim(self, entry, fingerprint, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT fingerprint, status, mimetype, body, locked_until, headers FROM responses '
+                'WHERE key = ? AND expires > ?', (entry, now)
+            ).fetchone()
+            if row is None or (row[1] is None and row[4] <= now):
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, fingerprint, locked_until, expires) VALUES (?, ?, ?, ?)',
+                    (entry, fingerprint, now + self.lock_seconds, now + self.ttl)
+                )
+                result = NEW, None
+            elif row[0] != fingerprint:
+                result = MISMATCH, None
+            elif row[1] is None:
+                result = IN_FLIGHT, max(math.ceil(row[4] - now), 1)
+            else:
+                headers = [tuple(header) for header in json.loads(row[5] or '[]')]
+                result = REPLAY, (row[1], row[2], headers, zlib.decompress(row[3]))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def finish(self, scope, key, status, mimetype, headers, body):
+        """Store the response of a claimed request for replay.
+
+        ``headers`` are ``(name, value)`` pairs; see ``stored_headers``.
+        """
+        try:
+            conn = self._connection()
+            conn.execute(
+                'UPDATE responses SET status = ?, mimetype = ?, headers = ?, body = ?, locked_until = NULL '
+                'WHERE key = ?',
+                (status, mimetype, json.dumps(stored_headers(headers)), zlib.compress(body), digest(scope, key))
+            )
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+            return
+        with self.lock:
+            self.stored += 1
+
+    def release(self, scope, key):
+        """Drop a claim without storing a response, so a retry runs again."""
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM responses WHERE key = ? AND status IS NULL', (digest(scope, key),))
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+            return
+        with self.lock:
+            self.released += 1
+
+    def purge(self):
+        """Delete expired entries."""
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Waits longer than the rate limiter: failing open here can run a retry twice
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Losing entries in a power cut only costs a re-run of a retry
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key BLOB PRIMARY KEY, fingerprint BLOB NOT NULL, status INTEGER, mimetype TEXT, body BLOB, '
+                'locked_until REAL, expires REAL NOT NULL, headers TEXT'
+                ') WITHOUT ROWID'
+            )
+            # Stores created before headers were kept
+            if 'headers' not in [column[1] for column in conn.execute('PRAGMA table_info(responses)')]:
+                try:
+                    conn.execute('ALTER TABLE responses ADD COLUMN headers TEXT')
+                except sqlite3.OperationalError:
+                    # Another worker added it first
+                    pass
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'claimed': self.counts[NEW],
+                'replayed': self.counts[REPLAY],
+                'in_flight': self.counts[IN_FLIGHT],
+                'mismatched': self.counts[MISMATCH],
+                'stored': self.stored,
+                'released': self.released,
+                'errors': self.errors,
+            }
+        stats['ttl_seconds'] = self.ttl
+        try:
+            stats['entries'] = self._connection().execute(
+                'SELECT count(*) FROM responses WHERE expires > ?', (time.time(),)).fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        return stats
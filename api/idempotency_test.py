@@ -0,0 +1,137 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-idempotency-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'idempotency.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['IDEMPOTENCY_STORE'] = os.path.join(workdir, 'idempotency-keys.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from app import create_app  # type: ignore
+from idempotency import IN_FLIGHT, NEW, REPLAY, IdempotencyStore, digest  # type: ignore
+
+print("=== IDEMPOTENCY KEY TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+client = app.test_client()
+admin = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json
+headers = {'x-access-token': admin['token']}
+video_table = app.extensions['sqlalchemy'].metadata.tables['video']
+
+
+def count_videos():
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        return db.session.query(video_table).count()
+
+
+# Test 1: A retried upload replays the first response
+print("\n1. Testing a retried add_video...")
+before = count_videos()
+video = {'title': 'Retry', 'url': '/uploads/retry.mp4'}
+first = client.post('/api/videos', json=video, headers={**headers, 'Idempotency-Key': 'video-1'})
+retry = client.post('/api/videos', json=video, headers={**headers, 'Idempotency-Key': 'video-1'})
+if (first.status_code == retry.status_code == 201 and first.json == retry.json
+        and retry.headers.get('Idempotent-Replayed') == 'true' and 'Idempotent-Replayed' not in first.headers
+        and count_videos() == before + 1):
+    print(f"   ✅ Replayed video {retry.json['video']['id']}, one row added")
+else:
+    print(f"   ❌ {first.status_code} {retry.status_code} {retry.headers}, rows {before} -> {count_videos()}")
+
+# Test 2: A retried registration skips the password hash and gets a new token
+print("\n2. Testing a retried register...")
+account = {'email': 'retry@example.com', 'password': 'retry-password'}
+started = time.perf_counter()
+first = client.post('/api/register', json=account, headers={'Idempotency-Key': 'register-1'})
+first_seconds = time.perf_counter() - started
+started = time.perf_counter()
+retry = client.post('/api/register', json=account, headers={'Idempotency-Key': 'register-1'})
+retry_seconds = time.perf_counter() - started
+plain = client.post('/api/register', json=account)
+profile = client.get('/api/user/profile', headers={'x-access-token': retry.json['token']})
+with sqlite3.connect(os.environ['IDEMPOTENCY_STORE']) as store_db:
+    stored = [zlib.decompress(body) for (body,) in store_db.execute('SELECT body FROM responses WHERE status = 201')]
+if (first.status_code == retry.status_code == 201 and retry.json['user'] == first.json['user']
+        and profile.status_code == 200 and profile.json['email'] == account['email'] and plain.status_code == 409
+        and not any(first.json['token'].encode() in body for body in stored)):
+    print(f"   ✅ Replayed in {retry_seconds * 1000:.1f} ms (first {first_seconds * 1000:.1f} ms) with a working "
+          f"token; no token stored; without a key: {plain.status_code}")
+else:
+    print(f"   ❌ {first.status_code} {retry.status_code} {profile.status_code} {plain.status_code}")
+
+# Test 3: Reusing a key for another request, or another user, or a bad key
+print("\n3. Testing key scope and validation...")
+other = client.post('/api/videos', json={'title': 'Other', 'url': '/uploads/other.mp4'},
+                    headers={**headers, 'Idempotency-Key': 'video-1'})
+music = client.post('/api/music', json={'title': 'Retry', 'artist': 'A', 'url': '/uploads/retry.mp3'},
+                    headers={**headers, 'Idempotency-Key': 'video-1'})
+invalid = client.post('/api/videos', json=video, headers={**headers, 'Idempotency-Key': 'x' * 300})
+unauthorized = client.post('/api/videos', json=video, headers={'Idempotency-Key': 'video-1'})
+if (other.status_code == 422 and music.status_code == 201 and 'Idempotent-Replayed' not in music.headers
+        and invalid.status_code == 400 and unauthorized.status_code == 401):
+    print("   ✅ Different body 422, other endpoint runs, oversized key 400, no token 401")
+else:
+    print(f"   ❌ {other.status_code} {music.status_code} {invalid.status_code} {unauthorized.status_code}")
+
+# Test 4: Concurrent duplicates run the handler once
+print("\n4. Testing concurrent duplicates...")
+before = count_videos()
+results = []
+barrier = threading.Barrier(8)
+
+
+def send():
+    barrier.wait()
+    response = app.test_client().post('/api/videos', json={'title': 'Race', 'url': '/uploads/race.mp4'},
+                                      headers={**headers, 'Idempotency-Key': 'race-1'})
+    results.append(response.status_code)
+
+
+threads = [threading.Thread(target=send) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+if count_videos() == before + 1 and set(results) <= {201, 409} and results.count(201) >= 1:
+    print(f"   ✅ One row added; statuses {sorted(results)}")
+else:
+    print(f"   ❌ Rows {before} -> {count_videos()}, statuses {sorted(results)}")
+
+# Test 5: Claims lapse, server errors are released, entries expire
+print("\n5. Testing lock lapse and expiry...")
+store = IdempotencyStore(os.path.join(workdir, 'store.db'), ttl=1, lock_seconds=1)
+fingerprint = digest('POST', '/api/videos', b'{}')
+claimed = store.begin('user:1', 'k', fingerprint)[0]
+busy = store.begin('user:1', 'k', fingerprint)[0]
+time.sleep(1.1)
+reclaimed = store.begin('user:1', 'k', fingerprint)[0]
+store.release('user:1', 'k')
+after_release = store.begin('user:1', 'k', fingerprint)[0]
+store.finish('user:1', 'k', 201, 'application/json',
+             [('Location', '/api/videos/1'), ('Set-Cookie', 'session=secret'), ('Content-Length', '12')],
+             b'{"ok": true}')
+replay = store.begin('user:1', 'k', fingerprint)
+time.sleep(1.1)
+expired = store.begin('user:1', 'k', fingerprint)[0]
+stats = client.get('/api/admin/idempotency', headers=headers)
+if ((claimed, busy, reclaimed, after_release, expired) == (NEW, IN_FLIGHT, NEW, NEW, NEW)
+        and replay == (REPLAY, (201, 'application/json', [('Location', '/api/videos/1')], b'{"ok": true}'))
+        and stats.status_code == 200 and stats.json['replayed'] >= 2):
+    print(f"   ✅ Lapsed claim reclaimed, released claim rerun, Location replayed without the cookie, expired entry "
+          f"reclaimed; stats {stats.json}")
+else:
+    print(f"   ❌ {claimed} {busy} {reclaimed} {after_release} {replay} {expired} {stats.status_code}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
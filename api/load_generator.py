@@ -0,0 +1,408 @@
+"""Mixed load against a running server, per scenario.
+
+Starts the API under gunicorn (or uvicorn with asgi.py) against a
+temporary, seeded database, or targets an already running server with
+``--url``. Virtual users are spread over several client processes, each
+running one thread per user with a keep-alive connection, and loop
+through a scenario for ``--duration`` seconds without think time (add
+``--think``):
+
+- login_storm: log in as one of ``--accounts`` regular users
+- browse: fetch the profile, then page through videos or music with
+  ``?limit=`` and the ``X-Next-After`` cursor, a few pages deep
+- media: 256 KiB range requests at random offsets of a large video
+- admin_writes: add a video or track as admin and delete it again
+- mixed: each user picks one of the above per iteration, weighted like
+  real traffic (mostly browsing)
+
+For every scenario and request type it reports throughput, error rate,
+latency percentiles and a latency histogram; ``--json`` writes them.
+
+Servers started here run without rate limits and load shedding, so the
+numbers show capacity; ``--keep-limits`` leaves them on to see how the
+limits behave under the same load.
+
+    python load_generator.py --users 32 --duration 20
+    python load_generator.py --server uvicorn --rows 100000 --scenarios browse media
+    python load_generator.py --url http://localhost:5000 --scenarios login_storm browse
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN = {'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}
+ACCOUNT_PASSWORD = 'load-test-password'
+RANGE_BYTES = 256 * 1024
+# Upper bounds in milliseconds
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+MIXED_WEIGHTS = {'browse': 0.6, 'media': 0.25, 'login_storm': 0.1, 'admin_writes': 0.05}
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Session:
+    """One virtual user's keep-alive connection, recording every request."""
+
+    def __init__(self, host, port, stats, timeout):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, label, method, path, body=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            # Counted as status 0; reconnect for the next request
+            self.close()
+            response, data, status = None, b'', 0
+        latency = time.perf_counter() - started
+
+        entry = self.stats.setdefault(label, {'latencies': [], 'statuses': {}, 'errors': 0})
+        entry['latencies'].append(latency)
+        entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+        if status not in expect:
+            entry['errors'] += 1
+            return None, None
+        return response, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# Scenarios: one iteration of a virtual user
+def login_storm(session, ctx, rng):
+    account = rng.choice(ctx['accounts'])
+    session.request('login', 'POST', '/api/login', {'email': account, 'password': ACCOUNT_PASSWORD})
+
+
+def browse(session, ctx, rng):
+    headers = {'x-access-token': rng.choice(ctx['tokens']), 'Accept-Encoding': 'gzip'}
+    session.request('profile', 'GET', '/api/user/profile', headers=headers)
+    name = 'videos' if rng.random() < 0.7 else 'music'
+    after = 0
+    # Most sessions stop after a page or two, a few scroll far
+    for _ in range(min(int(rng.expovariate(0.4)) + 1, 20)):
+        path = f'/api/{name}?limit={ctx["page_size"]}&after={after}'
+        response, _ = session.request(f'{name} page', 'GET', path, headers=headers)
+        cursor = response.getheader('X-Next-After') if response is not None else None
+        if cursor is None:
+            break
+        after = cursor
+
+
+def media(session, ctx, rng):
+    start = rng.randrange(0, max(ctx['media_size'] - RANGE_BYTES, 1))
+    session.request('range', 'GET', ctx['media_path'],
+                    headers={'Range': f'bytes={start}-{start + RANGE_BYTES - 1}'}, expect=(206,))
+
+
+def admin_writes(session, ctx, rng):
+    headers = {'x-access-token': ctx['admin_token']}
+    number = rng.randrange(10 ** 9)
+    if rng.random() < 0.5:
+        _, data = session.request('add video', 'POST', '/api/videos', {
+            'title': f'Load video {number}', 'description': 'Load test', 'url': f'/uploads/load_{number}.mp4'
+        }, headers, expect=(201,))
+        if data:
+            session.request('delete video', 'DELETE', f"/api/videos/{json.loads(data)['video']['id']}",
+                            headers=headers)
+    else:
+        _, data = session.request('add music', 'POST', '/api/music', {
+            'title': f'Load track {number}', 'artist': 'Load test', 'url': f'/uploads/load_{number}.mp3'
+        }, headers, expect=(201,))
+        if data:
+            session.request('delete music', 'DELETE', f"/api/music/{json.loads(data)['music']['id']}",
+                            headers=headers)
+
+
+def mixed(session, ctx, rng):
+    weights = ctx['weights']
+    name = rng.choices(list(weights), weights=list(weights.values()))[0]
+    SCENARIOS[name](session, ctx, rng)
+
+
+SCENARIOS = {
+    'login_storm': login_storm,
+    'browse': browse,
+    'media': media,
+    'admin_writes': admin_writes,
+    'mixed': mixed,
+}
+
+
+def virtual_user(scenario, ctx, seed, deadline, stats):
+    rng = random.Random(seed)
+    session = Session(ctx['host'], ctx['port'], stats, ctx['timeout'])
+    try:
+        while time.monotonic() < deadline:
+            SCENARIOS[scenario](session, ctx, rng)
+            if ctx['think']:
+                time.sleep(rng.expovariate(1 / ctx['think']))
+    finally:
+        session.close()
+
+
+def client_process(job):
+    """Run ``users`` virtual users in threads; return their merged stats."""
+    scenario, ctx, users, seed, duration = job
+    deadline = time.monotonic() + duration
+    per_user = [{} for _ in range(users)]
+    threads = [threading.Thread(target=virtual_user, args=(scenario, ctx, seed + i, deadline, per_user[i]))
+               for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return merge(per_user)
+
+
+def merge(all_stats):
+    merged = {}
+    for stats in all_stats:
+        for label, entry in stats.items():
+            target = merged.setdefault(label, {'latencies': [], 'statuses': {}, 'errors': 0})
+            target['latencies'].extend(entry['latencies'])
+            target['errors'] += entry['errors']
+            for status, count in entry['statuses'].items():
+                target['statuses'][status] = target['statuses'].get(status, 0) + count
+    return merged
+
+
+def histogram(latencies):
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for latency in latencies:
+        ms = latency * 1000
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if ms <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS] + [f'>{HISTOGRAM_BUCKETS[-1]}ms']
+    return dict(zip(labels, counts))
+
+
+def summarize(label, entry, elapsed):
+    latencies = entry['latencies']
+    return {
+        'request': label,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'errors': entry['errors'],
+        'error_rate': entry['errors'] / len(latencies) if latencies else 0.0,
+        'statuses': {str(status): count for status, count in sorted(entry['statuses'].items())},
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else float('nan'),
+        'histogram': histogram(latencies),
+    }
+
+
+def run_scenario(pool, scenario, ctx, args):
+    processes = min(args.processes, args.users)
+    jobs = [(scenario, ctx, args.users // processes + (1 if i < args.users % processes else 0),
+             args.seed + i * 100000, args.duration) for i in range(processes)]
+    started = time.monotonic()
+    stats = merge(pool.map(client_process, jobs))
+    elapsed = time.monotonic() - started
+    requests = [summarize(label, entry, elapsed) for label, entry in sorted(stats.items())]
+    total = merge([{'total': entry} for entry in stats.values()])['total']
+    return {'scenario': scenario, 'users': args.users, 'seconds': elapsed,
+            'total': summarize('total', total, elapsed), 'requests': requests}
+
+
+def print_scenario(result):
+    print(f"\n{result['scenario']} ({result['users']} users, {result['seconds']:.1f}s)")
+    print(f"{'request':<14} {'requests':>8} {'req/s':>8} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for r in result['requests'] + [result['total']]:
+        print(f"{r['request']:<14} {r['requests']:>8} {r['rps']:>8.1f} {r['error_rate'] * 100:>6.1f}% "
+              f"{r['p50_ms']:>7.1f}ms {r['p90_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms {r['max_ms']:>7.1f}ms")
+    counts = result['total']['histogram']
+    peak = max(counts.values()) or 1
+    for bucket, count in counts.items():
+        if count:
+            print(f"  {bucket:>9} {'#' * max(1, round(count / peak * 40))} {count}")
+    statuses = ', '.join(f'{status}: {count}' for status, count in result['total']['statuses'].items())
+    print(f"  statuses: {statuses}")
+
+
+def wait_for_server(host, port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(args, workdir, port):
+    uploads = os.path.join(workdir, 'uploads')
+    os.makedirs(uploads)
+    with open(os.path.join(uploads, 'load_video.mp4'), 'wb') as f:
+        f.write(os.urandom(1024 * 1024) * args.media_mb)
+    env = dict(os.environ, DATABASE_PATH='sqlite:///' + os.path.join(workdir, 'load.db'), UPLOAD_FOLDER=uploads,
+               INSTANCE_PATH=os.path.join(workdir, 'instance'),
+               RATE_LIMIT_STORE=os.path.join(workdir, 'ratelimit.db'),
+               IDEMPOTENCY_STORE=os.path.join(workdir, 'idempotency.db'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'prometheus'),
+               PROFILE_DIR=os.path.join(workdir, 'profiles'), ACCESS_LOG='off')
+    if not args.keep_limits:
+        env.update(RATE_LIMIT_ENABLED='false', MAX_CONCURRENT_REQUESTS='0')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=API_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    seed(env, args.rows)
+
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+        env.update(GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(args.workers))
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(args.workers), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, '/uploads/load_video.mp4', args.media_mb * 1024 * 1024
+
+
+def seed(env, rows):
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'seed-synthetic', '--users', str(rows // 10),
+                    '--videos', str(rows), '--music', str(rows)], cwd=API_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def prepare(session, ctx, count):
+    """Log in the admin and ``count`` regular accounts, registering them if needed."""
+    _, data = session.request('setup', 'POST', '/api/login', ADMIN)
+    if data is None:
+        raise SystemExit("❌ Admin login failed")
+    ctx['admin_token'] = json.loads(data)['token']
+    for i in range(count):
+        email = f'load-user-{i}@example.com'
+        credentials = {'email': email, 'password': ACCOUNT_PASSWORD}
+        _, data = session.request('setup', 'POST', '/api/register', credentials, expect=(201, 409))
+        if data is not None and b'token' not in data:
+            _, data = session.request('setup', 'POST', '/api/login', credentials)
+        if data is None:
+            raise SystemExit(f"❌ Could not log in {email}")
+        ctx['accounts'].append(email)
+        ctx['tokens'].append(json.loads(data)['token'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Target a running server instead of starting one')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes of the started server')
+    parser.add_argument('--rows', type=int, default=10000, help='Videos and tracks seeded into the started server')
+    parser.add_argument('--keep-limits', action='store_true', help='Leave rate limits and load shedding on')
+    parser.add_argument('--media-mb', type=int, default=64)
+    parser.add_argument('--media-path', help='With --url: a large file to request ranges of, e.g. /uploads/x.mp4')
+    parser.add_argument('--media-size', type=int, help='With --url: size of --media-path in bytes')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Client processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario')
+    parser.add_argument('--think', type=float, default=0.0, help='Mean pause between iterations in seconds')
+    parser.add_argument('--accounts', type=int, default=20, help='Regular users to log in as')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = None
+    server = None
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+        media_path, media_size = args.media_path, args.media_size
+    else:
+        host, port = '127.0.0.1', 5700
+        workdir = tempfile.mkdtemp(prefix='echoplay-load-')
+
+    print("=== LOAD GENERATOR ===")
+    results = []
+    try:
+        if workdir:
+            print(f"Seeding {args.rows} videos and tracks and starting {args.server} with {args.workers} workers...")
+            server, media_path, media_size = start_server(args, workdir, port)
+        if not wait_for_server(host, port, server):
+            raise SystemExit(f"❌ No server answering on {host}:{port}")
+
+        ctx = {'host': host, 'port': port, 'timeout': args.timeout, 'think': args.think,
+               'page_size': args.page_size, 'media_path': media_path, 'media_size': media_size,
+               'weights': dict(MIXED_WEIGHTS), 'accounts': [], 'tokens': []}
+        setup = Session(host, port, {}, args.timeout)
+        prepare(setup, ctx, args.accounts)
+        setup.close()
+
+        scenarios = list(args.scenarios)
+        if not media_path or not media_size:
+            print("Skipping media: pass --media-path and --media-size with --url")
+            scenarios = [s for s in scenarios if s != 'media']
+            ctx['weights'].pop('media')
+        processes = min(args.processes, args.users)
+        print(f"{args.users} users in {processes} client processes, {args.duration:.0f}s per scenario")
+
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            for scenario in scenarios:
+                result = run_scenario(pool, scenario, ctx, args)
+                results.append(result)
+                print_scenario(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'target': args.url or f'{args.server} x{args.workers}', 'results': results}, f, indent=2)
+    failed = [r['scenario'] for r in results if r['total']['errors']]
+    if failed:
+        print(f"\n❌ Errors in: {', '.join(failed)}")
+    else:
+        print("\n✅ No errors")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
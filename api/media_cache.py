@@ -0,0 +1,166 @@
+"""In-memory LRU cache for small files served from /uploads.
+
+Profile images and thumbnails are tiny and requested constantly. Caching
+their bytes together with precomputed validators lets ``uploaded_file``
+answer repeat requests (including conditional 304s and range requests)
+without a stat, open and read per hit.
+
+Entries are revalidated against the file's mtime, size and inode at most
+once every ``revalidate_seconds``; the upload routes also call
+``invalidate`` after writing so the writing worker never serves stale
+bytes. Other workers pick up changes on their next revalidation.
+
+Files too large to cache are remembered for the same interval, so
+requests for them go straight to ``send_file`` without an extra stat here.
+They are counted as bypassed rather than as misses.
+"""
+import mimetypes
+import os
+import stat as stat_module
+import threading
+import time
+from collections import OrderedDict
+from zlib import adler32
+
+
+def file_etag(path, stat):
+    # Same validator format as werkzeug's send_file, so ETags do not
+    # change between cached and uncached responses
+    check = adler32(path.encode()) & 0xFFFFFFFF
+    return f"{stat.st_mtime}-{stat.st_size}-{check}"
+
+
+class CachedFile:
+    __slots__ = ('data', 'etag', 'last_modified', 'mimetype', 'mtime_ns', 'size',
+                 'inode', 'checked_at', 'hits')
+
+    def __init__(self, data, etag, last_modified, mimetype, stat):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.mimetype = mimetype
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.inode = stat.st_ino
+        self.checked_at = time.monotonic()
+        self.hits = 0
+
+    def matches(self, stat):
+        return (stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+                and stat.st_ino == self.inode)
+
+
+class MediaCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_file_size=256 * 1024,
+                 revalidate_seconds=2.0, max_bypassed_paths=10000):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.revalidate_seconds = revalidate_seconds
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # path -> when it was last seen too large to cache
+        self.too_large = OrderedDict()
+        self.max_bypassed_paths = max_bypassed_paths
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def get(self, path):
+        """Return a fresh CachedFile for ``path``, loading it if small enough."""
+        with self.lock:
+            now = time.monotonic()
+            entry = self.entries.get(path)
+            too_large_at = self.too_large.get(path)
+            if entry is not None:
+                if now - entry.checked_at < self.revalidate_seconds:
+                    return self._hit(path, entry)
+            elif too_large_at is not None and now - too_large_at < self.revalidate_seconds:
+                self.bypassed += 1
+                return None
+
+        if entry is not None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.invalidate(path)
+                return None
+            if entry.matches(stat):
+                with self.lock:
+                    entry.checked_at = time.monotonic()
+                    return self._hit(path, entry)
+            self.invalidate(path)
+
+        return self._load(path)
+
+    def _hit(self, path, entry):
+        self.entries.move_to_end(path)
+        entry.hits += 1
+        self.hits += 1
+        return entry
+
+    def _load(self, path):
+        try:
+            stat = os.stat(path)
+            if stat.st_size > self.max_file_size and stat_module.S_ISREG(stat.st_mode):
+                with self.lock:
+                    self.too_large[path] = time.monotonic()
+                    self.too_large.move_to_end(path)
+                    if len(self.too_large) > self.max_bypassed_paths:
+                        self.too_large.popitem(last=False)
+                    self.bypassed += 1
+                return None
+            with self.lock:
+                self.misses += 1
+            if not stat_module.S_ISREG(stat.st_mode):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        if len(data) != stat.st_size:
+            # File changed while reading; let the next request retry
+            return None
+
+        etag = file_etag(path, stat)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        entry = CachedFile(data, etag, stat.st_mtime, mimetype, stat)
+
+        with self.lock:
+            previous = self.entries.pop(path, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            self.entries[path] = entry
+            self.total_bytes += entry.size
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, path):
+        with self.lock:
+            self.too_large.pop(path, None)
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'files': [
+                    {'path': path, 'size': entry.size, 'hits': entry.hits}
+                    for path, entry in sorted(self.entries.items(), key=lambda item: -item[1].hits)
+                ]
+            }
@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-mediacache-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'mediacache.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['IDEMPOTENCY_STORE'] = os.path.join(workdir, 'idempotency.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ['MEDIA_CACHE_MAX_FILE_SIZE'] = str(64 * 1024)
+os.environ['MEDIA_CACHE_REVALIDATE_SECONDS'] = '0.2'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from app import create_app  # type: ignore
+
+print("=== MEDIA CACHE TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+cache = app.extensions['media_cache']
+uploads = os.environ['UPLOAD_FOLDER']
+os.makedirs(uploads, exist_ok=True)
+small = os.urandom(16 * 1024)
+large = os.urandom(512 * 1024)
+with open(os.path.join(uploads, 'thumb.jpg'), 'wb') as f:
+    f.write(small)
+with open(os.path.join(uploads, 'clip.mp4'), 'wb') as f:
+    f.write(large)
+client = app.test_client()
+admin = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json
+headers = {'x-access-token': admin['token']}
+
+# Test 1: Repeat requests are hits
+print("\n1. Testing hits...")
+responses = [client.get('/uploads/thumb.jpg') for _ in range(5)]
+stats = cache.stats()
+if (all(r.status_code == 200 and r.data == small for r in responses) and stats['misses'] == 1
+        and stats['hits'] == 4 and stats['bytes'] == len(small)):
+    print(f"   ✅ 1 miss then 4 hits, {stats['bytes']} bytes cached")
+else:
+    print(f"   ❌ {[r.status_code for r in responses]} {stats}")
+
+# Test 2: Conditional requests
+print("\n2. Testing 304 responses...")
+etag = responses[0].headers['ETag']
+by_etag = client.get('/uploads/thumb.jpg', headers={'If-None-Match': etag})
+by_date = client.get('/uploads/thumb.jpg', headers={'If-Modified-Since': responses[0].headers['Last-Modified']})
+if by_etag.status_code == by_date.status_code == 304 and not by_etag.data and cache.stats()['hits'] == 6:
+    print(f"   ✅ If-None-Match and If-Modified-Since answered from the cache ({etag})")
+else:
+    print(f"   ❌ {by_etag.status_code} {by_date.status_code} {cache.stats()['hits']}")
+
+# Test 3: Range requests
+print("\n3. Testing Range requests...")
+ranged = client.get('/uploads/thumb.jpg', headers={'Range': 'bytes=100-1123'})
+suffix = client.get('/uploads/thumb.jpg', headers={'Range': 'bytes=-10'})
+outside = client.get('/uploads/thumb.jpg', headers={'Range': f'bytes={len(small)}-'})
+if (ranged.status_code == 206 and ranged.data == small[100:1124]
+        and ranged.headers['Content-Range'] == f'bytes 100-1123/{len(small)}'
+        and suffix.status_code == 206 and suffix.data == small[-10:] and outside.status_code == 416):
+    print(f"   ✅ {ranged.headers['Content-Range']}, suffix range, and 416 past the end")
+else:
+    print(f"   ❌ {ranged.status_code} {ranged.headers.get('Content-Range')} {suffix.status_code} "
+          f"{outside.status_code}")
+
+# Test 4: Changed files are revalidated
+print("\n4. Testing revalidation...")
+changed = os.urandom(8 * 1024)
+with open(os.path.join(uploads, 'thumb.jpg'), 'wb') as f:
+    f.write(changed)
+time.sleep(0.3)
+response = client.get('/uploads/thumb.jpg')
+if response.data == changed and response.headers['ETag'] != etag and cache.stats()['bytes'] == len(changed):
+    print("   ✅ New bytes and ETag after the revalidation interval")
+else:
+    print(f"   ❌ Stale: {response.data == small}, {cache.stats()}")
+
+# Test 5: Large files bypass the cache without counting as misses
+print("\n5. Testing files too large to cache...")
+before = cache.stats()
+served = [client.get('/uploads/clip.mp4') for _ in range(3)]
+ranged = client.get('/uploads/clip.mp4', headers={'Range': 'bytes=0-99'})
+after = cache.stats()
+if (all(r.status_code == 200 and r.data == large for r in served) and ranged.data == large[:100]
+        and after['misses'] == before['misses'] and after['bypassed'] == before['bypassed'] + 4
+        and after['bytes'] == before['bytes']):
+    print(f"   ✅ Served from disk, {after['bypassed']} bypassed, misses unchanged at {after['misses']}")
+else:
+    print(f"   ❌ {before} -> {after}")
+
+stats = client.get('/api/admin/media-cache', headers=headers)
+print(f"\n   Admin stats: {stats.status_code} {dict((k, v) for k, v in stats.json.items() if k != 'files')}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,138 @@
+"""HMAC-signed, expiring URLs for files under /uploads.
+
+A signed URL embeds its token in the path rather than the query string::
+
+    /media/<kid>.<user id>.<expires>.<segments>.<signature>/<path>
+
+so relative references inside HLS playlists (variant playlists, segments)
+resolve to URLs that carry the same token. ``segments`` is the number of
+leading path segments the signature covers: all of them for a single file,
+fewer for a directory grant such as an HLS package. Verification is pure
+CPU work (one HMAC) and never touches the database.
+
+Keys are configured as ``kid:secret`` pairs. The first key signs new URLs;
+every listed key verifies, which keeps URLs signed before a rotation valid
+until they expire. An optional third field ``kid:secret:retire_at`` (unix
+time) stops accepting a key after the overlap window.
+"""
+import base64
+import hashlib
+import hmac
+import math
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+MEDIA_PREFIX = '/media/'
+UPLOADS_PREFIX = '/uploads/'
+
+
+class InvalidMediaSignature(Exception):
+    pass
+
+
+def _b64(digest):
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+class MediaSigner:
+    def __init__(self, keys, ttl=3600, bucket=300):
+        # keys: list of (kid, secret bytes, retire_at or None), active key first
+        if not keys:
+            raise ValueError('At least one media signing key is required')
+        self.keys = {kid: (secret, retire_at) for kid, secret, retire_at in keys}
+        # Keyed HMAC states, copied per signature instead of re-deriving the
+        # inner and outer pads from the secret every time
+        self.macs = {kid: hmac.new(secret, digestmod=hashlib.sha256) for kid, secret, _ in keys}
+        self.active_kid = keys[0][0]
+        self.ttl = ttl
+        self.bucket = bucket
+
+    @classmethod
+    def from_config(cls, spec, fallback_secret, ttl=3600):
+        keys = []
+        for entry in (spec or '').split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            parts = entry.split(':')
+            if len(parts) not in (2, 3) or not parts[0] or '.' in parts[0]:
+                raise ValueError('Invalid media signing key entry: %r' % parts[0])
+            retire_at = int(parts[2]) if len(parts) == 3 and parts[2] else None
+            keys.append((parts[0], parts[1].encode('utf-8'), retire_at))
+
+        if not keys:
+            # Derive a dedicated key so media URLs never expose an HMAC
+            # made directly with the JWT secret
+            derived = hmac.new(fallback_secret.encode('utf-8'), b'echoplay-media-signing',
+                               hashlib.sha256).digest()
+            keys.append(('default', derived, None))
+
+        return cls(keys, ttl=ttl)
+
+    def _signature(self, kid, scope, user_id, expires):
+        mac = self.macs[kid].copy()
+        mac.update(('%s\n%s\n%d' % (scope, user_id, expires)).encode('utf-8'))
+        return _b64(mac.digest()[:16])
+
+    def expiry(self, now=None):
+        # Round expiries up to a bucket so repeated listings hand out the
+        # same URLs, which keeps client and CDN caches effective
+        now = time.time() if now is None else now
+        return int(math.ceil((now + self.ttl) / self.bucket) * self.bucket)
+
+    def token(self, path, user_id, directory=False, expires=None):
+        segments = path.strip('/').split('/')
+        if directory:
+            segments = segments[:-1]
+        scope = '/'.join(segments) + ('/' if directory else '')
+        expires = self.expiry() if expires is None else expires
+        signature = self._signature(self.active_kid, scope, user_id, expires)
+        return '%s.%s.%d.%d.%s' % (self.active_kid, user_id, expires, len(segments), signature)
+
+    def sign_url(self, url, user_id, directory=False, host=None):
+        """Rewrite an /uploads URL into a signed /media URL.
+
+        URLs on other hosts and non-upload URLs are returned unchanged.
+        """
+        if not url:
+            return url
+        parts = urlsplit(url)
+        if parts.netloc and host and parts.netloc != host:
+            return url
+        if not parts.path.startswith(UPLOADS_PREFIX):
+            return url
+
+        path = parts.path[len(UPLOADS_PREFIX):]
+        token = self.token(path, user_id, directory=directory)
+        return urlunsplit((parts.scheme, parts.netloc, MEDIA_PREFIX + token + '/' + path,
+                           parts.query, parts.fragment))
+
+    def verify(self, token, path, now=None):
+        """Check ``token`` against the requested file path; return the user id."""
+        try:
+            kid, user_id, expires, count, signature = token.split('.')
+            expires = int(expires)
+            count = int(count)
+        except ValueError:
+            raise InvalidMediaSignature('Malformed media token')
+
+        now = time.time() if now is None else now
+        if expires < now:
+            raise InvalidMediaSignature('Media URL has expired')
+
+        key = self.keys.get(kid)
+        if key is None or (key[1] is not None and key[1] < now):
+            raise InvalidMediaSignature('Unknown media signing key')
+
+        segments = path.strip('/').split('/')
+        if '..' in segments:
+            raise InvalidMediaSignature('Invalid media path')
+        if count < 1 or count > len(segments):
+            raise InvalidMediaSignature('Media URL does not cover this path')
+        scope = '/'.join(segments[:count]) + ('/' if count < len(segments) else '')
+
+        expected = self._signature(kid, scope, user_id, expires)
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidMediaSignature('Invalid media signature')
+
+        return user_id
@@ -0,0 +1,112 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-signing-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'signing.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['IDEMPOTENCY_STORE'] = os.path.join(workdir, 'idempotency.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from media_signing import InvalidMediaSignature, MediaSigner  # type: ignore
+
+
+def rejects(signer, token, path, now=None):
+    try:
+        signer.verify(token, path, now=now)
+    except InvalidMediaSignature as e:
+        return str(e)
+    return None
+
+
+print("=== MEDIA SIGNING TEST ===")
+signer = MediaSigner.from_config('k1:first-secret', 'unused', ttl=600)
+
+# Test 1: Sign and verify
+print("\n1. Testing sign and verify...")
+url = signer.sign_url('/uploads/video_1.mp4', '7')
+token, path = url[len('/media/'):].split('/', 1)
+tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+if (path == 'video_1.mp4' and signer.verify(token, path) == '7' and rejects(signer, tampered, path)
+        and rejects(signer, token.replace('.7.', '.8.'), path) and rejects(signer, token, 'video_2.mp4')):
+    print(f"   ✅ {url} verifies; tampered signature, user and path are refused")
+else:
+    print(f"   ❌ {url}")
+
+# Test 2: Expiry, rounded up to a bucket so repeated listings share URLs
+print("\n2. Testing expiry...")
+expires = int(token.split('.')[2])
+same = signer.sign_url('/uploads/video_1.mp4', '7') == url
+expired = rejects(signer, token, path, now=expires + 1)
+if same and expires % signer.bucket == 0 and expires >= time.time() + 600 and expired == 'Media URL has expired':
+    print(f"   ✅ Expires in {expires - time.time():.0f}s; refused afterwards: {expired}")
+else:
+    print(f"   ❌ Same URL: {same}, expires {expires}, after expiry: {expired}")
+
+# Test 3: Directory grants cover the package, file grants only the file
+print("\n3. Testing directory versus file scope...")
+hls = signer.sign_url('/uploads/hls/3/master.m3u8', '7', directory=True)
+hls_token = hls[len('/media/'):].split('/', 1)[0]
+file_token = signer.token('hls/3/master.m3u8', '7')
+covered = [signer.verify(hls_token, p) for p in ('hls/3/master.m3u8', 'hls/3/720p/segment_0001.ts')]
+outside = rejects(signer, hls_token, 'hls/4/master.m3u8')
+file_only = rejects(signer, file_token, 'hls/3/720p/index.m3u8')
+if covered == ['7', '7'] and outside and file_only:
+    print(f"   ✅ Package token covers segments; other packages: {outside}; file token: {file_only}")
+else:
+    print(f"   ❌ Covered {covered}, outside {outside}, file token {file_only}")
+
+# Test 4: Path traversal
+print("\n4. Testing .. rejection...")
+traversal = [rejects(signer, hls_token, p) for p in ('hls/3/../4/master.m3u8', 'hls/3/../../signing.db')]
+if traversal == ['Invalid media path'] * 2:
+    print("   ✅ Paths with .. are refused before the signature is checked")
+else:
+    print(f"   ❌ {traversal}")
+
+# Test 5: Key rotation
+print("\n5. Testing key rotation...")
+retire_at = int(time.time()) + 60
+rotated = MediaSigner.from_config(f'k2:second-secret,k1:first-secret:{retire_at}', 'unused', ttl=600)
+new_token = rotated.token('video_1.mp4', '7')
+old_accepted = rotated.verify(token, path) == '7'
+old_retired = rejects(rotated, token, path, now=retire_at + 1)
+new_on_old = rejects(signer, new_token, path)
+if new_token.startswith('k2.') and old_accepted and old_retired and new_on_old:
+    print(f"   ✅ New URLs use k2, k1 URLs accepted until retired ({old_retired}); "
+          f"old config refuses k2: {new_on_old}")
+else:
+    print(f"   ❌ {new_token}, old accepted {old_accepted}, retired {old_retired}, k2 on old {new_on_old}")
+
+# Test 6: The /media route
+print("\n6. Testing the /media route...")
+from app import create_app  # type: ignore
+
+app = create_app()
+app.extensions['init_database']()
+os.makedirs(os.environ['UPLOAD_FOLDER'], exist_ok=True)
+with open(os.path.join(os.environ['UPLOAD_FOLDER'], 'clip.mp4'), 'wb') as f:
+    f.write(os.urandom(4096))
+client = app.test_client()
+admin = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json
+user = client.post('/api/register', json={'email': 'signing@example.com', 'password': 'signing-password'}).json
+signed = app.extensions['media_signer'].sign_url('/uploads/clip.mp4', str(admin['user']['id']))
+statuses = (
+    client.get(signed).status_code,
+    client.get(signed, headers={'x-access-token': admin['token']}).status_code,
+    client.get(signed, headers={'x-access-token': user['token']}).status_code,
+    client.get(signed.replace('clip.mp4', 'other.mp4')).status_code,
+)
+if statuses == (200, 200, 403, 403):
+    print(f"   ✅ Signed URL served, other user's JWT and other file refused: {statuses}")
+else:
+    print(f"   ❌ {statuses}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,172 @@
+"""tracemalloc snapshots and per-route allocation sampling.
+
+tracemalloc is per process, so everything here describes the worker that
+served the admin request (its pid is in every report).
+
+Admins start tracing with ``start(frames)``, take snapshots while the
+worker serves traffic, and compare any two of them to find the code whose
+allocations grew. Tracing makes allocations noticeably slower and uses
+memory for the traces, so it stays off until started and should be
+stopped again afterwards.
+
+Independently, a fraction of requests can be sampled. For each sampled
+request tracing runs, with one frame, only for the duration of that
+request, and its peak allocation is recorded per route. Other threads of
+the worker allocate during that window too, so under gthread a sample is
+an upper bound for the route. Sampling is skipped while an admin is
+tracing, and only one request per worker is sampled at a time.
+"""
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+GROUPINGS = ('lineno', 'filename', 'traceback')
+
+# Allocations made by tracemalloc itself and the import machinery
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class TracingError(Exception):
+    pass
+
+
+def _site(traceback, group):
+    if group == 'traceback':
+        return [str(frame) for frame in traceback]
+    if group == 'filename':
+        return traceback[0].filename
+    return str(traceback[0])
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class MemoryTracer:
+    def __init__(self, sample_rate=0.0, keep_snapshots=5):
+        self.sample_rate = sample_rate
+        self.keep_snapshots = keep_snapshots
+        self.lock = threading.Lock()
+        self.tracing = False
+        self.sampling = False
+        self.frames = 0
+        self.snapshots = OrderedDict()
+        self.next_snapshot = 1
+        self.routes = {}
+
+    # Admin tracing
+    def start(self, frames=10):
+        with self.lock:
+            # A running request sample is abandoned; see sample_end
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.sampling = False
+            tracemalloc.start(frames)
+            self.tracing = True
+            self.frames = frames
+            self.snapshots.clear()
+
+    def stop(self):
+        with self.lock:
+            if self.tracing:
+                tracemalloc.stop()
+            self.tracing = False
+            self.snapshots.clear()
+
+    def snapshot(self, limit=20, group='lineno'):
+        with self.lock:
+            if not self.tracing:
+                raise TracingError('tracemalloc is not running')
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            snapshot_id = self.next_snapshot
+            self.next_snapshot += 1
+            self.snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self.snapshots) > self.keep_snapshots:
+                self.snapshots.popitem(last=False)
+        return {'id': snapshot_id, 'top': self.top(snapshot, limit, group)}
+
+    def top(self, snapshot, limit=20, group='lineno'):
+        return [{'site': _site(stat.traceback, group), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics(group)[:limit]]
+
+    def diff(self, first_id, second_id, limit=20, group='lineno'):
+        """Allocation sites that grew the most from one snapshot to another."""
+        with self.lock:
+            try:
+                first = self.snapshots[first_id][1]
+                second = self.snapshots[second_id][1]
+            except KeyError:
+                raise TracingError('Unknown snapshot') from None
+        return [{
+            'site': _site(stat.traceback, group),
+            'size_diff_bytes': stat.size_diff,
+            'size_bytes': stat.size,
+            'count_diff': stat.count_diff,
+            'count': stat.count,
+        } for stat in second.compare_to(first, group)[:limit]]
+
+    # Per-request sampling
+    def sample_begin(self):
+        """Start measuring the current request; False if it is not sampled."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        with self.lock:
+            # Also leave tracing started with PYTHONTRACEMALLOC alone
+            if self.tracing or self.sampling or tracemalloc.is_tracing():
+                return False
+            self.sampling = True
+            tracemalloc.start(1)
+        return True
+
+    def sample_end(self, route):
+        """Peak bytes allocated by the sampled request, or None if abandoned."""
+        with self.lock:
+            if not self.sampling:
+                return None
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.sampling = False
+            stats = self.routes.setdefault(route, {'samples': 0, 'max_peak_bytes': 0, 'last_peak_bytes': 0})
+            stats['samples'] += 1
+            stats['max_peak_bytes'] = max(stats['max_peak_bytes'], peak)
+            stats['last_peak_bytes'] = peak
+        return peak
+
+    def stats(self):
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else None
+        with self.lock:
+            traced, peak = tracemalloc.get_traced_memory() if self.tracing else (0, 0)
+            return {
+                'pid': os.getpid(),
+                'rss_bytes': rss_bytes(),
+                'max_rss_bytes': max_rss,
+                'tracing': self.tracing,
+                'frames': self.frames if self.tracing else 0,
+                'traced_bytes': traced,
+                'traced_peak_bytes': peak,
+                'tracemalloc_overhead_bytes': tracemalloc.get_tracemalloc_memory() if self.tracing else 0,
+                'snapshots': [{'id': snapshot_id, 'taken_at': taken_at}
+                              for snapshot_id, (taken_at, _) in self.snapshots.items()],
+                'sample_rate': self.sample_rate,
+                'routes': dict(self.routes),
+            }
@@ -0,0 +1,76 @@
+import base64
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-memory-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'memory.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['MEMORY_SAMPLE_RATE'] = '1'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from app import create_app  # type: ignore
+
+print("=== MEMORY INSTRUMENTATION TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+client = app.test_client()
+response = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'})
+headers = {'x-access-token': response.json['token']}
+
+# Test 1: Snapshots need tracing
+print("\n1. Testing a snapshot without tracing...")
+response = client.post('/api/admin/memory/snapshots', headers=headers)
+if response.status_code == 409:
+    print("   ✅ Refused with 409 while tracemalloc is off")
+else:
+    print(f"   ❌ Status: {response.status_code}")
+
+# Test 2: Diff two snapshots around a growing catalog
+print("\n2. Testing a snapshot diff...")
+client.post('/api/admin/memory/tracemalloc', json={'action': 'start', 'frames': 5}, headers=headers)
+first = client.post('/api/admin/memory/snapshots', headers=headers).json['id']
+for i in range(300):
+    client.post('/api/videos', json={'title': f'Video {i}', 'description': 'x' * 200,
+                                     'url': f'https://example.com/{i}.mp4'}, headers=headers)
+# The listing is kept in the catalog cache
+client.get('/api/videos', headers=headers)
+second = client.post('/api/admin/memory/snapshots', headers=headers).json['id']
+diff = client.get(f'/api/admin/memory/snapshots/{first}/diff/{second}?group=filename&limit=10', headers=headers).json
+grown = [site for site in diff['sites'] if site['size_diff_bytes'] > 0]
+if grown and any(site['site'].endswith('catalog_cache.py') for site in grown):
+    print(f"   ✅ Top growth: {os.path.basename(grown[0]['site'])} +{grown[0]['size_diff_bytes'] // 1024} KiB")
+else:
+    print(f"   ❌ Diff: {diff}")
+
+# Test 3: Requests are not sampled while an admin traces
+print("\n3. Testing sampling is paused while tracing...")
+client.get('/api/health', headers=headers)
+routes = client.get('/api/admin/memory', headers=headers).json['routes']
+client.post('/api/admin/memory/tracemalloc', json={'action': 'stop'}, headers=headers)
+if '/api/health' not in routes:
+    print("   ✅ No samples while tracing")
+else:
+    print(f"   ❌ Routes: {routes}")
+
+# Test 4: Per-route peak allocation
+print("\n4. Testing per-route peak allocation...")
+image = 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(2 * 1024 * 1024)).decode()
+client.post('/api/user/profile-image', json={'image': image}, headers=headers)
+client.get('/api/health')
+routes = client.get('/api/admin/memory', headers=headers).json['routes']
+upload = routes.get('/api/user/profile-image', {}).get('max_peak_bytes', 0)
+health = routes.get('/api/health', {}).get('max_peak_bytes', 0)
+metrics = client.get('/metrics', headers=headers).get_data(as_text=True)
+if upload > 2 * 1024 * 1024 and health < 256 * 1024 and 'echoplay_http_request_peak_alloc_bytes_count' in metrics:
+    print(f"   ✅ Profile upload peaked at {upload / 2 ** 20:.1f} MiB, health at {health / 1024:.0f} KiB")
+else:
+    print(f"   ❌ Upload: {upload}, health: {health}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
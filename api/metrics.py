@@ -0,0 +1,100 @@
+"""Prometheus request metrics.
+
+Every request is counted by method, route and status, timed into a
+latency histogram, and tracked in an in-progress gauge while it runs.
+Requests sampled by memory.py also report their peak allocation.
+Routes are labelled with their URL rule (``/api/music/<int:music_id>``),
+not the raw path, so the number of series stays bounded.
+
+gunicorn workers are separate processes, so a scrape served by one
+worker would only see its own requests. When ``PROMETHEUS_MULTIPROC_DIR``
+is set, which gunicorn.conf.py does by default, prometheus_client's
+multiprocess mode is used: each worker writes its samples to
+memory-mapped files in that directory, and ``render`` merges the files
+of all workers, including ones that have exited, at scrape time. Without
+the variable the metrics only cover the current process, which is right
+for the development server.
+
+The variable must be set before prometheus_client is first imported.
+"""
+import os
+
+# prometheus_client switches to multiprocess mode when the variable merely
+# exists; an empty value from a .env must mean single-process instead
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 16 KiB to 256 MiB in powers of 4
+ALLOCATION_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(8))
+
+
+def multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.directory = multiprocess_dir()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # Samples go to the worker's files; render() collects them
+            registry = None
+        else:
+            registry = self.registry = CollectorRegistry()
+
+        self.requests = Counter(
+            'echoplay_http_requests_total', 'HTTP requests handled',
+            ['method', 'route', 'status'], registry=registry
+        )
+        self.latency = Histogram(
+            'echoplay_http_request_duration_seconds', 'Time from routing to the response being ready',
+            ['method', 'route'], buckets=LATENCY_BUCKETS, registry=registry
+        )
+        self.in_progress = Gauge(
+            'echoplay_http_requests_in_progress', 'HTTP requests being handled',
+            ['method', 'route'], multiprocess_mode='livesum', registry=registry
+        )
+        self.peak_alloc = Histogram(
+            'echoplay_http_request_peak_alloc_bytes', 'Peak Python memory allocated by sampled requests',
+            ['method', 'route'], buckets=ALLOCATION_BUCKETS, registry=registry
+        )
+
+    def started(self, method, route):
+        self.in_progress.labels(method, route).inc()
+
+    def finished(self, method, route, status, seconds):
+        self.requests.labels(method, route, str(status)).inc()
+        self.latency.labels(method, route).observe(seconds)
+
+    def allocated(self, method, route, peak_bytes):
+        self.peak_alloc.labels(method, route).observe(peak_bytes)
+
+    def ended(self, method, route):
+        self.in_progress.labels(method, route).dec()
+
+    def render(self):
+        """Return ``(body, content_type)`` in the Prometheus text format."""
+        if self.directory:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=self.directory)
+        else:
+            registry = self.registry
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir(directory):
+    """Remove the sample files left by a previous server run."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.db'):
+            os.remove(os.path.join(directory, name))
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of an exited worker; its counters are kept."""
+    if multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
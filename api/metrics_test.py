@@ -0,0 +1,131 @@
+"""Check /metrics against a multi-worker gunicorn server.
+
+Starts the API under gunicorn.conf.py with three workers on a fresh
+SQLite database (port 5055), sends a known number of requests, and
+checks that the scrape adds up across workers and requires auth.
+
+    python metrics_test.py
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_URL = 'http://127.0.0.1:5055'
+METRICS_TOKEN = 'scrape-secret'
+
+# Disable proxy for localhost requests
+proxies = {
+    "http": "",
+    "https": "",
+}
+
+
+def sample(text, name, **labels):
+    total = 0.0
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)\{(.*)\} (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        if all(found.get(key) == value for key, value in labels.items()):
+            total += float(match.group(3))
+    return total
+
+
+def overhead_per_request(runs=20000):
+    code = (
+        'import time; from metrics import RequestMetrics; m = RequestMetrics(); t = time.perf_counter()\n'
+        f'for _ in range({runs}):\n'
+        '    m.started("GET", "/api/videos"); m.finished("GET", "/api/videos", 200, 0.01); m.ended("GET", "/api/videos")\n'
+        f'print((time.perf_counter() - t) / {runs})'
+    )
+    directory = tempfile.mkdtemp(prefix='echoplay-metrics-overhead-')
+    try:
+        output = subprocess.run([sys.executable, '-c', code], cwd=API_DIR,
+                                env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory),
+                                check=True, capture_output=True, text=True).stdout
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return float(output)
+
+
+if __name__ == '__main__':
+    print("=== METRICS TEST ===")
+    workdir = tempfile.mkdtemp(prefix='echoplay-metrics-')
+    env = dict(os.environ, DATABASE_PATH='sqlite:///' + os.path.join(workdir, 'metrics.db'),
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'), RATE_LIMIT_ENABLED='false', METRICS_TOKEN=METRICS_TOKEN,
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'prometheus'),
+               GUNICORN_BIND='127.0.0.1:5055', GUNICORN_WORKERS='3')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=API_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=API_DIR,
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                requests.get(BASE_URL + '/api/health', proxies=proxies, timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.2)
+
+        session = requests.Session()
+        session.proxies.update(proxies)
+
+        # Test 1: Auth
+        print("\n1. Testing /metrics access...")
+        anonymous = session.get(BASE_URL + '/metrics').status_code
+        wrong = session.get(BASE_URL + '/metrics', headers={'Authorization': 'Bearer nope'}).status_code
+        token = session.post(BASE_URL + '/api/login',
+                             json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json()['token']
+        admin = session.get(BASE_URL + '/metrics', headers={'x-access-token': token}).status_code
+        if anonymous == 401 and wrong == 401 and admin == 200:
+            print("   ✅ Refused without credentials, served to the admin")
+        else:
+            print(f"   ❌ Anonymous: {anonymous}, wrong token: {wrong}, admin: {admin}")
+
+        # Test 2: Counts add up across workers (new connections spread over them)
+        print("\n2. Testing aggregation across 3 workers...")
+        for _ in range(60):
+            requests.get(BASE_URL + '/api/music/12345/beats', headers={'x-access-token': token}, proxies=proxies)
+        for _ in range(15):
+            requests.get(BASE_URL + '/api/no-such-route', proxies=proxies)
+        scrape = session.get(BASE_URL + '/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+        text = scrape.text
+        beats = sample(text, 'echoplay_http_requests_total', route='/api/music/<int:music_id>/beats', status='404')
+        unmatched = sample(text, 'echoplay_http_requests_total', route='unmatched', status='404')
+        observed = sample(text, 'echoplay_http_request_duration_seconds_count', route='/api/music/<int:music_id>/beats')
+        pids = len([name for name in os.listdir(env['PROMETHEUS_MULTIPROC_DIR']) if name.startswith('counter_')])
+        if beats == 60 and unmatched == 15 and observed == 60:
+            print(f"   ✅ 60 + 15 requests counted by route template, written by {pids} processes")
+        else:
+            print(f"   ❌ Counted {beats} beats, {unmatched} unmatched, {observed} timed")
+
+        # Test 3: The in-progress gauge counts the scrape itself
+        print("\n3. Testing the in-progress gauge...")
+        in_progress = sample(text, 'echoplay_http_requests_in_progress', route='/metrics')
+        if in_progress == 1:
+            print("   ✅ 1 request in progress during the scrape")
+        else:
+            print(f"   ❌ In progress: {in_progress}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Test 4: Overhead
+    print("\n4. Testing per-request overhead...")
+    seconds = overhead_per_request()
+    if seconds < 100e-6:
+        print(f"   ✅ {seconds * 1e6:.1f}µs of metrics work per request")
+    else:
+        print(f"   ❌ {seconds * 1e6:.1f}µs of metrics work per request")
+
+    print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,233 @@
+"""On-demand profiling of single requests.
+
+An admin sends ``X-Profile: sample`` (or ``X-Profile: cprofile``) with a
+request, and only that request runs under the profiler:
+
+- ``sample``: a background thread records the request thread's stack
+  every ``interval`` seconds. This mode is cheap enough for slow
+  production requests. It is saved as speedscope JSON (open it at
+  https://www.speedscope.app) and as a pstats file estimated from the
+  samples.
+- ``cprofile``: the deterministic cProfile profiler, which measures every
+  call exactly but slows the request down noticeably. It is saved as
+  pstats (``python -m pstats``, snakeviz).
+
+Captures go to a spool directory that keeps the newest ``max_captures``.
+Requests without the header only pay for one header lookup.
+"""
+import cProfile
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+MODES = ('sample', 'cprofile')
+FORMATS = {
+    'pstats': '.pstats',
+    'speedscope': '.speedscope.json',
+}
+
+
+def _frame_key(code):
+    return code.co_filename, code.co_firstlineno, getattr(code, 'co_qualname', code.co_name)
+
+
+class Sampler:
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            # Weight each sample by the time since the previous one; under
+            # load the sampler can wake up late
+            self.samples.append((stack, now - last))
+            last = now
+
+    def speedscope(self, name):
+        frames = []
+        index = {}
+        samples = []
+        for stack, _ in self.samples:
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({'name': key[2], 'file': key[0], 'line': key[1]})
+                ids.append(index[key])
+            samples.append(ids)
+        weights = [weight for _, weight in self.samples]
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+            'name': name,
+            'exporter': 'echoplay',
+        }
+
+    def pstats(self):
+        """The samples in marshal'd pstats layout, with estimated times.
+
+        Call counts are the number of samples a function appears in; they
+        are not real call counts.
+        """
+        stats = {}
+
+        def entry(key):
+            if key not in stats:
+                stats[key] = [0, 0, 0.0, 0.0, {}]
+            return stats[key]
+
+        for stack, weight in self.samples:
+            if not stack:
+                continue
+            entry(stack[-1])[2] += weight
+            seen = set()
+            for depth, key in enumerate(stack):
+                if key in seen:
+                    continue
+                seen.add(key)
+                function = entry(key)
+                function[0] += 1
+                function[1] += 1
+                function[3] += weight
+                if depth:
+                    caller = function[4].get(stack[depth - 1], (0, 0, 0.0, 0.0))
+                    own = weight if depth == len(stack) - 1 else 0.0
+                    function[4][stack[depth - 1]] = (caller[0] + 1, caller[1] + 1, caller[2] + own, caller[3] + weight)
+        return {key: (cc, nc, tt, ct, callers) for key, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+class RequestProfile:
+    def __init__(self, mode, interval=0.001):
+        if mode not in MODES:
+            raise ValueError(f'Unknown profile mode: {mode!r}')
+        self.mode = mode
+        self.interval = interval
+        self.profiler = None
+        self.sampler = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = Sampler(threading.get_ident(), self.interval)
+            self.sampler.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+
+    def files(self, name):
+        """``{format: bytes}`` for the capture."""
+        if self.profiler is not None:
+            self.profiler.create_stats()
+            return {'pstats': marshal.dumps(self.profiler.stats)}
+        return {
+            'pstats': marshal.dumps(self.sampler.pstats()),
+            'speedscope': json.dumps(self.sampler.speedscope(name)).encode(),
+        }
+
+
+class ProfileSpool:
+    ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[A-Za-z0-9_.]+-[0-9a-f]{8}$')
+
+    def __init__(self, directory, max_captures=50):
+        self.directory = directory
+        self.max_captures = max_captures
+        self.lock = threading.Lock()
+
+    def save(self, profile, info):
+        endpoint = re.sub(r'[^A-Za-z0-9_.]', '_', info.get('endpoint') or 'unmatched')
+        capture_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        files = profile.files(f"{info.get('method')} {info.get('path')}")
+        info = dict(info, id=capture_id, mode=profile.mode, duration_ms=round(profile.duration * 1000, 2),
+                    formats=sorted(files), created_at=time.time())
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for fmt, data in files.items():
+                self._write(capture_id + FORMATS[fmt], data)
+            # The metadata goes last: a capture is listed once it is complete
+            self._write(capture_id + '.json', json.dumps(info).encode())
+            self._prune()
+        return capture_id
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def _prune(self):
+        captures = self.list()
+        for info in captures[self.max_captures:]:
+            for suffix in list(FORMATS.values()) + ['.json']:
+                try:
+                    os.remove(os.path.join(self.directory, info['id'] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        """Metadata of the saved captures, newest first."""
+        captures = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if not name.endswith('.json') or name.endswith(FORMATS['speedscope']):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        captures.sort(key=lambda info: info['created_at'], reverse=True)
+        return captures
+
+    def file_name(self, capture_id, fmt):
+        """File name of a capture in the spool, or None."""
+        if fmt not in FORMATS or not self.ID_PATTERN.match(capture_id):
+            return None
+        name = capture_id + FORMATS[fmt]
+        return name if os.path.exists(os.path.join(self.directory, name)) else None
@@ -0,0 +1,128 @@
+import json
+import marshal
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-profiling-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'profiling.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['PROFILE_DIR'] = os.path.join(workdir, 'profiles')
+os.environ['PROFILE_MAX_CAPTURES'] = '3'
+
+from sqlalchemy import event
+
+from app import create_app  # type: ignore
+from profiling import RequestProfile  # type: ignore
+
+print("=== REQUEST PROFILER TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+client = app.test_client()
+response = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'})
+admin_headers = {'x-access-token': response.json['token']}
+response = client.post('/api/register', json={'email': 'listener@example.com', 'password': 'secret'})
+listener_headers = {'x-access-token': response.json['token']}
+for i in range(50):
+    client.post('/api/videos', json={'title': f'Video {i}', 'url': f'https://example.com/{i}.mp4'},
+                headers=admin_headers)
+
+# Test 1: Only admins can trigger a profile
+print("\n1. Testing who can profile...")
+listener = client.get('/api/videos', headers=dict(listener_headers, **{'X-Profile': 'sample'}))
+plain = client.get('/api/videos', headers=listener_headers)
+if listener.status_code == 403 and plain.status_code == 200 and 'X-Profile-Id' not in plain.headers:
+    print("   ✅ Refused for a listener, no capture without the header")
+else:
+    print(f"   ❌ Listener: {listener.status_code}, plain request: {plain.status_code}")
+
+# Test 2: Sampling profile
+print("\n2. Testing a sampled profile...")
+response = client.get('/api/videos', headers=dict(admin_headers, **{'X-Profile': 'sample'}))
+capture_id = response.headers.get('X-Profile-Id')
+speedscope = client.get(f'/api/admin/profiles/{capture_id}/speedscope', headers=admin_headers)
+sampled_stats = client.get(f'/api/admin/profiles/{capture_id}/pstats', headers=admin_headers)
+try:
+    profile = json.loads(speedscope.data)['profiles'][0]
+    marshal.loads(sampled_stats.data)
+    valid = response.status_code == 200 and profile['type'] == 'sampled'
+except (ValueError, KeyError, EOFError):
+    valid = False
+if valid:
+    print(f"   ✅ {capture_id}: speedscope and pstats downloaded")
+else:
+    print(f"   ❌ Capture {capture_id}: {speedscope.status_code}, {sampled_stats.status_code}")
+
+# Test 3: The sampler finds the hot function
+print("\n3. Testing the sampler on a busy loop...")
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+profile = RequestProfile('sample', interval=0.001)
+profile.start()
+busy_loop(0.2)
+profile.stop()
+hot = max(profile.sampler.pstats().items(), key=lambda item: item[1][2])[0]
+if len(profile.sampler.samples) >= 20 and hot[2] == 'busy_loop':
+    print(f"   ✅ {len(profile.sampler.samples)} samples, most self time in {hot[2]}")
+else:
+    print(f"   ❌ {len(profile.sampler.samples)} samples, most self time in {hot}")
+
+# Test 4: Deterministic profile
+print("\n4. Testing a cProfile capture...")
+response = client.get('/api/videos', headers=dict(admin_headers, **{'X-Profile': 'cprofile'}))
+capture_id = response.headers.get('X-Profile-Id')
+download = client.get(f'/api/admin/profiles/{capture_id}/pstats', headers=admin_headers)
+path = os.path.join(workdir, 'capture.pstats')
+with open(path, 'wb') as f:
+    f.write(download.data)
+functions = {name for _, _, name in pstats.Stats(path).stats}
+if 'get_videos' in functions and 'catalog_response' in functions:
+    print(f"   ✅ {capture_id}: {len(functions)} functions, including get_videos")
+else:
+    print(f"   ❌ Capture {capture_id}: {download.status_code}")
+
+# Test 5: Bounded spool and listing
+print("\n5. Testing the spool limit...")
+for _ in range(3):
+    client.get('/api/health', headers=dict(admin_headers, **{'X-Profile': 'sample'}))
+captures = client.get('/api/admin/profiles', headers=admin_headers).json
+files = os.listdir(os.environ['PROFILE_DIR'])
+missing = client.get('/api/admin/profiles/../app.py/pstats', headers=admin_headers).status_code
+if len(captures) == 3 and all(c['endpoint'] == 'health' for c in captures) and len(files) == 9 and missing == 404:
+    print(f"   ✅ Newest 3 captures kept ({len(files)} files)")
+else:
+    print(f"   ❌ {len(captures)} captures listed, {len(files)} files, bad id: {missing}")
+
+# Test 6: Shed requests never reach the admin lookup
+print("\n6. Testing a profile request while the server is busy...")
+statements = []
+with app.app_context():
+    engine = app.extensions['sqlalchemy'].engine
+record = lambda *args: statements.append(args[2])
+event.listen(engine, 'before_cursor_execute', record)
+with mock.patch.object(app.extensions['concurrency_gate'], 'acquire', return_value=None):
+    busy = client.get('/api/videos', headers=dict(admin_headers, **{'X-Profile': 'sample'}))
+event.remove(engine, 'before_cursor_execute', record)
+if busy.status_code == 503 and not statements and 'X-Profile-Id' not in busy.headers:
+    print("   ✅ 503 without a database query or a capture")
+else:
+    print(f"   ❌ {busy.status_code}, statements: {statements}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
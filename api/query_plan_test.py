@@ -0,0 +1,141 @@
+import base64
+import os
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import func, select
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-queryplan-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'queryplan.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from app import create_app  # type: ignore
+from query_stats import PlanAudit, table_scans  # type: ignore
+
+# Tables with at least this many rows must not be read in full
+LARGE_TABLE_ROWS = 1000
+# The unpaginated listings read every row by design: they are built once
+# per catalog version and cached. Paged statements (with LIMIT) must seek.
+ALLOWED_SCANS = {
+    ('get_videos', 'video'),
+    ('get_music', 'music'),
+}
+
+
+def run_scenario(client):
+    """Every API route, with both hits and misses."""
+    admin = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json
+    headers = {'x-access-token': admin['token']}
+    client.post('/api/login', json={'email': 'nobody@example.com', 'password': 'wrong'})
+    user = client.post('/api/register', json={'email': 'plan@example.com', 'password': 'plan-password'}).json
+    client.post('/api/register', json={'email': 'plan@example.com', 'password': 'plan-password'})
+    user_headers = {'x-access-token': user['token']}
+
+    client.get('/api/health')
+    client.get('/api/user/profile', headers=user_headers)
+    client.put('/api/user/profile', json={'name': 'Plan User'}, headers=user_headers)
+    image = 'data:image/jpeg;base64,' + base64.b64encode(b'\xff\xd8' + os.urandom(1024)).decode()
+    client.post('/api/user/profile-image', json={'image': image}, headers=user_headers)
+
+    for name in ('videos', 'music'):
+        client.get(f'/api/{name}', headers=user_headers)
+        response = client.get(f'/api/{name}?limit=20', headers=user_headers)
+        client.get(f"/api/{name}?limit=20&after={response.headers['X-Next-After']}", headers=user_headers)
+    video = client.post('/api/videos', json={'title': 'Plan', 'url': '/uploads/plan.mp4'}, headers=headers).json
+    music = client.post('/api/music', json={'title': 'Plan', 'artist': 'Plan', 'url': '/uploads/plan.mp3'},
+                        headers=headers).json
+    client.get(f"/api/videos/{video['video']['id']}/processing", headers=user_headers)
+    client.get(f"/api/music/{music['music']['id']}/beats", headers=user_headers)
+    client.get('/api/videos/999999999/processing', headers=user_headers)
+    client.delete(f"/api/videos/{video['video']['id']}", headers=headers)
+    client.delete(f"/api/music/{music['music']['id']}", headers=headers)
+    client.delete('/api/videos/999999999', headers=headers)
+    client.delete('/api/music/999999999', headers=user_headers)
+
+    listing = client.get('/api/videos?limit=1', headers=user_headers).json
+    client.get(listing[0]['url'], headers={'Range': 'bytes=0-1023'})
+    for path in ('/api/admin/catalog-cache', '/api/admin/media-cache', '/api/admin/slow-queries',
+                 '/api/admin/rate-limits', '/api/admin/access-log', '/api/admin/memory', '/metrics'):
+        client.get(path, headers=headers)
+
+
+print("=== QUERY PLAN TEST ===")
+
+app = create_app()
+result = app.test_cli_runner().invoke(args=['seed-synthetic', '--users', '2000', '--videos', '2000',
+                                            '--music', '2000', '--media-files', '1'])
+audit = PlanAudit()
+with app.app_context():
+    db = app.extensions['sqlalchemy']
+    audit.install(db.engine)
+    with db.engine.connect() as conn:
+        sizes = {name: conn.execute(select(func.count()).select_from(table)).scalar()
+                 for name, table in db.metadata.tables.items()}
+large = {name for name, rows in sizes.items() if rows >= LARGE_TABLE_ROWS}
+
+# Test 1: Capture
+print("\n1. Running the scenario...")
+run_scenario(app.test_client())
+entries = [entry for entry in audit.entries() if entry['route'] is not None]
+routes = {entry['route'] for entry in entries}
+explained = [entry for entry in entries if entry['plan']]
+if result.exit_code == 0 and len(routes) >= 12 and explained:
+    print(f"   ✅ {len(entries)} distinct statements from {len(routes)} routes, {len(explained)} explained "
+          f"(large tables: {', '.join(sorted(large))})")
+else:
+    print(f"   ❌ {len(entries)} statements from {len(routes)} routes\n{result.output}")
+
+# Test 2: No plan failed
+print("\n2. Checking every statement could be explained...")
+failed = [entry for entry in explained if entry['plan'][0].startswith('EXPLAIN failed')]
+if not failed:
+    print("   ✅ All plans available")
+for entry in failed:
+    print(f"   ❌ {entry['route']}: {entry['sql']}\n      {entry['plan'][0]}")
+
+# Test 3: The detector itself, against an unindexed lookup
+print("\n3. Checking that a table scan is detected...")
+with app.test_request_context('/probe'):
+    db.session.execute(select(db.metadata.tables['video'].c.id).where(db.metadata.tables['video'].c.title == 'x'))
+    db.session.rollback()
+probe = [entry for entry in audit.entries() if entry['route'] == 'GET /probe']
+if probe and table_scans(probe[0]['plan']) == ['video']:
+    print(f"   ✅ {probe[0]['plan'][0]}")
+else:
+    print(f"   ❌ Probe: {probe}")
+
+# Test 4: Table scans
+print("\n4. Checking for table scans of large tables...")
+offending = []
+for entry in explained:
+    for table in table_scans(entry['plan']):
+        allowed = (entry['endpoint'], table) in ALLOWED_SCANS and ' LIMIT ' not in entry['sql'].upper()
+        if table in large and not allowed:
+            offending.append((entry, table))
+if not offending:
+    print(f"   ✅ No route scans {', '.join(sorted(large))}")
+for entry, table in offending:
+    print(f"   ❌ {entry['route']} scans {table}:\n      {entry['sql']}")
+    for line in entry['plan']:
+        print(f"        {line}")
+
+# Test 5: Indexed lookups
+print("\n5. Checking the email lookups use the unique index...")
+lookups = [entry for entry in explained if entry['endpoint'] in ('login', 'register')
+           and 'user.email = ?' in entry['sql'].replace('"', '')]
+indexed = len({entry['endpoint'] for entry in lookups}) == 2 and all(
+    any('USING INDEX' in line for line in entry['plan']) for entry in lookups)
+if indexed:
+    print(f"   ✅ login and register: {lookups[0]['plan'][0]}")
+else:
+    print(f"   ❌ Plans: {[(entry['endpoint'], entry['plan']) for entry in lookups]}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
+sys.exit(1 if failed or offending or not indexed else 0)
@@ -0,0 +1,224 @@
+"""Per-request SQL statement counts, timing and a slow-query log.
+
+``QueryStats.install`` hooks an engine's cursor events. Every statement
+run while a request is active is added to that request's count and
+database time (``request_totals``), whichever engine ran it: the primary,
+a replica, or the async engine of the ASGI catalog path.
+
+Statements slower than ``slow_ms`` are logged with their normalized SQL
+(whitespace collapsed, literals replaced by ``?``) and the database's
+plan for them (``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on
+PostgreSQL), and the most recent ones are kept for the admin endpoint.
+
+Budgets cap the statements a route may run, e.g. ``get_videos=2``.
+``over_budget`` reports the routes that exceed them, so a test run can
+fail on an N+1 regression instead of just getting slower.
+
+``PlanAudit`` is the test-time counterpart: it explains every distinct
+statement each route runs, however fast, and ``table_scans`` picks out
+the plans that read a whole table (see query_plan_test.py).
+"""
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# One statement of headroom over what each route runs today; a listing
+# that starts loading rows one by one blows straight through these
+DEFAULT_QUERY_BUDGETS = (
+    'login=2,register=4,get_profile=2,update_profile=4,upload_profile_image=4,'
+    'get_videos=3,get_music=3,get_video_processing=3,get_music_beats=3,'
+    'add_video=4,add_music=4,delete_video=4,delete_music=4'
+)
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+# "SCAN video", "SCAN TABLE video AS v", "SCAN user USING COVERING INDEX ..."
+# on SQLite; "Seq Scan on video" on PostgreSQL
+_SCANS = re.compile(r'^(?:SCAN (?:TABLE )?"?(\w+)"?|.*Seq Scan on "?(\w+)"?)')
+
+
+def normalize_sql(statement):
+    statement = _STRINGS.sub('?', statement)
+    statement = _NUMBERS.sub('?', statement)
+    statement = _IN_LISTS.sub('(...)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+def parse_budgets(spec):
+    """Return ``{endpoint: max_statements}`` for ``endpoint=count,...``, or ``{}`` for ``off``."""
+    budgets = {}
+    if spec.strip().lower() == 'off':
+        return budgets
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            endpoint, count = entry.split('=')
+            budgets[endpoint.strip()] = int(count)
+        except ValueError:
+            raise ValueError(f'Invalid query budget: {entry!r}') from None
+    return budgets
+
+
+def explain(conn, statement, parameters):
+    """Plan lines for ``statement``, or None if the dialect or statement has none."""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if not prefix or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    dbapi_connection = conn.connection.dbapi_connection
+    # On PostgreSQL a failed statement aborts the whole transaction, so the
+    # EXPLAIN runs in a savepoint that is rolled back if it fails
+    savepoint = conn.dialect.name == 'postgresql' and not getattr(dbapi_connection, 'autocommit', False)
+    # Straight on the DBAPI connection, so the EXPLAIN is neither counted
+    # nor timed itself
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute('SAVEPOINT query_plan')
+            try:
+                cursor.execute(prefix + statement, parameters or ())
+                rows = cursor.fetchall()
+            except Exception:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT query_plan')
+                raise
+            finally:
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT query_plan')
+        finally:
+            cursor.close()
+        # SQLite rows are (id, parent, notused, detail); PostgreSQL returns
+        # one text column per plan line
+        return [str(row[-1]) for row in rows]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+
+
+def table_scans(plan):
+    """Tables a plan reads in full."""
+    scans = []
+    for line in plan or ():
+        match = _SCANS.match(line.strip())
+        if match:
+            scans.append(match.group(1) or match.group(2))
+    return scans
+
+
+def request_totals():
+    """``(statements, seconds)`` run so far by the current request."""
+    totals = g.get('sql_totals')
+    return (totals[0], totals[1]) if totals else (0, 0.0)
+
+
+class QueryStats:
+    def __init__(self, logger, slow_ms=200, budgets=None, keep=50):
+        self.logger = logger
+        self.slow_seconds = slow_ms / 1000 if slow_ms > 0 else None
+        self.budgets = budgets or {}
+        self.recent = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.slow = 0
+        self.budget_exceeded = 0
+
+    def install(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    # The start time lives on the execution context, which is dropped with
+    # the statement; after_cursor_execute does not fire when one fails
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if has_request_context():
+            totals = g.get('sql_totals')
+            if totals is None:
+                totals = g.sql_totals = [0, 0.0]
+            totals[0] += 1
+            totals[1] += elapsed
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            self._log_slow(conn, statement, parameters, elapsed, executemany)
+
+    def _log_slow(self, conn, statement, parameters, elapsed, executemany):
+        plan = None if executemany else explain(conn, statement, parameters)
+        entry = {
+            'sql': normalize_sql(statement),
+            'ms': round(elapsed * 1000, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'plan': plan,
+            'at': time.time(),
+        }
+        with self.lock:
+            self.slow += 1
+            self.recent.append(entry)
+        self.logger.warning('Slow query (%.1fms) in %s: %s%s', entry['ms'], entry['endpoint'] or '-', entry['sql'],
+                            ''.join(f'\n    {line}' for line in plan or ()))
+
+    def over_budget(self, endpoint, statements):
+        budget = self.budgets.get(endpoint)
+        if budget is None or statements <= budget:
+            return None
+        with self.lock:
+            self.budget_exceeded += 1
+        return budget
+
+    def stats(self):
+        with self.lock:
+            return {
+                'slow_threshold_ms': self.slow_seconds * 1000 if self.slow_seconds is not None else None,
+                'slow_queries': self.slow,
+                'budget_exceeded': self.budget_exceeded,
+                'budgets': self.budgets,
+                'recent': list(self.recent),
+            }
+
+
+class PlanAudit:
+    """Every distinct statement run per route, with its plan."""
+
+    def __init__(self):
+        self.statements = {}
+        self.lock = threading.Lock()
+
+    def install(self, engine):
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return
+        if has_request_context():
+            route = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+            endpoint = request.endpoint
+        else:
+            route = endpoint = None
+        key = (route, normalize_sql(statement))
+        with self.lock:
+            if key in self.statements:
+                return
+            self.statements[key] = None
+        plan = explain(conn, statement, parameters)
+        with self.lock:
+            self.statements[key] = {'route': route, 'endpoint': endpoint, 'sql': key[1], 'plan': plan}
+
+    def entries(self):
+        with self.lock:
+            return [entry for entry in self.statements.values() if entry is not None]
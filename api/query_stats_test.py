@@ -0,0 +1,130 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-querystats-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'querystats.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['SQL_SERVER_TIMING'] = 'true'
+
+from sqlalchemy import create_engine, text
+
+from app import create_app  # type: ignore
+from database import normalize_database_url  # type: ignore
+from query_stats import DEFAULT_QUERY_BUDGETS, QueryStats, explain, normalize_sql, parse_budgets, request_totals  # type: ignore
+
+print("=== QUERY STATS TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+app.logger.setLevel(logging.ERROR)
+query_stats = app.extensions['query_stats']
+client = app.test_client()
+response = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'})
+headers = {'x-access-token': response.json['token']}
+client.post('/api/videos', json={'title': 'Stats', 'url': 'https://example.com/v.mp4'}, headers=headers)
+
+# Test 1: Server-Timing
+print("\n1. Testing the Server-Timing header...")
+timing = client.get('/api/user/profile', headers=headers).headers.get('Server-Timing', '')
+if timing.startswith('db;dur=') and 'desc="1 queries"' in timing:
+    print(f"   ✅ {timing}")
+else:
+    print(f"   ❌ Server-Timing: {timing!r}")
+
+# Test 2: Query budgets
+print("\n2. Testing a strict query budget...")
+query_stats.budgets['get_profile'] = 0
+app.config['QUERY_BUDGET_STRICT'] = True
+over = client.get('/api/user/profile', headers=headers)
+app.config['QUERY_BUDGET_STRICT'] = False
+logged_only = client.get('/api/user/profile', headers=headers)
+del query_stats.budgets['get_profile']
+if over.status_code == 500 and 'budget 0' in over.json['message'] and logged_only.status_code == 200:
+    print(f"   ✅ {over.json['message']}")
+else:
+    print(f"   ❌ Strict: {over.status_code}, not strict: {logged_only.status_code}")
+
+# Test 3: An empty QUERY_BUDGETS keeps the defaults, only 'off' drops them
+print("\n3. Testing the budget settings...")
+os.environ['QUERY_BUDGETS'] = ''
+defaults = create_app().extensions['query_stats'].budgets
+os.environ['QUERY_BUDGETS'] = 'off'
+disabled = create_app().extensions['query_stats'].budgets
+del os.environ['QUERY_BUDGETS']
+if defaults == parse_budgets(DEFAULT_QUERY_BUDGETS) and defaults and disabled == {}:
+    print(f"   ✅ {len(defaults)} default budgets for an empty value, none for 'off'")
+else:
+    print(f"   ❌ Empty: {defaults}, off: {disabled}")
+
+# Test 4: Slow-query log with the query plan
+print("\n4. Testing the slow-query log...")
+query_stats.slow_seconds = 0
+# First listing since startup, so the rows come from the database
+client.get('/api/videos', headers=headers)
+query_stats.slow_seconds = None
+recent = client.get('/api/admin/slow-queries', headers=headers).json['recent']
+listing = [entry for entry in recent if entry['endpoint'] == 'get_videos' and 'FROM video' in entry['sql']]
+if listing and listing[-1]['plan'] and any('video' in line for line in listing[-1]['plan']):
+    print(f"   ✅ Logged with plan: {' / '.join(listing[-1]['plan'])}")
+else:
+    print(f"   ❌ Slow queries: {recent}")
+
+# Test 5: SQL normalization
+print("\n5. Testing SQL normalization...")
+normalized = normalize_sql("SELECT *\n  FROM music WHERE id IN (1, 2, 3) AND title = 'It''s' LIMIT 10")
+if normalized == 'SELECT * FROM music WHERE id IN (...) AND title = ? LIMIT ?':
+    print(f"   ✅ {normalized}")
+else:
+    print(f"   ❌ {normalized}")
+
+# Test 6: Failed statements leave nothing behind
+print("\n6. Testing failed statements...")
+db = app.extensions['sqlalchemy']
+
+
+def info_sizes(conn):
+    return {key: len(value) for key, value in conn.info.items() if isinstance(value, list)}
+
+
+with app.test_request_context():
+    with db.engine.connect() as conn:
+        info_before = info_sizes(conn)
+        for _ in range(100):
+            try:
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            except Exception:
+                conn.rollback()
+        conn.exec_driver_sql('SELECT 1')
+        info_after = info_sizes(conn)
+    totals = request_totals()
+if info_after == info_before and totals[0] == 1:
+    print(f"   ✅ 100 failures left the connection info unchanged; {totals[0]} statement counted")
+else:
+    print(f"   ❌ info {info_before} -> {info_after}, totals {totals}")
+
+# Test 7: On PostgreSQL a failed EXPLAIN does not abort the transaction
+print("\n7. Testing EXPLAIN failures on PostgreSQL...")
+postgres_url = os.environ.get('TEST_POSTGRES_URL')
+if not postgres_url:
+    print("   ⚠️  Skipping: set TEST_POSTGRES_URL to run it")
+else:
+    engine = create_engine(normalize_database_url(postgres_url))
+    QueryStats(app.logger, slow_ms=200).install(engine)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        failed = explain(conn, 'SELECT * FROM no_such_table', None)
+        usable = conn.execute(text('SELECT 2')).scalar()
+    engine.dispose()
+    if failed and failed[0].startswith('EXPLAIN failed') and usable == 2:
+        print("   ✅ The transaction ran on after a failed EXPLAIN")
+    else:
+        print(f"   ❌ {failed} {usable}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
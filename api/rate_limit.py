@@ -0,0 +1,248 @@
+"""Per-client rate limits and a global concurrency gate.
+
+``RateLimiter`` keeps token buckets in a small SQLite database in the
+instance folder, so all workers on the host draw from the same buckets.
+Each check is one short write transaction. The data is disposable, so the
+database runs without fsync, and a bucket is deleted once it has refilled.
+
+Rules are configured per Flask endpoint as a comma separated list of
+``endpoint:scope=count/seconds`` entries::
+
+    login:ip=20/60,login:identity=10/60,*:ip=600/60
+
+A bucket holds ``count`` tokens and refills at ``count / seconds`` per
+second. ``ip`` buckets are keyed by client address. ``identity`` buckets
+are keyed by the authenticated user, or by the email in the body of
+anonymous requests such as login. ``*`` rules apply to every request on
+top of the endpoint's own rules.
+
+``ConcurrencyGate`` caps how many requests are being handled at once
+across all workers. Each request holds one byte-range lock on a shared
+file. The kernel drops those locks when a worker dies, so a crashed
+worker cannot leak slots. A request that finds every slot taken is shed
+straight away instead of queuing behind the others.
+
+Both fail open: if the store is unavailable, requests go through.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows; the gate then only counts this process
+    fcntl = None
+
+DEFAULT_RATE_LIMITS = (
+    'login:ip=20/60,login:identity=10/60,register:ip=10/3600,'
+    'get_videos:identity=120/60,get_music:identity=120/60,*:ip=600/60'
+)
+SCOPES = ('ip', 'identity')
+
+
+def parse_rules(spec):
+    """Return ``{endpoint: [(scope, count, seconds), ...]}`` for a rules string."""
+    rules = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            target, limit = entry.split('=')
+            endpoint, scope = target.strip().split(':')
+            count, seconds = limit.split('/')
+            rule = (scope.strip(), int(count), float(seconds))
+        except ValueError:
+            raise ValueError(f'Invalid rate limit rule: {entry!r}') from None
+        if rule[0] not in SCOPES:
+            raise ValueError(f'Unknown rate limit scope in {entry!r}')
+        if rule[1] <= 0 or rule[2] <= 0:
+            raise ValueError(f'Rate limit must be positive in {entry!r}')
+        rules.setdefault(endpoint.strip(), []).append(rule)
+    return rules
+
+
+def client_address(request, trusted_proxies=0):
+    """Client IP, skipping ``trusted_proxies`` hops of X-Forwarded-For.
+
+    Only addresses appended by our own proxies are trusted; anything to
+    their left was sent by the client and may be forged.
+    """
+    route = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',') if address.strip()]
+    route.append(request.remote_addr or '')
+    return route[max(len(route) - 1 - trusted_proxies, 0)]
+
+
+class RateLimiter:
+    def __init__(self, path, rules):
+        self.path = path
+        self.rules = rules
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+        self.checks_since_purge = 0
+
+    def scopes(self, endpoint):
+        """Scopes a request to ``endpoint`` is limited by."""
+        return {rule[0] for rule in self.rules.get(endpoint, []) + self.rules.get('*', [])}
+
+    def hit(self, endpoint, clients):
+        """Take a token from every bucket that applies to the request.
+
+        ``clients`` maps each scope to the client's key (None to skip the
+        scope's rules). Returns 0 when the request is allowed, otherwise
+        the seconds to wait until it would be. A limited request takes no
+        tokens.
+        """
+        buckets = []
+        for name in (endpoint, '*'):
+            for scope, count, seconds in self.rules.get(name, ()):
+                if clients.get(scope) is not None:
+                    buckets.append((f'{name}:{scope}:{clients[scope]}', count, count / seconds))
+        if not buckets:
+            return 0
+
+        try:
+            retry_after = self._take(buckets, time.time())
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+            return 0
+
+        with self.lock:
+            if retry_after:
+                self.limited += 1
+            else:
+                self.allowed += 1
+            self.checks_since_purge += 1
+            purge = self.checks_since_purge >= 1000
+            if purge:
+                self.checks_since_purge = 0
+        if purge:
+            self.purge()
+        return retry_after
+
+    def _take(self, buckets, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            retry_after = 0
+            for key, capacity, rate in buckets:
+                row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                if tokens < 1:
+                    retry_after = max(retry_after, math.ceil((1 - tokens) / rate))
+                levels.append((key, tokens - 1, now + (capacity - tokens + 1) / rate))
+            if not retry_after:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                    [(key, tokens, now, full_at) for key, tokens, full_at in levels]
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def purge(self):
+        """Delete buckets that have refilled; a missing bucket counts as full."""
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM buckets WHERE full_at < ?', (time.time(),))
+        except sqlite3.Error:
+            with self.lock:
+                self.errors += 1
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=0.25, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def stats(self):
+        with self.lock:
+            stats = {'allowed': self.allowed, 'limited': self.limited, 'errors': self.errors}
+        stats['rules'] = {endpoint: [f'{scope}={count}/{seconds:g}' for scope, count, seconds in rules]
+                          for endpoint, rules in self.rules.items()}
+        return stats
+
+
+class ConcurrencyGate:
+    def __init__(self, path, limit):
+        self.path = path
+        self.limit = limit
+        self.held = set()
+        self.lock = threading.Lock()
+        self.lock_file = None
+        self.pid = None
+        self.admitted = 0
+        self.shed = 0
+        self.max_held = 0
+
+    def acquire(self):
+        """Return a slot for the request, or None when all are taken."""
+        with self.lock:
+            lock_file = self._file()
+            # Start the scan at a different slot in each worker so they do
+            # not all contend for the first free ones
+            offset = os.getpid() % self.limit
+            for i in range(self.limit):
+                slot = (offset + i) % self.limit
+                if slot in self.held:
+                    continue
+                if lock_file is not None:
+                    try:
+                        fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                    except OSError:
+                        continue
+                self.held.add(slot)
+                self.admitted += 1
+                self.max_held = max(self.max_held, len(self.held))
+                return slot
+            self.shed += 1
+            return None
+
+    def release(self, slot):
+        with self.lock:
+            if slot not in self.held:
+                return
+            self.held.discard(slot)
+            if self.lock_file is not None and self.pid == os.getpid():
+                fcntl.lockf(self.lock_file, fcntl.LOCK_UN, 1, slot)
+
+    def _file(self):
+        # Record locks belong to a process and are not inherited on fork
+        if fcntl is not None and self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.lock_file = open(self.path, 'a+')
+            self.pid = os.getpid()
+            self.held.clear()
+        return self.lock_file
+
+    def stats(self):
+        with self.lock:
+            return {
+                'limit': self.limit,
+                'in_flight': len(self.held),
+                'max_in_flight': self.max_held,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'shared': fcntl is not None,
+            }
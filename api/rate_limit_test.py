@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-ratelimit-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'ratelimit-test.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['RATE_LIMITS'] = 'login:identity=2/60,login:ip=5/60'
+os.environ['MAX_CONCURRENT_REQUESTS'] = '1'
+
+from rate_limit import ConcurrencyGate, RateLimiter, parse_rules  # type: ignore
+
+
+def hit_shared_bucket(path, results):
+    limiter = RateLimiter(path, parse_rules('videos:ip=10/60'))
+    for _ in range(5):
+        results.put(limiter.hit('videos', {'ip': '10.0.0.1'}))
+
+
+def hold_slots(path, ready):
+    gate = ConcurrencyGate(path, 2)
+    gate.acquire()
+    gate.acquire()
+    ready.set()
+    time.sleep(30)
+
+
+if __name__ == '__main__':
+    print("=== RATE LIMIT TEST ===")
+
+    # Test 1: Token bucket
+    print("\n1. Testing a 3 per minute bucket...")
+    limiter = RateLimiter(os.path.join(workdir, 'bucket.db'), parse_rules('login:ip=3/60'))
+    results = [limiter.hit('login', {'ip': '10.0.0.1'}) for _ in range(4)]
+    other = limiter.hit('login', {'ip': '10.0.0.2'})
+    if results[:3] == [0, 0, 0] and 15 <= results[3] <= 20 and other == 0:
+        print(f"   ✅ 4th request limited, retry after {results[3]}s; other clients unaffected")
+    else:
+        print(f"   ❌ Results: {results}, other client: {other}")
+
+    # Test 2: Workers share the buckets
+    print("\n2. Testing one bucket across 4 workers...")
+    queue = multiprocessing.Queue()
+    path = os.path.join(workdir, 'shared.db')
+    RateLimiter(path, {}).purge()
+    processes = [multiprocessing.Process(target=hit_shared_bucket, args=(path, queue)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    allowed = sum(1 for _ in range(20) if queue.get() == 0)
+    if allowed == 10:
+        print("   ✅ 10 of 20 requests allowed by a 10 per minute limit")
+    else:
+        print(f"   ❌ {allowed} of 20 requests allowed")
+
+    # Test 3: A dead worker's slots are released
+    print("\n3. Testing the concurrency gate across workers...")
+    path = os.path.join(workdir, 'gate.lock')
+    ready = multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_slots, args=(path, ready))
+    holder.start()
+    ready.wait(10)
+    gate = ConcurrencyGate(path, 2)
+    while_held = gate.acquire()
+    holder.kill()
+    holder.join()
+    after_crash = gate.acquire()
+    if while_held is None and after_crash is not None:
+        print("   ✅ Shed while another worker held every slot, admitted after it died")
+    else:
+        print(f"   ❌ While held: {while_held}, after crash: {after_crash}")
+
+    from app import create_app  # type: ignore
+
+    app = create_app()
+    app.extensions['init_database']()
+    client = app.test_client()
+
+    # Test 4: 429 with Retry-After per identity
+    print("\n4. Testing login limits per account...")
+    statuses = [client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'wrong'}).status_code
+                for _ in range(2)]
+    limited = client.post('/api/login', json={'email': 'Admin@gmail.com', 'password': 'wrong'})
+    other = client.post('/api/login', json={'email': 'someone@example.com', 'password': 'wrong'})
+    if statuses == [401, 401] and limited.status_code == 429 and limited.headers.get('Retry-After') \
+            and other.status_code == 401:
+        print(f"   ✅ 3rd attempt got 429 (Retry-After: {limited.headers['Retry-After']}s), other account unaffected")
+    else:
+        print(f"   ❌ Statuses: {statuses}, {limited.status_code}, other account: {other.status_code}")
+
+    # Test 5: Load shedding
+    print("\n5. Testing load shedding...")
+    slot = app.extensions['concurrency_gate'].acquire()
+    busy = client.get('/api/health')
+    app.extensions['concurrency_gate'].release(slot)
+    free = client.get('/api/health')
+    if busy.status_code == 503 and busy.headers.get('Retry-After') == '1' and free.status_code == 200:
+        print("   ✅ 503 while the only slot was taken, 200 after")
+    else:
+        print(f"   ❌ Busy: {busy.status_code}, free: {free.status_code}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,123 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Primary/replica pair: the replica is a copy of the primary SQLite file
+# that only changes when sync_replica() runs, which makes replication lag
+# explicit and lets us see which engine served each request.
+workdir = tempfile.mkdtemp(prefix='echoplay-replica-')
+primary_path = os.path.join(workdir, 'primary.db')
+replica_path = os.path.join(workdir, 'replica.db')
+
+os.environ['DATABASE_PATH'] = 'sqlite:///' + primary_path
+os.environ['DATABASE_REPLICA_URLS'] = 'sqlite:///' + replica_path
+os.environ['DATABASE_READ_YOUR_WRITES_SECONDS'] = '1'
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+
+from app import create_app  # type: ignore
+from database import resolve_sqlite_url  # type: ignore
+
+
+def sync_replica():
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+print("=== READ REPLICA ROUTING TEST ===")
+
+app = create_app()
+app.extensions['init_database']()
+sync_replica()
+admin = app.test_client()
+listener = app.test_client()
+
+# Setup: both users exist on the replica before the writes under test
+response = admin.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'})
+admin_headers = {'x-access-token': response.json['token']}
+response = listener.post('/api/register', json={'email': 'listener@example.com', 'password': 'secret'})
+listener_headers = {'x-access-token': response.json['token']}
+sync_replica()
+time.sleep(1.1)
+
+# Test 1: Admin write
+print("\n1. Testing admin write on the primary...")
+response = admin.post('/api/videos', json={'title': 'Replica Test', 'url': 'https://example.com/v.mp4'},
+                      headers=admin_headers)
+if response.status_code == 201:
+    print("   ✅ Video added")
+else:
+    print(f"   ❌ Video addition failed: {response.status_code}")
+
+# Test 2: The writer reads its own write
+print("\n2. Testing read-your-writes for the admin...")
+videos = admin.get('/api/videos', headers=admin_headers).json
+if len(videos) == 1:
+    print("   ✅ Admin sees the new video (served by the primary)")
+else:
+    print(f"   ❌ Admin sees {len(videos)} videos")
+
+# Test 3: Another user reads from the lagging replica
+print("\n3. Testing replica reads for other users...")
+videos = listener.get('/api/videos', headers=listener_headers).json
+if len(videos) == 0:
+    print("   ✅ Listener read was served by the (stale) replica")
+else:
+    print(f"   ❌ Listener sees {len(videos)} videos, expected the replica's 0")
+
+# Test 4: Replication catches up
+print("\n4. Testing replica after sync...")
+sync_replica()
+videos = listener.get('/api/videos', headers=listener_headers).json
+if len(videos) == 1:
+    print("   ✅ Listener sees the video once the replica caught up")
+else:
+    print(f"   ❌ Listener sees {len(videos)} videos after sync")
+
+# Test 5: Stickiness expires
+print("\n5. Testing read-your-writes window expiry...")
+admin.post('/api/music', json={'title': 'Song', 'artist': 'Artist', 'url': 'https://example.com/s.mp3'},
+           headers=admin_headers)
+time.sleep(1.1)
+music = admin.get('/api/music', headers=admin_headers).json
+if len(music) == 0:
+    print("   ✅ Admin reads return to the replica after the window")
+else:
+    print(f"   ❌ Admin still reads from the primary ({len(music)} tracks)")
+
+# Test 6: Clients without cookies echo the header, also to another worker
+print("\n6. Testing the X-Primary-Until header on another worker...")
+other_worker = create_app().test_client(use_cookies=False)
+mobile = app.test_client(use_cookies=False)
+response = mobile.post('/api/videos', json={'title': 'Mobile', 'url': 'https://example.com/m.mp4'},
+                       headers=admin_headers)
+until = response.headers.get('X-Primary-Until')
+echoed = other_worker.get('/api/videos', headers={**admin_headers, 'X-Primary-Until': until}).json
+plain = other_worker.get('/api/videos', headers=admin_headers).json
+forged = other_worker.get('/api/videos', headers={**admin_headers, 'X-Primary-Until': str(int(time.time()) + 3600)}).json
+if until and len(echoed) == 2 and len(plain) == 1 and len(forged) == 1:
+    print(f"   ✅ Echoed header reads the primary ({len(echoed)} videos), without it the replica "
+          f"({len(plain)}); values beyond the window are ignored")
+else:
+    print(f"   ❌ Header {until}: echoed {len(echoed)}, plain {len(plain)}, forged {len(forged)}")
+
+# Test 7: Relative SQLite replica paths resolve like the primary's
+print("\n7. Testing relative replica paths...")
+resolved = resolve_sqlite_url('sqlite:///replica.db', app.instance_path)
+unchanged = [resolve_sqlite_url(url, app.instance_path) for url in
+             ('sqlite:////srv/replica.db', 'sqlite://', 'postgresql+psycopg://u:p@db/echoplay')]
+if (resolved == 'sqlite:///' + os.path.join(app.instance_path, 'replica.db')
+        and unchanged == ['sqlite:////srv/replica.db', 'sqlite://', 'postgresql+psycopg://u:p@db/echoplay']):
+    print(f"   ✅ {resolved}")
+else:
+    print(f"   ❌ {resolved} {unchanged}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -0,0 +1,46 @@
+"""Response formats: JSON (the default) or MessagePack.
+
+Clients opt in with ``Accept: application/msgpack``. MessagePack payloads
+are smaller than JSON and decode without building intermediate strings,
+which matters for the mobile client parsing large listings on the JS
+thread.
+
+List payloads can also be sent column-wise with ``?layout=columnar``: the
+keys once, then one array of values per row::
+
+    {"columns": ["artist", "id", ...], "rows": [["Artist", 1, ...], ...]}
+
+which removes the repeated keys from every row in either format.
+"""
+import msgpack
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def negotiate(request):
+    """Return ``(mimetype, columnar)`` for a werkzeug request."""
+    mimetype = request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE)
+    return mimetype, request.args.get('layout') == 'columnar'
+
+
+def to_columnar(rows):
+    columns = sorted(rows[0]) if rows else []
+    return {'columns': columns, 'rows': [[row[column] for column in columns] for row in rows]}
+
+
+def encode(payload, mimetype, columnar, json_provider):
+    """Serialize ``payload``; JSON goes through the app's provider so it is
+    byte-for-byte what ``jsonify`` would return."""
+    if columnar and isinstance(payload, list):
+        payload = to_columnar(payload)
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json_provider.response(payload).get_data()
+
+
+def encode_value(value, mimetype, json_provider):
+    """Serialize a single value exactly as ``encode`` writes it inside a payload."""
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(value, use_bin_type=True)
+    return json_provider.dumps(value).encode()
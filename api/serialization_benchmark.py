@@ -0,0 +1,106 @@
+"""Encode time and payload size of the catalog listing per response format.
+
+Builds synthetic signed video listings of several sizes and encodes them
+as JSON (through Flask's provider, as the API does), MessagePack and
+columnar MessagePack/JSON, reporting encode and decode time and the size
+before and after gzip (and brotli when installed).
+
+    python serialization_benchmark.py --rows 100 1000 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import msgpack
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from compression import brotli
+from serialization import JSON_MIMETYPE, MSGPACK_MIMETYPE, encode
+
+FORMATS = [
+    ('json', JSON_MIMETYPE, False),
+    ('json columnar', JSON_MIMETYPE, True),
+    ('msgpack', MSGPACK_MIMETYPE, False),
+    ('msgpack columnar', MSGPACK_MIMETYPE, True),
+]
+
+
+def make_rows(count):
+    token = 'default.7.1792440000.1.Kp06LjfekiJXRXF-XP9nLw'
+    return [{
+        'id': i,
+        'title': f'Video {i}: a moderately long title for the listing',
+        'description': 'Recorded live' if i % 3 else '',
+        'url': f'/media/{token}/video_{i}.mp4',
+        'thumbnail': f'/media/{token}/thumb_{i}.jpg',
+        'uploaded_by': 'admin@gmail.com',
+        'created_at': '2026-10-19T18:51:18.%06d' % i,
+        'duration': 180.5 + i % 600,
+        'width': 1280,
+        'height': 720,
+        'hls_url': f'/media/{token}/hls/{i}/master.m3u8',
+        'processing_status': 'ready',
+    } for i in range(count)]
+
+
+def decode(data, mimetype):
+    return msgpack.unpackb(data) if mimetype == MSGPACK_MIMETYPE else json.loads(data)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5, help='Best of N timings')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    results = []
+    print("=== SERIALIZATION BENCHMARK ===")
+    header = f"{'rows':>6} {'format':<17} {'encode':>9} {'decode':>9} {'bytes':>10} {'gzip':>9}"
+    if brotli is not None:
+        header += f" {'brotli':>9}"
+    for count in args.rows:
+        print("\n" + header)
+        rows = make_rows(count)
+        for label, mimetype, columnar in FORMATS:
+            data, encode_time = timed(lambda: encode(rows, mimetype, columnar, app.json), args.repeat)
+            _, decode_time = timed(lambda: decode(data, mimetype), args.repeat)
+            result = {
+                'rows': count,
+                'format': label,
+                'encode_ms': encode_time * 1000,
+                'decode_ms': decode_time * 1000,
+                'bytes': len(data),
+                'gzip_bytes': len(gzip.compress(data, 6)),
+            }
+            line = (f"{count:>6} {label:<17} {result['encode_ms']:>7.2f}ms {result['decode_ms']:>7.2f}ms "
+                    f"{result['bytes']:>10} {result['gzip_bytes']:>9}")
+            if brotli is not None:
+                result['brotli_bytes'] = len(brotli.compress(data, quality=4))
+                line += f" {result['brotli_bytes']:>9}"
+            print(line)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
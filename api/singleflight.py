@@ -0,0 +1,140 @@
+"""Request coalescing for expensive cache misses.
+
+When the catalog changes every client refreshes at once, and without
+coordination each request rebuilds the same listing in parallel.
+``SingleFlight.do`` lets one caller per key run the computation while
+concurrent callers in the same process wait for its result.
+
+Across worker processes the leader of each flight also takes a file lock
+per key. A worker that has to wait for that lock then tries
+``load_shared`` first, normally a spool file the previous holder wrote
+with ``store_shared``, before computing the result itself.
+
+Waiting is bounded: after ``timeout`` seconds a waiter gives up and
+computes the result on its own, so a stuck leader slows requests down but
+never blocks them indefinitely.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows; flights are then only coalesced per process
+    fcntl = None
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, timeout=10.0):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.calls = {}
+        self.lock = threading.Lock()
+        # Stampede metrics
+        self.leaders = 0
+        self.coalesced = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.max_waiters = 0
+
+    def do(self, key, build, lock_name=None, load_shared=None, store_shared=None):
+        """Return ``build()`` for ``key``, computed once among concurrent callers.
+
+        ``lock_name`` enables the cross-process lock (a file name under
+        ``lock_dir``).
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is None:
+                    return call.result
+            else:
+                with self.lock:
+                    self.timeouts += 1
+            # The leader failed or is too slow; compute independently
+            return build()
+
+        try:
+            call.result = self._lead(build, lock_name, load_shared, store_shared)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, build, lock_name, load_shared, store_shared):
+        if lock_name is None or self.lock_dir is None or fcntl is None:
+            return build()
+
+        lock_file = self._acquire(lock_name)
+        if lock_file is None:
+            with self.lock:
+                self.timeouts += 1
+            return build()
+        try:
+            if load_shared is not None:
+                result = load_shared()
+                if result is not None:
+                    with self.lock:
+                        self.shared += 1
+                    return result
+            result = build()
+            if store_shared is not None:
+                try:
+                    store_shared(result)
+                except OSError:
+                    # Sharing is an optimization; the result is still good
+                    pass
+            return result
+        finally:
+            # Closing the file releases the flock
+            lock_file.close()
+
+    def _acquire(self, lock_name):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.lock_dir, lock_name + '.lock'), 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    return None
+                time.sleep(0.005)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'shared': self.shared,
+                'timeouts': self.timeouts,
+                'max_waiters': self.max_waiters,
+                'in_flight': len(self.calls),
+            }
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_cache import CatalogCache  # type: ignore
+from singleflight import SingleFlight  # type: ignore
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def worker_process(workdir, start_at):
+    cache = CatalogCache(os.path.join(workdir, 'catalog.version'), spool_dir=os.path.join(workdir, 'spool'))
+
+    def build():
+        with open(os.path.join(workdir, 'builds.log'), 'a') as f:
+            f.write('%d\n' % os.getpid())
+        time.sleep(0.5)
+        return [{'id': 1, 'title': 'Shared'}]
+
+    time.sleep(max(0, start_at - time.time()))
+    rows = cache.get('videos', build)
+    assert rows == [{'id': 1, 'title': 'Shared'}]
+
+
+if __name__ == '__main__':
+    print("=== SINGLE-FLIGHT TEST ===")
+    workdir = tempfile.mkdtemp(prefix='echoplay-singleflight-')
+
+    # Test 1: Concurrent misses in one process
+    print("\n1. Testing concurrent misses in one worker...")
+    flight = SingleFlight()
+    builds = []
+
+    def slow_build():
+        builds.append(1)
+        time.sleep(0.3)
+        return 'rows'
+
+    results = []
+    run_threads(16, lambda: results.append(flight.do('videos', slow_build)))
+    if len(builds) == 1 and results == ['rows'] * 16:
+        print(f"   ✅ 16 requests, 1 build ({flight.stats()['coalesced']} coalesced)")
+    else:
+        print(f"   ❌ {len(builds)} builds for 16 requests")
+
+    # Test 2: Waiters fall back after the timeout
+    print("\n2. Testing timeout fallback...")
+    flight = SingleFlight(timeout=0.1)
+    leader = threading.Thread(target=lambda: flight.do('music', lambda: time.sleep(0.5) or 'slow'))
+    leader.start()
+    time.sleep(0.05)
+    started = time.perf_counter()
+    own = flight.do('music', lambda: 'fast')
+    waited = time.perf_counter() - started
+    leader.join()
+    if own == 'fast' and waited < 0.4 and flight.stats()['timeouts'] == 1:
+        print(f"   ✅ Waiter computed its own result after {waited * 1000:.0f}ms")
+    else:
+        print(f"   ❌ Waiter got {own!r} after {waited * 1000:.0f}ms")
+
+    # Test 3: A failing leader does not fail the waiters
+    print("\n3. Testing leader failure...")
+    flight = SingleFlight()
+    outcomes = []
+
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError('database went away')
+
+    def call(build):
+        try:
+            outcomes.append(flight.do('videos', build))
+        except RuntimeError:
+            outcomes.append('error')
+
+    first = threading.Thread(target=call, args=(failing,))
+    first.start()
+    time.sleep(0.05)
+    run_threads(4, lambda: call(lambda: 'recovered'))
+    first.join()
+    if sorted(outcomes) == ['error'] + ['recovered'] * 4:
+        print("   ✅ Only the leader saw the error")
+    else:
+        print(f"   ❌ Outcomes: {outcomes}")
+
+    # Test 4: Concurrent misses across worker processes
+    print("\n4. Testing concurrent misses across workers...")
+    start_at = time.time() + 0.5
+    processes = [multiprocessing.Process(target=worker_process, args=(workdir, start_at)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    with open(os.path.join(workdir, 'builds.log')) as f:
+        process_builds = len(f.read().split())
+    if process_builds == 1 and all(process.exitcode == 0 for process in processes):
+        print("   ✅ 4 workers, 1 build; the others read the spool")
+    else:
+        print(f"   ❌ {process_builds} builds across 4 workers")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    print("\n=== TEST COMPLETED ===")
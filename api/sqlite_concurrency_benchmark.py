@@ -0,0 +1,155 @@
+"""Read throughput of the catalog query while an admin writer is busy.
+
+Runs the same workload twice against fresh SQLite files: once with
+SQLite's defaults and once with the production profile from database.py.
+Each run starts several reader processes executing the get_videos listing
+query and one writer process inserting and deleting videos as fast as it
+can, like a sustained admin session.
+
+    python sqlite_concurrency_benchmark.py --readers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import configure_sqlite_engine
+
+SCHEMA = [
+    """CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(120) UNIQUE NOT NULL,
+       password_hash VARCHAR(255) NOT NULL, name VARCHAR(100), profile_image VARCHAR(255),
+       created_at DATETIME, is_admin BOOLEAN NOT NULL)""",
+    """CREATE TABLE video (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT,
+       url VARCHAR(500) NOT NULL, thumbnail VARCHAR(500), uploaded_by INTEGER NOT NULL
+       REFERENCES user(id), created_at DATETIME)""",
+]
+LISTING = text("SELECT video.*, user.email FROM video LEFT OUTER JOIN user ON user.id = video.uploaded_by")
+
+
+def make_engine(path, tuned):
+    engine = create_engine('sqlite:///' + path)
+    if tuned:
+        configure_sqlite_engine(engine)
+    return engine
+
+
+def seed(path, tuned, rows):
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, email, password_hash, is_admin) VALUES (1, 'admin@gmail.com', 'x', 1)"))
+        conn.execute(
+            text("INSERT INTO video (title, description, url, thumbnail, uploaded_by, created_at) "
+                 "VALUES (:title, '', :url, '', 1, CURRENT_TIMESTAMP)"),
+            [{'title': 'Video %d' % i, 'url': '/uploads/video_%d.mp4' % i} for i in range(rows)]
+        )
+    engine.dispose()
+
+
+def reader(path, tuned, deadline, results):
+    engine = make_engine(path, tuned)
+    reads = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(LISTING).fetchall()
+            reads += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    results.put(('read', reads, errors, latencies))
+
+
+def writer(path, tuned, deadline, results):
+    engine = make_engine(path, tuned)
+    writes = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                row = conn.execute(
+                    text("INSERT INTO video (title, description, url, thumbnail, uploaded_by, created_at) "
+                         "VALUES ('Admin upload', '', '/uploads/new.mp4', '', 1, CURRENT_TIMESTAMP) RETURNING id")
+                ).fetchone()
+                conn.execute(text("UPDATE video SET description = 'edited' WHERE id = :id"), {'id': row[0]})
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM video WHERE id = :id"), {'id': row[0]})
+            writes += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    results.put(('write', writes, errors, latencies))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(profile, readers, writers, seconds, rows):
+    tuned = profile == 'tuned'
+    directory = tempfile.mkdtemp(prefix='echoplay-sqlite-bench-')
+    path = os.path.join(directory, 'bench.db')
+    seed(path, tuned, rows)
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + seconds
+    processes = [multiprocessing.Process(target=reader, args=(path, tuned, deadline, results))
+                 for _ in range(readers)]
+    processes += [multiprocessing.Process(target=writer, args=(path, tuned, deadline, results))
+                  for _ in range(writers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    summary = {}
+    for kind in ('read', 'write'):
+        rows_for_kind = [r for r in collected if r[0] == kind]
+        latencies = [latency for r in rows_for_kind for latency in r[3]]
+        summary[kind] = {
+            'ops': sum(r[1] for r in rows_for_kind),
+            'errors': sum(r[2] for r in rows_for_kind),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=2000, help='Videos in the catalog')
+    args = parser.parse_args()
+
+    print("=== SQLITE CONCURRENCY BENCHMARK ===")
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:.0f}s, {args.rows} videos\n")
+    print(f"{'profile':<8} {'reads/s':>9} {'read p50':>9} {'read p99':>9} {'read err':>9} "
+          f"{'writes/s':>9} {'write p99':>10} {'write err':>10}")
+    for profile in ('default', 'tuned'):
+        s = run(profile, args.readers, args.writers, args.seconds, args.rows)
+        print(f"{profile:<8} {s['read']['ops'] / args.seconds:>9.1f} {s['read']['p50_ms']:>7.1f}ms "
+              f"{s['read']['p99_ms']:>7.1f}ms {s['read']['errors']:>9} "
+              f"{s['write']['ops'] / args.seconds:>9.1f} {s['write']['p99_ms']:>8.1f}ms {s['write']['errors']:>10}")
+
+
+if __name__ == '__main__':
+    main()
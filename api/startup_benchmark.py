@@ -0,0 +1,113 @@
+"""Startup cost of the API: import time and first-request latency.
+
+Every sample runs in a fresh interpreter, the way a gunicorn worker or a
+test run starts. Importing the app must not touch the database; the
+benchmark counts statements executed during import and exits non-zero if
+there are any.
+
+    python startup_benchmark.py --runs 10
+    python startup_benchmark.py --runs 10 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = r"""
+import json, sys, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+import_statements = list(statements)
+
+client = module.app.test_client()
+first_started = time.perf_counter()
+status = client.get('/api/health').status_code
+first = time.perf_counter() - first_started
+
+login_started = time.perf_counter()
+login_status = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).status_code
+login = time.perf_counter() - login_started
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': first * 1000,
+    'first_db_request_ms': login * 1000,
+    'status': status,
+    'login_status': login_status,
+    'import_statements': import_statements,
+}))
+"""
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def sample(env):
+    completed = subprocess.run([sys.executable, '-c', PROBE], cwd=API_DIR, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"❌ Probe failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='echoplay-startup-')
+    env = dict(os.environ, DATABASE_PATH='sqlite:///' + os.path.join(workdir, 'startup.db'),
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'))
+    env.pop('INIT_DB_ON_START', None)
+
+    print("=== STARTUP BENCHMARK ===")
+    try:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=API_DIR, env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+        samples = [sample(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {'runs': args.runs}
+    for key in ('import_ms', 'first_request_ms', 'first_db_request_ms'):
+        values = [s[key] for s in samples]
+        summary[key] = {'p50': percentile(values, 0.5), 'p90': percentile(values, 0.9), 'max': max(values)}
+        print(f"{key:<22} p50 {summary[key]['p50']:>8.1f}ms   p90 {summary[key]['p90']:>8.1f}ms"
+              f"   max {summary[key]['max']:>8.1f}ms")
+
+    statements = samples[0]['import_statements']
+    summary['import_statements'] = len(statements)
+    failed = bool(statements) or any(s['status'] != 200 or s['login_status'] != 200 for s in samples)
+    if statements:
+        print(f"\n❌ Importing the app ran {len(statements)} database statements:")
+        for statement in statements:
+            print(f"     {statement.strip()[:100]}")
+    else:
+        print("\n✅ Importing the app ran no database statements")
+    if any(s['status'] != 200 or s['login_status'] != 200 for s in samples):
+        print("❌ First requests failed")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
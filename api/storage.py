@@ -0,0 +1,241 @@
+"""Storage backends for uploaded media.
+
+``LocalStorage`` keeps files in a directory on disk (the original
+behaviour). ``S3Storage`` keeps them in an S3-compatible bucket (AWS S3,
+MinIO, R2, ...) so several nodes, or a host with an ephemeral disk, share
+the same media.
+
+Both expose the same small interface:
+
+- ``save(name, data)`` stores bytes or a binary file object
+- ``exists(name)`` / ``delete(name)``
+- ``local_path(name)`` is a context manager yielding a path on the local
+  filesystem, downloading to a temporary file first when needed
+- ``staging_directory(prefix)`` is a context manager yielding a local
+  directory whose contents are published under ``prefix`` on exit
+
+Backends are built from a plain settings dict by ``create_storage`` so the
+same settings can be handed to worker processes.
+"""
+import contextlib
+import io
+import mimetypes
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import safe_join
+
+
+class StorageError(Exception):
+    pass
+
+
+class LocalStorage:
+    is_local = True
+
+    def __init__(self, root):
+        if not root:
+            raise StorageError('The local storage backend needs a root directory')
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        # None when the name escapes the storage root
+        return safe_join(self.root, name)
+
+    def exists(self, name):
+        path = self.path(name)
+        return bool(path) and os.path.isfile(path)
+
+    def save(self, name, data, content_type=None):
+        path = self.path(name)
+        if not path:
+            raise StorageError('Invalid file name: %s' % name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and rename it into place, so readers
+        # never see a partial file and the inode changes on every write
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, 1024 * 1024)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+    def delete(self, name):
+        path = self.path(name)
+        if path:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+    @contextlib.contextmanager
+    def local_path(self, name):
+        if not self.exists(name):
+            raise StorageError('File not found: %s' % name)
+        yield self.path(name)
+
+    @contextlib.contextmanager
+    def staging_directory(self, prefix):
+        path = self.path(prefix)
+        if not path:
+            raise StorageError('Invalid directory name: %s' % prefix)
+        os.makedirs(path, exist_ok=True)
+        yield path
+
+
+class S3Storage:
+    is_local = False
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                 max_concurrency=8, presign_ttl=300):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError('The S3 storage backend requires boto3 (pip install boto3)')
+
+        if not bucket:
+            raise StorageError('S3_BUCKET must be set for the S3 storage backend')
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.presign_ttl = presign_ttl
+        self.max_concurrency = max_concurrency
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            # One pooled connection per concurrent part transfer
+            config=Config(max_pool_connections=max(10, max_concurrency * 2),
+                          retries={'max_attempts': 5, 'mode': 'adaptive'})
+        )
+        # Files above the threshold are split into parts that are uploaded
+        # (and downloaded as ranged GETs) in parallel
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+
+    def key(self, name):
+        name = name.lstrip('/')
+        if not name or '..' in name.split('/'):
+            raise StorageError('Invalid file name: %s' % name)
+        return self.prefix + name
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def save(self, name, data, content_type=None):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = io.BytesIO(data)
+        content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.client.upload_fileobj(data, self.bucket, self.key(name),
+                                   ExtraArgs={'ContentType': content_type},
+                                   Config=self.transfer_config)
+
+    def save_file(self, name, path):
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.client.upload_file(path, self.bucket, self.key(name),
+                                ExtraArgs={'ContentType': content_type},
+                                Config=self.transfer_config)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def read_range(self, name, range_header=None):
+        """GET an object, optionally with an HTTP Range header.
+
+        Returns the botocore response dict (``Body``, ``ContentLength``,
+        ``ContentRange``, ``ContentType``, ``ETag``, ``LastModified``).
+        """
+        kwargs = {'Bucket': self.bucket, 'Key': self.key(name)}
+        if range_header:
+            kwargs['Range'] = range_header
+        return self.client.get_object(**kwargs)
+
+    def presigned_url(self, name, expires_in=None):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self.key(name)},
+            ExpiresIn=expires_in or self.presign_ttl
+        )
+
+    @contextlib.contextmanager
+    def local_path(self, name):
+        suffix = os.path.splitext(name)[1]
+        fd, path = tempfile.mkstemp(prefix='echoplay-', suffix=suffix)
+        os.close(fd)
+        try:
+            # download_file fetches large objects as parallel ranged GETs
+            self.client.download_file(self.bucket, self.key(name), path, Config=self.transfer_config)
+            yield path
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+
+    @contextlib.contextmanager
+    def staging_directory(self, prefix):
+        path = tempfile.mkdtemp(prefix='echoplay-staging-')
+        try:
+            yield path
+            # Only published when the block completed without an error
+            self.upload_directory(path, prefix)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def upload_directory(self, path, prefix):
+        files = []
+        for directory, _, filenames in os.walk(path):
+            for filename in filenames:
+                local = os.path.join(directory, filename)
+                relative = os.path.relpath(local, path).replace(os.sep, '/')
+                files.append((prefix.strip('/') + '/' + relative, local))
+
+        # Many small files (HLS segments): parallelize across files, each
+        # upload still using multipart for anything above the threshold
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            list(executor.map(lambda item: self.save_file(*item), files))
+
+
+def create_storage(settings):
+    backend = settings.get('backend', 'local')
+    if backend == 'local':
+        return LocalStorage(settings['root'])
+    if backend == 's3':
+        return S3Storage(
+            bucket=settings.get('bucket'),
+            prefix=settings.get('prefix', ''),
+            endpoint_url=settings.get('endpoint_url'),
+            region=settings.get('region'),
+            access_key_id=settings.get('access_key_id'),
+            secret_access_key=settings.get('secret_access_key'),
+            multipart_threshold=settings.get('multipart_threshold', 8 * 1024 * 1024),
+            multipart_chunksize=settings.get('multipart_chunksize', 8 * 1024 * 1024),
+            max_concurrency=settings.get('max_concurrency', 8),
+            presign_ttl=settings.get('presign_ttl', 300)
+        )
+    raise StorageError('Unknown storage backend: %s' % backend)
@@ -0,0 +1,204 @@
+"""Deterministic synthetic users, videos and music for scale testing.
+
+``SyntheticData`` generates rows from a seeded random stream, so the same
+seed, counts and starting database always produce the same rows. The
+distributions are rough but shaped like real catalogs:
+
+- title lengths follow a log-normal word count (mostly 3-6 words, a long
+  tail up to the 200 character column limit), with the occasional
+  "(Live)" or "feat." suffix
+- uploads per user and plays per artist are Zipf-like: a few creators
+  upload most videos and a few artists have most tracks
+- upload dates grow denser towards the end of the range, like a growing
+  service, and increase with the id like real inserts
+- video durations are log-normal around four minutes, with a mix of
+  common resolutions
+
+Rows are written with Core ``INSERT`` executemany batches in one
+transaction per batch, bypassing the ORM, which builds a million rows in
+well under a minute on SQLite. Ids are assigned here so rows can
+reference each other; on PostgreSQL the id sequences are moved past them.
+
+Synthetic users all share one password (``PASSWORD``), hashed once.
+
+Optional sparse media files give rows real ``/uploads`` targets for range
+and streaming tests without using disk space: each file has the size a
+real encode would have but no data blocks.
+"""
+import bisect
+import datetime
+import itertools
+import math
+import os
+import random
+
+from sqlalchemy import func, select, text
+
+PASSWORD = 'synthetic-password'
+START = datetime.datetime(2019, 1, 1)
+END = datetime.datetime(2026, 1, 1)
+MEDIA_PREFIX = 'synthetic'
+
+WORDS = (
+    'love night summer dream fire heart city light road home rain blue gold wild river ocean sky star moon '
+    'dance run lost found broken golden electric midnight morning shadow echo silent loud sweet bitter young '
+    'forever never always tonight tomorrow yesterday together alone free falling rising burning frozen '
+    'highway paradise heaven thunder storm wave mountain desert garden window mirror secret story letter '
+    'memory season winter spring autumn sunset sunrise neon velvet crystal paper glass stone silver '
+    'session live acoustic remix cover tutorial vlog review trailer highlights behind scenes episode part '
+    'guitar piano drum bass voice choir orchestra street festival tour studio rehearsal backstage'
+).split()
+FIRST_NAMES = (
+    'Ana Bruno Carla Diego Elena Felipe Gabriela Hugo Isabel João Karina Lucas Mariana Nicolas Olivia Pedro '
+    'Rafaela Samuel Tatiana Vitor Amara Kenji Leila Marco Nadia Omar Priya Sofia Tomas Yara Zoe Liam Noah Emma'
+).split()
+LAST_NAMES = (
+    'Silva Santos Oliveira Souza Costa Pereira Almeida Ferreira Rodrigues Gomes Martins Araujo Ribeiro Carvalho '
+    'Lopes Moreira Nakamura Okafor Haddad Novak Schmidt Rossi Dubois Kowalski Andersen Moreau Tanaka Nguyen'
+).split()
+RESOLUTIONS = ((640, 360), (1280, 720), (1920, 1080), (3840, 2160))
+RESOLUTION_WEIGHTS = tuple(itertools.accumulate((0.15, 0.45, 0.35, 0.05)))
+# Bytes per second of a typical encode, for sparse file sizes
+VIDEO_BITRATE = 2_500_000 // 8
+AUDIO_BITRATE = 192_000 // 8
+
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative weights for ``random.choices`` over ``count`` ranked items."""
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+class SyntheticData:
+    def __init__(self, seed=1, artists=5000, start=START, end=END):
+        self.seed = seed
+        self.start = start
+        self.span = (end - start).total_seconds()
+        rng = random.Random(f'{seed}:artists')
+        self.artists = [self._artist(rng) for _ in range(artists)]
+        self.artist_weights = zipf_weights(artists)
+
+    def _rng(self, kind):
+        # One stream per table, so adding users does not change the videos
+        return random.Random(f'{self.seed}:{kind}')
+
+    def _date(self, rng, position):
+        # position in [0, 1): density grows linearly towards the end
+        return self.start + datetime.timedelta(seconds=self.span * math.sqrt(position) + rng.random() * 60)
+
+    def _title(self, rng, extra=None):
+        words = min(max(int(rng.lognormvariate(1.4, 0.45)), 1), 30)
+        title = ' '.join(rng.choices(WORDS, k=words)).capitalize()
+        roll = rng.random()
+        if roll < 0.08:
+            title += ' (Live)'
+        elif roll < 0.12 and extra:
+            title += f' (feat. {extra})'
+        return title[:200]
+
+    def _artist(self, rng):
+        if rng.random() < 0.3:
+            return f'The {rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}s'
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    def users(self, first_id, count, password_hash):
+        rng = self._rng('users')
+        for i in range(count):
+            user_id = first_id + i
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            yield {
+                'id': user_id,
+                'email': f'{first.lower()}.{last.lower()}.{user_id}@synthetic.echoplay.test',
+                'password_hash': password_hash,
+                'name': f'{first} {last}',
+                'profile_image': None,
+                'created_at': self._date(rng, i / count),
+                'is_admin': False,
+            }
+
+    def videos(self, first_id, count, uploaders):
+        rng = self._rng('videos')
+        weights = zipf_weights(len(uploaders))
+        for i in range(count):
+            video_id = first_id + i
+            width, height = rng.choices(RESOLUTIONS, cum_weights=RESOLUTION_WEIGHTS)[0]
+            description = '' if rng.random() < 0.4 else ' '.join(
+                rng.choices(WORDS, k=rng.randint(5, 60))).capitalize() + '.'
+            yield {
+                'id': video_id,
+                'title': self._title(rng),
+                'description': description,
+                'url': f'/uploads/{MEDIA_PREFIX}/video_{video_id}.mp4',
+                'thumbnail': f'/uploads/{MEDIA_PREFIX}/thumb_{video_id}.jpg',
+                'uploaded_by': uploaders[bisect.bisect(weights, rng.random() * weights[-1])],
+                'created_at': self._date(rng, i / count),
+                'duration': round(min(rng.lognormvariate(5.5, 0.8), 4 * 3600), 2),
+                'width': width,
+                'height': height,
+            }
+
+    def music(self, first_id, count, uploaders):
+        rng = self._rng('music')
+        weights = zipf_weights(len(uploaders))
+        for i in range(count):
+            music_id = first_id + i
+            artist = self.artists[bisect.bisect(self.artist_weights, rng.random() * self.artist_weights[-1])]
+            yield {
+                'id': music_id,
+                'title': self._title(rng, extra=rng.choice(self.artists)),
+                'artist': artist,
+                'url': f'/uploads/{MEDIA_PREFIX}/track_{music_id}.mp3',
+                'uploaded_by': uploaders[bisect.bisect(weights, rng.random() * weights[-1])],
+                'created_at': self._date(rng, i / count),
+            }
+
+
+def next_id(conn, table):
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def uploader_ids(conn, users, count):
+    """Ids of the ``count`` newest users, the most active uploader first."""
+    return list(conn.execute(select(users.c.id).order_by(users.c.id.desc()).limit(count)).scalars())
+
+
+def bulk_insert(engine, table, rows, batch_size=20000, progress=None):
+    """Insert ``rows`` in executemany batches of one transaction each; return the count."""
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        inserted += len(batch)
+        if progress:
+            progress(inserted)
+    if inserted and engine.dialect.name == 'postgresql':
+        # Explicit ids leave the serial sequence behind
+        with engine.begin() as conn:
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                              f"(SELECT max(id) FROM \"{table.name}\"))"))
+    return inserted
+
+
+def create_sparse_files(root, urls_and_sizes):
+    """Create files of the given sizes without data blocks; return the count."""
+    created = 0
+    for url, size in urls_and_sizes:
+        path = os.path.join(root, url.split('/uploads/', 1)[1])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        created += 1
+    return created
+
+
+def media_files(rows, kind):
+    """``(url, size)`` pairs for the media of generated rows."""
+    for row in rows:
+        if kind == 'videos':
+            yield row['url'], int(row['duration'] * VIDEO_BITRATE)
+            yield row['thumbnail'], 64 * 1024
+        else:
+            yield row['url'], random.Random(row['id']).randint(120, 420) * AUDIO_BITRATE
@@ -16,6 +16,31 @@ except sqlite3.OperationalError as e:
     else:
         print(f"Error adding is_admin column: {e}")
 
+# Columns added after the initial schema
+new_columns = [
+    ("music", "bpm", "FLOAT"),
+    ("music", "beat_grid", "TEXT"),
+    ("music", "analyzed_at", "DATETIME"),
+    ("video", "duration", "FLOAT"),
+    ("video", "width", "INTEGER"),
+    ("video", "height", "INTEGER"),
+    ("video", "hls_url", "VARCHAR(500)"),
+    ("video", "processing_status", "VARCHAR(20)"),
+    ("video", "processing_progress", "INTEGER"),
+    ("video", "processing_error", "TEXT"),
+    ("video", "processing_updated_at", "DATETIME"),
+]
+
+for table, column, column_type in new_columns:
+    try:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        print(f"Added {column} column to {table} table")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e):
+            print(f"{column} column already exists")
+        else:
+            print(f"Error adding {column} column: {e}")
+
 # Commit changes and close connection
 conn.commit()
 
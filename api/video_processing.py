@@ -0,0 +1,182 @@
+"""Optional ffmpeg stage for uploaded videos: probing and HLS packaging.
+
+Each job probes the source with ffprobe (duration, resolution, audio
+presence), then runs a single ffmpeg process that scales the input into
+several renditions and writes fixed-length HLS segments plus a master
+playlist. Jobs run on a small bounded thread pool; the threads only wait
+on the ffmpeg subprocess, so they do not compete for the GIL.
+
+Sources are read and packages published through a storage backend (see
+storage.py). Progress and results are reported through an
+``update(video_id, **fields)`` callback so this module stays independent of
+the Flask models.
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# (name, height, video bitrate, audio bitrate)
+RENDITIONS = [
+    ('360p', 360, '800k', '96k'),
+    ('720p', 720, '2800k', '128k'),
+    ('1080p', 1080, '5000k', '192k'),
+]
+SEGMENT_SECONDS = 6
+
+
+class VideoProcessingError(Exception):
+    pass
+
+
+def ffmpeg_available():
+    return bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+
+
+def probe(path):
+    """Return duration (seconds), width, height and whether there is audio."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-print_format', 'json',
+         '-show_format', '-show_streams', path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+    )
+    if result.returncode != 0:
+        raise VideoProcessingError(result.stderr.decode('utf-8', 'replace').strip() or 'ffprobe failed')
+
+    info = json.loads(result.stdout or b'{}')
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if not video:
+        raise VideoProcessingError('No video stream found')
+
+    duration = info.get('format', {}).get('duration') or video.get('duration')
+    return {
+        'duration': float(duration) if duration else None,
+        'width': int(video.get('width') or 0),
+        'height': int(video.get('height') or 0),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in streams)
+    }
+
+
+def select_renditions(source_height, renditions=RENDITIONS):
+    # Never upscale; a source below the smallest rendition gets a single
+    # rendition at its own (even, for yuv420p) height
+    selected = [r for r in renditions if r[1] <= source_height]
+    if selected or source_height < 2:
+        return selected or renditions[:1]
+    name, height, video_bitrate, audio_bitrate = renditions[0]
+    height = source_height // 2 * 2
+    return [('%dp' % height, height, video_bitrate, audio_bitrate)]
+
+
+def package_hls(path, output_dir, probe_info, renditions=RENDITIONS,
+                segment_seconds=SEGMENT_SECONDS, on_progress=None):
+    """Package ``path`` into HLS renditions under ``output_dir``.
+
+    Returns the master playlist path. ``on_progress`` receives a float in
+    [0, 1] as ffmpeg reports its output position.
+    """
+    selected = select_renditions(probe_info['height'], renditions)
+    has_audio = probe_info['has_audio']
+    os.makedirs(output_dir, exist_ok=True)
+
+    split = '[0:v]split=%d%s' % (len(selected), ''.join('[v%d]' % i for i in range(len(selected))))
+    scales = ['[v%d]scale=-2:%d[v%dout]' % (i, r[1], i) for i, r in enumerate(selected)]
+
+    args = ['ffmpeg', '-v', 'error', '-nostdin', '-y', '-i', path,
+            '-filter_complex', ';'.join([split] + scales)]
+    stream_map = []
+    for i, (name, height, video_bitrate, audio_bitrate) in enumerate(selected):
+        args += ['-map', '[v%dout]' % i,
+                 '-c:v:%d' % i, 'libx264', '-b:v:%d' % i, video_bitrate,
+                 '-maxrate:v:%d' % i, video_bitrate, '-bufsize:v:%d' % i, video_bitrate,
+                 # Keyframes on segment boundaries so every segment is seekable
+                 '-force_key_frames:v:%d' % i, 'expr:gte(t,n_forced*%d)' % segment_seconds]
+        if has_audio:
+            args += ['-map', '0:a:0', '-c:a:%d' % i, 'aac', '-b:a:%d' % i, audio_bitrate]
+            stream_map.append('v:%d,a:%d,name:%s' % (i, i, name))
+        else:
+            stream_map.append('v:%d,name:%s' % (i, name))
+
+    args += ['-preset', 'veryfast',
+             '-f', 'hls', '-hls_time', str(segment_seconds),
+             '-hls_playlist_type', 'vod',
+             '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%04d.ts'),
+             '-master_pl_name', 'master.m3u8',
+             '-var_stream_map', ' '.join(stream_map),
+             '-progress', 'pipe:1', '-nostats',
+             os.path.join(output_dir, '%v', 'index.m3u8')]
+
+    # stderr goes to a file: a second pipe would fill up with warnings while
+    # stdout is being read and deadlock both processes
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=errors)
+        duration = probe_info.get('duration')
+        for line in process.stdout:
+            # -progress emits key=value lines; out_time_us is the output position
+            key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+            if key == 'out_time_us' and duration and on_progress and value.isdigit():
+                on_progress(min(1.0, int(value) / 1e6 / duration))
+        if process.wait() != 0:
+            errors.seek(0)
+            # The last lines hold the actual failure
+            stderr = errors.read()[-4000:]
+            raise VideoProcessingError(stderr.decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+
+    return os.path.join(output_dir, 'master.m3u8')
+
+
+class VideoProcessor:
+    """Bounded pool of ffmpeg jobs.
+
+    At most ``workers`` jobs run at once and at most ``max_pending`` wait
+    behind them; ``submit`` returns False when the queue is full so the
+    caller can leave the video pending for the next backfill run.
+    """
+
+    def __init__(self, update, storage, workers=1, max_pending=8, renditions=RENDITIONS,
+                 segment_seconds=SEGMENT_SECONDS):
+        self.update = update
+        self.storage = storage
+        self.renditions = renditions
+        self.segment_seconds = segment_seconds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video-processing')
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def submit(self, video_id, source_name, output_prefix, output_url, block=False):
+        if not self.slots.acquire(blocking=block):
+            return False
+        future = self.executor.submit(self.process, video_id, source_name, output_prefix, output_url)
+        future.add_done_callback(lambda _: self.slots.release())
+        return True
+
+    def process(self, video_id, source_name, output_prefix, output_url):
+        try:
+            self.update(video_id, processing_status='probing', processing_progress=0)
+            with self.storage.local_path(source_name) as source_path:
+                info = probe(source_path)
+                self.update(video_id, processing_status='packaging', duration=info['duration'],
+                            width=info['width'], height=info['height'])
+
+                reported = [0]
+
+                def on_progress(fraction):
+                    # Only write to the DB on whole 5% steps
+                    percent = int(fraction * 100) // 5 * 5
+                    if percent > reported[0]:
+                        reported[0] = percent
+                        self.update(video_id, processing_progress=percent)
+
+                with self.storage.staging_directory(output_prefix) as output_dir:
+                    package_hls(source_path, output_dir, info, self.renditions,
+                                self.segment_seconds, on_progress)
+            self.update(video_id, processing_status='ready', processing_progress=100,
+                        hls_url=output_url, processing_error=None)
+        except Exception as e:
+            self.update(video_id, processing_status='failed', processing_error=str(e)[:500])
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
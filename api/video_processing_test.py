@@ -0,0 +1,148 @@
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+workdir = tempfile.mkdtemp(prefix='echoplay-videoprocessing-')
+os.environ['DATABASE_PATH'] = 'sqlite:///' + os.path.join(workdir, 'videoprocessing.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+os.environ['RATE_LIMIT_STORE'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['IDEMPOTENCY_STORE'] = os.path.join(workdir, 'idempotency.db')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+import video_processing  # type: ignore
+from app import create_app  # type: ignore
+from storage import LocalStorage  # type: ignore
+from video_processing import RENDITIONS, VideoProcessor, select_renditions  # type: ignore
+
+print("=== VIDEO PROCESSING TEST ===")
+
+# ffprobe and ffmpeg are replaced with canned output, so no binaries are needed
+PROBE_OUTPUT = json.dumps({
+    'format': {'duration': '10.0'},
+    'streams': [{'codec_type': 'video', 'width': 1280, 'height': 720}, {'codec_type': 'audio'}],
+}).encode()
+
+
+def probe_ok(args, **kwargs):
+    return subprocess.CompletedProcess(args, 0, stdout=PROBE_OUTPUT, stderr=b'')
+
+
+def probe_failed(args, **kwargs):
+    return subprocess.CompletedProcess(args, 1, stdout=b'', stderr=b'moov atom not found')
+
+
+class FakeFfmpeg:
+    """Reports its output position every 100ms of a 10s source, then exits."""
+
+    def __init__(self, args, stdout=None, stderr=None):
+        self.args = args
+        self.stdout = iter([b'frame=1\n'] + [b'out_time_us=%d\n' % (ms * 1000) for ms in range(0, 10001, 100)]
+                           + [b'progress=end\n'])
+
+    def wait(self):
+        return 0
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, video_id, **fields):
+        with self.lock:
+            self.calls.append((video_id, fields))
+
+
+storage = LocalStorage(os.path.join(workdir, 'storage'))
+storage.save('source.mp4', b'not really a video')
+
+# Test 1: Renditions never exceed the source height
+print("\n1. Testing rendition selection...")
+heights = {source: [r[1] for r in select_renditions(source)] for source in (240, 361, 720, 1079, 2160)}
+upscaled = {source: selected for source, selected in heights.items() if max(selected) > source}
+if not upscaled and heights[240] == [240] and heights[720] == [360, 720] and heights[2160] == [r[1] for r in RENDITIONS]:
+    print(f"   ✅ {heights}")
+else:
+    print(f"   ❌ {heights}")
+
+# Test 2: Progress reaches the database in 5% steps
+print("\n2. Testing progress reporting...")
+update = Recorder()
+processor = VideoProcessor(update, storage)
+with mock.patch.object(video_processing.subprocess, 'run', probe_ok), \
+        mock.patch.object(video_processing.subprocess, 'Popen', FakeFfmpeg):
+    processor.process(1, 'source.mp4', 'hls/1', '/uploads/hls/1/master.m3u8')
+progress = [fields['processing_progress'] for _, fields in update.calls if set(fields) == {'processing_progress'}]
+final = update.calls[-1][1]
+if progress == list(range(5, 101, 5)) and final['processing_status'] == 'ready' and final['hls_url']:
+    print(f"   ✅ {len(progress)} progress writes for 101 ffmpeg reports, then {final['processing_status']}")
+else:
+    print(f"   ❌ Progress {progress}, last update {final}")
+
+# Test 3: A probe failure marks the video failed
+print("\n3. Testing a failed probe...")
+update = Recorder()
+processor = VideoProcessor(update, storage)
+with mock.patch.object(video_processing.subprocess, 'run', probe_failed), \
+        mock.patch.object(video_processing.subprocess, 'Popen') as popen:
+    processor.process(2, 'source.mp4', 'hls/2', '/uploads/hls/2/master.m3u8')
+final = update.calls[-1][1]
+if final['processing_status'] == 'failed' and 'moov atom' in final['processing_error'] and not popen.called:
+    print(f"   ✅ failed: {final['processing_error']}")
+else:
+    print(f"   ❌ {update.calls}")
+
+# Test 4: The bounded pool refuses work once running and pending slots are taken
+print("\n4. Testing the bounded pool...")
+release = threading.Event()
+started = []
+processor = VideoProcessor(Recorder(), storage, workers=1, max_pending=1)
+with mock.patch.object(processor, 'process', lambda video_id, *args: (started.append(video_id), release.wait())):
+    accepted = [processor.submit(video_id, 'source.mp4', 'hls', '/uploads/hls') for video_id in (1, 2, 3)]
+    release.set()
+    processor.shutdown(wait=True)
+if accepted == [True, True, False] and started == [1, 2]:
+    print(f"   ✅ Accepted {accepted}; the third video is left for the next run")
+else:
+    print(f"   ❌ Accepted {accepted}, started {started}")
+
+# Test 5: process-videos re-queues rows a stopped worker left in progress
+print("\n5. Testing stale rows...")
+app = create_app()
+app.extensions['init_database']()
+client = app.test_client()
+token = client.post('/api/login', json={'email': 'admin@gmail.com', 'password': 'Luc14c4$tr0'}).json['token']
+app.extensions['storage'].save('clip.mp4', b'not really a video')
+ids = [client.post('/api/videos', json={'title': title, 'url': '/uploads/clip.mp4'},
+                   headers={'x-access-token': token}).json['video']['id'] for title in ('Stale', 'Live')]
+db = app.extensions['sqlalchemy']
+video_table = db.metadata.tables['video']
+with app.app_context():
+    now = datetime.datetime.utcnow()
+    for video_id, age in zip(ids, (datetime.timedelta(hours=2), datetime.timedelta(minutes=1))):
+        db.session.execute(video_table.update().where(video_table.c.id == video_id).values(
+            processing_status='packaging', processing_progress=40, processing_updated_at=now - age))
+    db.session.commit()
+with mock.patch.object(video_processing, 'ffmpeg_available', lambda: True), \
+        mock.patch.object(video_processing.subprocess, 'run', probe_ok), \
+        mock.patch.object(video_processing.subprocess, 'Popen', FakeFfmpeg):
+    result = app.test_cli_runner().invoke(args=['process-videos', '--stale-minutes', '30'])
+with app.app_context():
+    statuses = [db.session.execute(db.select(video_table.c.processing_status).where(
+        video_table.c.id == video_id)).scalar() for video_id in ids]
+if statuses == ['ready', 'packaging'] and 'Processing 1 videos' in result.output:
+    print(f"   ✅ The stale row was packaged again, the live one left alone: {statuses}")
+else:
+    print(f"   ❌ {statuses}: {result.output} {result.exception}")
+
+shutil.rmtree(workdir, ignore_errors=True)
+print("\n=== TEST COMPLETED ===")
@@ -53,12 +53,12 @@ def check_render_config():
     if os.path.exists(procfile_path):
         with open(procfile_path, 'r') as f:
             content = f.read().strip()
-            if content == 'web: gunicorn app:app -b 0.0.0.0:$PORT --workers 2':
+            if content == 'web: flask --app app init-db && gunicorn -c gunicorn.conf.py app:app':
                 print("✓ Procfile is correctly configured")
             else:
                 print("✗ Procfile has incorrect configuration")
                 print(f"  Current: {content}")
-                print("  Expected: web: gunicorn app:app -b 0.0.0.0:$PORT --workers 2")
+                print("  Expected: web: flask --app app init-db && gunicorn -c gunicorn.conf.py app:app")
     else:
         print("✗ Procfile not found")
     
@@ -67,6 +67,10 @@ const removeToken = async () => {
   }
 };
 
+// Read-your-writes window handed out by the API after a write; sent back so
+// the following reads are served by the primary database, not a replica
+let primaryUntil: string | null = null;
+
 // Generic API request function with better error handling
 const apiRequest = async (endpoint: string, options: RequestInit = {}) => {
   const url = `${API_BASE_URL}${endpoint}`;
@@ -76,6 +80,7 @@ const apiRequest = async (endpoint: string, options: RequestInit = {}) => {
   const headers = {
     'Content-Type': 'application/json',
     ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+    ...(primaryUntil ? { 'X-Primary-Until': primaryUntil } : {}),
     ...((options.headers as Record<string, string>) || {})
   };
   
@@ -89,6 +94,7 @@ const apiRequest = async (endpoint: string, options: RequestInit = {}) => {
   
   try {
     const response = await fetch(url, config);
+    primaryUntil = response.headers.get('X-Primary-Until') || primaryUntil;
     
     // Handle network errors
     if (!response.ok) {